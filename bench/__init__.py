@@ -0,0 +1 @@
+"""Benchmarks: Gemini de mentira (gemini_falso), prueba de carga HTTP (carga) y micro-benchmarks (micro)."""
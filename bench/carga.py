@@ -0,0 +1,307 @@
+"""Prueba de carga HTTP de la app contra el Gemini de mentira: throughput y p50/p95/p99 por endpoint.
+
+Uso:  python -m bench.carga --duracion 30 --concurrencia 20 --latencia 0.4 --tasa-429 0.05
+      python -m bench.carga --url http://127.0.0.1:8000      (contra una app ya levantada)
+
+Sin --url levanta bench.gemini_falso y `uvicorn main:app` en puertos libres, con bases SQLite
+temporales, y reparte los pedidos entre /chat, /chat/stream y /properties según --mezcla. Los
+mensajes salen de las búsquedas de data/*.json y, con --mensajes, de un JSONL propio (campos
+"message", "mensaje" o "text" por línea, p. ej. un volcado de /logs).
+"""
+import os
+import sys
+import json
+import glob
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PLANTILLAS = [
+    "Busco {tipo} en {operacion} en {barrio}",
+    "hay {tipo}s en {barrio}?",
+    "quiero {operacion} un {tipo} en {barrio} hasta ${precio}",
+    "{tipo} de {ambientes} ambientes en {barrio}",
+    "tienen algo en {barrio} con balcón?",
+]
+GENERALES = [
+    "Hola, qué propiedades tienen?",
+    "cuáles son los horarios de atención?",
+    "me pasás más info de la primera?",
+]
+OPERACION_VERBO = {"alquiler": "alquilar", "venta": "comprar"}
+
+
+# --- Estadísticas ---
+
+def percentil(ordenados: List[float], p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not ordenados:
+        return 0.0
+    indice = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+
+def resumen(latencias: List[float]) -> Dict[str, float]:
+    """n, p50/p95/p99 y máximo en milisegundos."""
+    ordenadas = sorted(latencias)
+    return {
+        "n": len(ordenadas),
+        "p50_ms": round(percentil(ordenadas, 50) * 1000, 2),
+        "p95_ms": round(percentil(ordenadas, 95) * 1000, 2),
+        "p99_ms": round(percentil(ordenadas, 99) * 1000, 2),
+        "max_ms": round(ordenadas[-1] * 1000, 2) if ordenadas else 0.0,
+    }
+
+
+# --- Mezcla de pedidos ---
+
+def busquedas_de_ejemplo() -> List[Dict[str, Any]]:
+    """Filtros de data/*.json (las búsquedas de ejemplo de cada canal)."""
+    busquedas = []
+    for path in sorted(glob.glob(os.path.join(RAIZ, "data", "*.json"))):
+        try:
+            with open(path, encoding="utf-8-sig") as f:
+                busquedas += [b for b in json.load(f) if isinstance(b, dict)]
+        except (OSError, ValueError) as e:
+            print(f"⚠️ No se pudo leer {path}: {e}")
+    return busquedas or [{"neighborhood": "Palermo", "tipo": "departamento", "operacion": "alquiler"}]
+
+
+def mensajes_de_ejemplo(busquedas: List[Dict[str, Any]], extra: Optional[str] = None) -> List[str]:
+    mensajes = list(GENERALES)
+    for b in busquedas:
+        valores = {
+            "barrio": b.get("neighborhood", "Palermo"),
+            "tipo": b.get("tipo", "departamento"),
+            "operacion": OPERACION_VERBO.get(b.get("operacion"), b.get("operacion", "alquiler")),
+            "precio": "300.000",
+            "ambientes": 3,
+        }
+        mensajes += [p.format(**valores) for p in PLANTILLAS]
+    if extra:
+        with open(extra, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    continue
+                texto = next((registro.get(c) for c in ("message", "mensaje", "text") if registro.get(c)), None)
+                if isinstance(texto, str):
+                    mensajes.append(texto[:1000])
+    return mensajes
+
+
+def parse_mezcla(texto: str) -> Dict[str, float]:
+    """"chat=6,stream=2,properties=2" -> pesos por tipo de pedido."""
+    pesos = {}
+    for parte in texto.split(","):
+        nombre, _, peso = parte.partition("=")
+        pesos[nombre.strip()] = float(peso or 1)
+    desconocidos = set(pesos) - {"chat", "stream", "properties"}
+    if desconocidos:
+        raise ValueError(f"tipos de pedido desconocidos en --mezcla: {', '.join(sorted(desconocidos))}")
+    return pesos
+
+
+# --- Generador de carga ---
+
+class Registro:
+    """Latencias y errores por endpoint."""
+
+    def __init__(self):
+        self.latencias: Dict[str, List[float]] = defaultdict(list)
+        self.errores: Dict[str, Counter] = defaultdict(Counter)
+
+    def anotar(self, endpoint: str, segundos: float, error: Optional[str] = None):
+        if error is None:
+            self.latencias[endpoint].append(segundos)
+        else:
+            self.errores[endpoint][error] += 1
+
+
+async def _pedido(client: httpx.AsyncClient, tipo: str, rng: random.Random, mensajes, busquedas, registro: Registro):
+    canal = rng.choice(("web", "web", "whatsapp"))
+    inicio = time.perf_counter()
+    try:
+        if tipo == "chat":
+            response = await client.post("/chat", json={"message": rng.choice(mensajes), "channel": canal})
+            error = None if response.status_code == 200 else str(response.status_code)
+            registro.anotar("/chat", time.perf_counter() - inicio, error)
+        elif tipo == "stream":
+            primer_texto = None
+            async with client.stream("POST", "/chat/stream", json={"message": rng.choice(mensajes), "channel": canal}) as response:
+                error = None if response.status_code == 200 else str(response.status_code)
+                async for linea in response.aiter_lines():
+                    if primer_texto is None and linea.startswith("event: token"):
+                        primer_texto = time.perf_counter() - inicio
+                    elif linea.startswith("event: error"):
+                        error = "sse_error"
+            registro.anotar("/chat/stream", time.perf_counter() - inicio, error)
+            if primer_texto is not None:
+                registro.anotar("/chat/stream (1er texto)", primer_texto)
+        else:
+            busqueda = rng.choice(busquedas)
+            params = {k: v for k, v in busqueda.items() if rng.random() < 0.7}
+            response = await client.get("/properties", params=params)
+            error = None if response.status_code == 200 else str(response.status_code)
+            registro.anotar("/properties", time.perf_counter() - inicio, error)
+    except httpx.HTTPError as e:
+        endpoint = {"chat": "/chat", "stream": "/chat/stream"}.get(tipo, "/properties")
+        registro.anotar(endpoint, time.perf_counter() - inicio, type(e).__name__)
+
+
+async def conducir(url: str, duracion: float, concurrencia: int, mezcla: Dict[str, float],
+                   mensajes: List[str], busquedas: List[Dict[str, Any]], semilla: int = 0) -> Registro:
+    """`concurrencia` usuarios virtuales mandando pedidos uno detrás de otro durante `duracion` segundos."""
+    registro = Registro()
+    tipos, pesos = list(mezcla), list(mezcla.values())
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limites) as client:
+        fin = time.perf_counter() + duracion
+
+        async def usuario(n: int):
+            rng = random.Random(semilla * 1000 + n)
+            while time.perf_counter() < fin:
+                await _pedido(client, rng.choices(tipos, pesos)[0], rng, mensajes, busquedas, registro)
+
+        await asyncio.gather(*(usuario(n) for n in range(concurrencia)))
+    return registro
+
+
+def imprimir(registro: Registro, segundos: float) -> Dict[str, Any]:
+    filas = {}
+    print(f"\n{'endpoint':<26}{'ok':>7}{'err':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for endpoint in sorted(set(registro.latencias) | set(registro.errores)):
+        r = resumen(registro.latencias[endpoint])
+        errores = sum(registro.errores[endpoint].values())
+        r.update(errores=dict(registro.errores[endpoint]), rps=round(r["n"] / segundos, 2))
+        filas[endpoint] = r
+        print(f"{endpoint:<26}{r['n']:>7}{errores:>6}{r['rps']:>9}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+        if errores:
+            print(f"{'':<26}errores: {dict(registro.errores[endpoint])}")
+    return filas
+
+
+# --- Procesos ---
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _levantar(comando: List[str], env: Dict[str, str], url_salud: str, log_path: str, timeout: float = 60) -> subprocess.Popen:
+    log = open(log_path, "w")
+    proceso = subprocess.Popen(comando, cwd=RAIZ, env=env, stdout=log, stderr=subprocess.STDOUT)
+    limite = time.time() + timeout
+    while time.time() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"{' '.join(comando)} terminó al arrancar (ver {log_path})")
+        try:
+            if httpx.get(url_salud, timeout=1).status_code < 500:
+                return proceso
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError(f"{' '.join(comando)} no respondió en {timeout:.0f}s (ver {log_path})")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga de /chat, /chat/stream y /properties")
+    parser.add_argument("--url", help="app ya levantada (si no, se levanta una con el Gemini de mentira)")
+    parser.add_argument("--duracion", type=float, default=20, help="segundos de medición (default 20)")
+    parser.add_argument("--calentamiento", type=float, default=2, help="segundos de carga previa que no se miden")
+    parser.add_argument("--concurrencia", type=int, default=10, help="usuarios virtuales simultáneos")
+    parser.add_argument("--mezcla", default="chat=6,stream=2,properties=2", help="pesos por tipo de pedido")
+    parser.add_argument("--mensajes", help="JSONL con mensajes reales para sumar a la mezcla")
+    parser.add_argument("--workers", type=int, default=1, help="workers de uvicorn de la app")
+    parser.add_argument("--claves", type=int, default=3, help="cantidad de claves Gemini de mentira")
+    parser.add_argument("--latencia", type=float, default=0.4, help="latencia del Gemini de mentira (s)")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--tasa-403", type=float, default=0.0)
+    parser.add_argument("--sin-cache", action="store_true", help="desactiva los caches de respuestas y búsquedas")
+    parser.add_argument("--json", help="guarda el resultado en este archivo (para comparar entre versiones)")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    mezcla = parse_mezcla(args.mezcla)
+    busquedas = busquedas_de_ejemplo()
+    mensajes = mensajes_de_ejemplo(busquedas, args.mensajes)
+
+    procesos: List[subprocess.Popen] = []
+    tmp = tempfile.mkdtemp(prefix="bench_")
+    url, url_gemini = args.url, None
+    try:
+        if url is None:
+            puerto_gemini, puerto_app = _puerto_libre(), _puerto_libre()
+            url_gemini = f"http://127.0.0.1:{puerto_gemini}"
+            procesos.append(_levantar(
+                [sys.executable, "-m", "bench.gemini_falso", "--puerto", str(puerto_gemini),
+                 "--latencia", str(args.latencia), "--jitter", str(args.jitter),
+                 "--tasa-429", str(args.tasa_429), "--tasa-403", str(args.tasa_403), "--semilla", str(args.semilla)],
+                dict(os.environ), f"{url_gemini}/stats", os.path.join(tmp, "gemini_falso.log"),
+            ))
+            env = dict(
+                os.environ,
+                GEMINI_BASE_URL=f"{url_gemini}/v1beta/models",
+                GEMINI_API_KEYS=",".join(f"bench-clave-{i}" for i in range(args.claves)),
+                PROPERTIES_DB_PATH=os.path.join(tmp, "propiedades.db"),
+                LOGS_DB_PATH=os.path.join(tmp, "conversaciones.db"),
+                SHARED_STATE_PATH=os.path.join(tmp, "estado.db"),
+                WEB_CONCURRENCY=str(args.workers),
+            )
+            if args.sin_cache:
+                env.update(RESPONSE_CACHE_TTL="0", QUERY_CACHE_TTL="0", QUERY_CACHE_NEGATIVE_TTL="0")
+            url = f"http://127.0.0.1:{puerto_app}"
+            procesos.append(_levantar(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(puerto_app),
+                 "--workers", str(args.workers), "--log-level", "warning"],
+                env, f"{url}/", os.path.join(tmp, "app.log"),
+            ))
+            print(f"🚀 App en {url}, Gemini de mentira en {url_gemini} (logs en {tmp})")
+
+        if args.calentamiento > 0:
+            asyncio.run(conducir(url, args.calentamiento, args.concurrencia, mezcla, mensajes, busquedas, args.semilla + 1))
+
+        print(f"⏱️ {args.duracion:.0f}s con {args.concurrencia} usuarios, mezcla {args.mezcla}")
+        inicio = time.perf_counter()
+        registro = asyncio.run(conducir(url, args.duracion, args.concurrencia, mezcla, mensajes, busquedas, args.semilla))
+        filas = imprimir(registro, time.perf_counter() - inicio)
+
+        resultado: Dict[str, Any] = {"parametros": vars(args), "endpoints": filas}
+        if url_gemini:
+            resultado["gemini_falso"] = httpx.get(f"{url_gemini}/stats").json()
+            print(f"\n🤖 Gemini de mentira: {resultado['gemini_falso']}")
+        try:
+            resultado["metrics"] = httpx.get(f"{url}/metrics", timeout=10).json()
+        except (httpx.HTTPError, ValueError):
+            pass
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(resultado, f, ensure_ascii=False, indent=2, default=str)
+            print(f"💾 Resultado guardado en {args.json}")
+        return 0
+    finally:
+        for proceso in reversed(procesos):
+            proceso.terminate()
+            try:
+                proceso.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
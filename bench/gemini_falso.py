@@ -0,0 +1,146 @@
+"""Gemini de mentira para benchmarks: generateContent, streamGenerateContent y metadatos del modelo, con latencia y errores configurables.
+
+Uso:  python -m bench.gemini_falso --puerto 8765 --latencia 0.4 --jitter 0.2 --tasa-429 0.05
+
+La app se apunta a este servidor con GEMINI_BASE_URL=http://127.0.0.1:8765/v1beta/models.
+Las claves listadas en --claves-403 siempre reciben 403 (clave inválida: el planificador la da
+de baja); --tasa-403 aplica un 403 al azar a cualquier clave.
+"""
+import json
+import random
+import asyncio
+import argparse
+from collections import Counter
+from typing import Any, Dict, Optional, Sequence
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PALABRAS = (
+    "Hola gracias por tu consulta en Dante Propiedades tenemos opciones que se ajustan a lo que buscás "
+    "con buena luz cerca del transporte y a un precio razonable escribinos por WhatsApp para coordinar una visita"
+).split()
+
+
+class Comportamiento:
+    """Cómo responde el servidor y qué respondió hasta ahora."""
+
+    def __init__(self, latencia: float = 0.4, jitter: float = 0.2, tasa_429: float = 0.0, tasa_403: float = 0.0,
+                 claves_403: Sequence[str] = (), retry_delay: float = 2.0, palabras: int = 80, semilla: Optional[int] = None):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.tasa_429 = tasa_429
+        self.tasa_403 = tasa_403
+        self.claves_403 = set(claves_403)
+        self.retry_delay = retry_delay
+        self.palabras = palabras
+        self.rng = random.Random(semilla)
+        self.contadores: Counter = Counter()
+
+    def demora(self) -> float:
+        return max(0.0, self.latencia + self.rng.uniform(-self.jitter, self.jitter))
+
+    def error(self, clave: str) -> Optional[JSONResponse]:
+        """Respuesta de error con el mismo formato que Gemini, o None si esta llamada sale bien."""
+        if clave in self.claves_403 or self.rng.random() < self.tasa_403:
+            self.contadores["403"] += 1
+            return JSONResponse(
+                {"error": {"code": 403, "message": "API key not valid.", "status": "PERMISSION_DENIED"}},
+                status_code=403,
+            )
+        if self.rng.random() < self.tasa_429:
+            self.contadores["429"] += 1
+            return JSONResponse(
+                {"error": {
+                    "code": 429,
+                    "message": "Resource has been exhausted (e.g. check quota).",
+                    "status": "RESOURCE_EXHAUSTED",
+                    "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{self.retry_delay:g}s"}],
+                }},
+                status_code=429,
+            )
+        return None
+
+    def texto(self) -> str:
+        return " ".join(self.rng.choice(PALABRAS) for _ in range(self.palabras))
+
+
+def _candidato(texto: str) -> Dict[str, Any]:
+    return {"candidates": [{"content": {"parts": [{"text": texto}], "role": "model"}, "finishReason": "STOP"}]}
+
+
+def crear_app(comportamiento: Comportamiento) -> FastAPI:
+    app = FastAPI(title="Gemini falso")
+
+    @app.post("/v1beta/models/{modelo_accion}")
+    async def generar(modelo_accion: str, request: Request):
+        accion = modelo_accion.rpartition(":")[2]
+        await request.body()
+        comportamiento.contadores["llamadas"] += 1
+        demora = comportamiento.demora()
+
+        error = comportamiento.error(request.query_params.get("key", ""))
+        if error is not None:
+            # Los errores vuelven rápido, como en la API real
+            await asyncio.sleep(min(demora, 0.05))
+            return error
+
+        if accion == "streamGenerateContent":
+            comportamiento.contadores["stream"] += 1
+            palabras = comportamiento.texto().split()
+            tramos = [" ".join(palabras[i:i + 20]) + " " for i in range(0, len(palabras), 20)]
+
+            async def eventos():
+                for tramo in tramos:
+                    await asyncio.sleep(demora / len(tramos))
+                    yield f"data: {json.dumps(_candidato(tramo), ensure_ascii=False)}\r\n\r\n"
+
+            return StreamingResponse(eventos(), media_type="text/event-stream")
+
+        await asyncio.sleep(demora)
+        comportamiento.contadores["ok"] += 1
+        return _candidato(comportamiento.texto())
+
+    @app.get("/v1beta/models/{modelo}")
+    async def metadatos(modelo: str, request: Request):
+        # Lo usa el chequeo de salud: sólo falla con las claves de --claves-403
+        comportamiento.contadores["metadatos"] += 1
+        if request.query_params.get("key", "") in comportamiento.claves_403:
+            return JSONResponse(
+                {"error": {"code": 403, "message": "API key not valid.", "status": "PERMISSION_DENIED"}},
+                status_code=403,
+            )
+        return {"name": f"models/{modelo}", "displayName": modelo, "supportedGenerationMethods": ["generateContent"]}
+
+    @app.get("/stats")
+    async def stats():
+        return dict(comportamiento.contadores)
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor Gemini de mentira para benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.4, help="segundos por respuesta (default 0.4)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="± segundos al azar sobre la latencia")
+    parser.add_argument("--tasa-429", type=float, default=0.0, help="fracción de llamadas que reciben 429")
+    parser.add_argument("--tasa-403", type=float, default=0.0, help="fracción de llamadas que reciben 403")
+    parser.add_argument("--claves-403", default="", help="claves (separadas por coma) que siempre reciben 403")
+    parser.add_argument("--retry-delay", type=float, default=2.0, help="retryDelay sugerido en los 429")
+    parser.add_argument("--palabras", type=int, default=80, help="largo de cada respuesta")
+    parser.add_argument("--semilla", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    comportamiento = Comportamiento(
+        args.latencia, args.jitter, args.tasa_429, args.tasa_403,
+        [c.strip() for c in args.claves_403.split(",") if c.strip()],
+        args.retry_delay, args.palabras, args.semilla,
+    )
+    uvicorn.run(crear_app(comportamiento), host=args.host, port=args.puerto, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Micro-benchmarks de detect_filters, build_prompt y query_properties con catálogos de 50 a 1M propiedades.
+
+Uso:  python -m bench.micro [--tamaños 50,1000,10000,100000,1000000] [--segundos 1] [--json salida.json]
+
+Trabaja sobre bases temporales: un catálogo sintético de 50 propiedades (con todos los barrios
+y tipos) se carga por el camino normal de la app y después se agranda con ingesta.ingestar
+hasta cada tamaño. Las búsquedas se miden en frío (cache de búsquedas vacío) y en caliente.
+Con PROPERTY_ENGINE=numpy se mide el motor columnar en lugar de SQLite.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+from typing import Any, Callable, Dict, Iterator, List, Sequence
+
+from bench.carga import percentil
+from extractor import BARRIOS
+
+TIPOS = ["departamento", "casa", "ph", "casaquinta", "terreno"]
+AMENITIES = ["balcón", "pileta", "cochera", "parrilla", "gimnasio", "laundry", "terraza", "seguridad 24hs"]
+DESCRIPCIONES = [
+    "Luminoso, a metros del subte, con vista abierta.",
+    "Reciclado a nuevo, cocina integrada y patio.",
+    "Edificio con amenities, ideal para inversión.",
+    "Frente, muy silencioso, apto profesional.",
+    "Contrafrente con balcón corrido y mucho sol.",
+]
+
+MENSAJES = [
+    "Busco departamento en alquiler en Palermo hasta $280.000",
+    "quiero comprar una casa de 3 ambientes en Belgrano R",
+    "hay algún PH en Villa Crespo de más de 80 m2?",
+    "hola, qué opciones tienen desde 100000 pesos",
+    "terrenos en venta zona Núñez",
+]
+
+BUSQUEDAS = [
+    {"neighborhood": "palermo", "operacion": "alquiler"},
+    {"tipo": "casa", "operacion": "venta", "max_price": 300000},
+    {"min_rooms": 3, "min_sqm": 80},
+    {"neighborhood": "villa", "tipo": "ph"},
+    {},
+]
+BUSQUEDAS_TEXTO = [
+    {"q": "balcon luminoso"},
+    {"neighborhood": "recoleta", "q": "pileta"},
+]
+
+
+def propiedad_sintetica(i: int) -> Dict[str, Any]:
+    """Propiedad i del catálogo sintético (determinística: la misma i da siempre la misma fila)."""
+    rng = random.Random(i)
+    barrio = BARRIOS[i % len(BARRIOS)].title()
+    tipo = TIPOS[i % len(TIPOS)]
+    operacion = rng.choice(("alquiler", "venta"))
+    ambientes = rng.randint(1, 5)
+    return {
+        "id": f"sint_{i}",
+        "title": f"{tipo.capitalize()} {ambientes} amb en {barrio}",
+        "neighborhood": barrio,
+        "price": rng.randint(150, 1500) * 1000 if operacion == "alquiler" else rng.randint(40, 900) * 1000,
+        "rooms": ambientes,
+        "sqm": ambientes * rng.randint(18, 35),
+        "description": rng.choice(DESCRIPCIONES),
+        "operacion": operacion,
+        "tipo": tipo,
+        "direccion": f"Calle {i % 700} {i % 5000}",
+        "amenities": ", ".join(rng.sample(AMENITIES, 2)),
+        "expensas": rng.randint(0, 120) * 1000,
+    }
+
+
+def catalogo_sintetico(desde: int, hasta: int) -> Iterator[Dict[str, Any]]:
+    for i in range(desde, hasta):
+        yield propiedad_sintetica(i)
+
+
+def medir(funcion: Callable[[int], Any], segundos: float, minimo: int = 20, maximo: int = 200000) -> Dict[str, float]:
+    """Llama funcion(i) durante `segundos` (al menos `minimo` veces) y resume la duración de cada llamada en µs."""
+    duraciones: List[float] = []
+    fin = time.perf_counter() + segundos
+    i = 0
+    while (time.perf_counter() < fin or i < minimo) and i < maximo:
+        inicio = time.perf_counter()
+        funcion(i)
+        duraciones.append(time.perf_counter() - inicio)
+        i += 1
+    duraciones.sort()
+    return {
+        "n": len(duraciones),
+        "media_us": round(sum(duraciones) / len(duraciones) * 1e6, 1),
+        "p50_us": round(percentil(duraciones, 50) * 1e6, 1),
+        "p95_us": round(percentil(duraciones, 95) * 1e6, 1),
+        "p99_us": round(percentil(duraciones, 99) * 1e6, 1),
+    }
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks por tamaño de catálogo")
+    parser.add_argument("--tamaños", default="50,1000,10000,100000,1000000", help="tamaños de catálogo, separados por coma")
+    parser.add_argument("--segundos", type=float, default=1.0, help="tiempo de medición por función y tamaño")
+    parser.add_argument("--json", help="guarda el resultado en este archivo (para comparar entre versiones)")
+    args = parser.parse_args(argv)
+    tamaños = sorted({int(t) for t in args.tamaños.split(",") if t.strip()})
+
+    # La app se importa recién acá, apuntada a bases y catálogo temporales
+    tmp = tempfile.mkdtemp(prefix="bench_micro_")
+    catalogo_path = os.path.join(tmp, "properties.json")
+    base = min(50, tamaños[0])
+    with open(catalogo_path, "w", encoding="utf-8") as f:
+        json.dump(list(catalogo_sintetico(0, base)), f, ensure_ascii=False)
+    os.environ.update(
+        PROPERTIES_DB_PATH=os.path.join(tmp, "propiedades.db"),
+        LOGS_DB_PATH=os.path.join(tmp, "conversaciones.db"),
+        CATALOG_PATH=catalogo_path,
+        CATALOG_CHECK_INTERVAL="3600",
+        SHARED_STATE="0",
+    )
+    os.environ.setdefault("GEMINI_API_KEYS", "bench")
+
+    silencio = open(os.devnull, "w")
+    with contextlib.redirect_stdout(silencio):
+        import main as app
+        from cache import query_cache
+        from ingesta import ingestar
+        app.initialize_databases()
+
+    resultados: Dict[str, Any] = {"engine": "numpy" if app.property_engine.enabled else "sqlite", "tamaños": {}}
+    print(f"⏱️ Motor de búsqueda: {resultados['engine']}, bases en {tmp}")
+    print(f"\n{'tamaño':>9}  {'función':<34}{'n':>8}{'media µs':>11}{'p50 µs':>10}{'p95 µs':>10}{'p99 µs':>10}")
+
+    actual = base
+    for tamaño in tamaños:
+        fila: Dict[str, Any] = {}
+        if tamaño > actual:
+            inicio = time.perf_counter()
+            with contextlib.redirect_stdout(silencio):
+                resultado = ingestar(catalogo_sintetico(actual, tamaño), lote=5000, borrar_faltantes=False)
+                app._reconstruir_motor()
+            fila["ingesta_s"] = round(time.perf_counter() - inicio, 2)
+            if resultado.fatal or resultado.errores:
+                print(f"❌ Ingesta sintética con errores: {resultado.as_dict()}")
+                return 1
+            actual = tamaño
+            print(f"{'':>11}(catálogo agrandado a {tamaño} en {fila['ingesta_s']}s)")
+
+        resultados_busqueda = {}
+        with contextlib.redirect_stdout(silencio):
+            for n, filtros in enumerate(BUSQUEDAS):
+                resultados_busqueda[n] = app.query_properties(dict(filtros))
+
+        def query_frio(i, busquedas=BUSQUEDAS):
+            query_cache.clear()
+            app.query_properties(dict(busquedas[i % len(busquedas)]))
+
+        casos = [
+            ("detect_filters", lambda i: app.detect_filters(MENSAJES[i % len(MENSAJES)].lower())),
+            ("query_properties (frío)", query_frio),
+            ("query_properties texto libre (frío)", lambda i: query_frio(i, BUSQUEDAS_TEXTO)),
+            ("query_properties (cache)", lambda i: app.query_properties(dict(BUSQUEDAS[i % len(BUSQUEDAS)]))),
+            ("build_prompt", lambda i: app.build_prompt(
+                MENSAJES[i % len(MENSAJES)], resultados_busqueda[i % len(BUSQUEDAS)], BUSQUEDAS[i % len(BUSQUEDAS)],
+                "whatsapp" if i % 2 else "web",
+            )),
+        ]
+        for nombre, funcion in casos:
+            with contextlib.redirect_stdout(silencio):
+                r = medir(funcion, args.segundos)
+            fila[nombre] = r
+            print(f"{tamaño:>9}  {nombre:<34}{r['n']:>8}{r['media_us']:>11}{r['p50_us']:>10}{r['p95_us']:>10}{r['p99_us']:>10}")
+        resultados["tamaños"][tamaño] = fila
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resultado guardado en {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
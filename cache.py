@@ -0,0 +1,162 @@
+"""Cache en memoria con TTL, desalojo LRU y límite de tamaño en bytes, seguro entre hilos."""
+import sys
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Dict, Tuple
+
+from config import (
+    RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_ENTRIES,
+    QUERY_CACHE_TTL, QUERY_CACHE_NEGATIVE_TTL, QUERY_CACHE_MAX_BYTES, QUERY_CACHE_MAX_ENTRIES,
+)
+from shared_state import shared_state
+
+_MISSING = object()
+
+
+def estimate_size(value: Any) -> int:
+    """Tamaño aproximado en bytes de un valor cacheado (texto o estructuras JSON)."""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    try:
+        return len(json.dumps(value, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+def make_key(*parts: Any) -> str:
+    """Clave estable (sha1) a partir de partes serializables a JSON."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """LRU con expiración por entrada; se desaloja por cantidad de entradas o por bytes totales.
+
+    `generation` aumenta con cada clear(): quien la incluya en la clave no puede guardar, con
+    una clave vigente, un valor calculado antes de la invalidación.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int, max_entries: int = 10_000):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.generation = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, size, value = entry
+            if time.time() >= expires_at:
+                self._remove(key, size)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (time.time() + (self.ttl if ttl is None else ttl), size, value)
+            self._bytes += size
+            while self._data and (self._bytes > self.max_bytes or len(self._data) > self.max_entries):
+                _, (_, old_size, _) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def _remove(self, key: str, size: int):
+        del self._data[key]
+        self._bytes -= size
+
+    def clear(self):
+        """Vacía el cache (p. ej. al recargar el catálogo de propiedades)."""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.invalidations += 1
+            self.generation += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "generation": self.generation,
+        }
+
+
+# ✅ CACHE DE RESPUESTAS DE GEMINI (con varios workers vive en el store compartido)
+if shared_state.enabled:
+    response_cache = shared_state.cache("response", RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES)
+else:
+    response_cache = TTLCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_ENTRIES)
+
+# ✅ CACHE DE BÚSQUEDAS DE PROPIEDADES (compartido por /properties y /chat)
+query_cache = TTLCache(QUERY_CACHE_TTL, QUERY_CACHE_MAX_BYTES, QUERY_CACHE_MAX_ENTRIES)
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Forma canónica de un dict de filtros: claves ordenadas, texto en minúsculas, 280000.0 == 280000."""
+    normalized = {}
+    for key in sorted(filters or {}):
+        value = filters[key]
+        if value is None or value == "":
+            continue
+        if isinstance(value, str):
+            value = value.strip().lower()
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        normalized[key] = value
+    return normalized
+
+
+def response_cache_key(template: str, channel: str, filters=None, result_ids=(), text: str = "", version: int = 0) -> str:
+    """Clave del cache de respuestas: plantilla + canal + filtros normalizados + ids del resultado.
+
+    `text` sólo se usa en las plantillas que incluyen la consulta literal del usuario. `version`
+    es la del catálogo: si cambió el precio de una propiedad, los ids son los mismos pero la
+    respuesta no.
+    """
+    return make_key(template, channel, version, normalize_filters(filters), [str(i) for i in result_ids], " ".join(text.lower().split()))
+
+
+def query_cache_key(filters=None, limit: int = 50, version: int = 0, despues_de=None) -> str:
+    """Clave del cache de búsquedas: filtros normalizados + límite + cursor + generación del cache y versión del catálogo."""
+    return make_key("query", query_cache.generation, version, normalize_filters(filters), limit, despues_de)
+
+
+def cache_query(key: str, results) -> None:
+    """Guarda un resultado; las búsquedas vacías también (cache negativo) pero con un TTL más corto."""
+    query_cache.set(key, results, ttl=None if results else QUERY_CACHE_NEGATIVE_TTL)
@@ -0,0 +1,170 @@
+"""Catálogo de propiedades: vocabularios en memoria, recargados sólo si properties.json cambia.
+
+El archivo se recorre en streaming (ingesta.leer_json): en memoria quedan los vocabularios, nunca la
+lista completa de propiedades (esa vive en la tabla properties).
+"""
+import os
+import time
+import asyncio
+import threading
+from typing import List, Dict, Any, Callable, Iterable, Optional, Tuple
+
+from config import CATALOG_PATH, CATALOG_CHECK_INTERVAL
+from ingesta import hash_archivo, leer_json
+from texto import normalizar
+from logger import get_logger
+
+log = get_logger(__name__)
+
+
+def extraer_barrios(propiedades):
+    return sorted(set(p.get("neighborhood", "").lower() for p in propiedades if p.get("neighborhood")))
+
+def extraer_tipos(propiedades):
+    return sorted(set(p.get("tipo", "").lower() for p in propiedades if p.get("tipo")))
+
+def extraer_operaciones(propiedades):
+    return sorted(set(p.get("operacion", "").lower() for p in propiedades if p.get("operacion")))
+
+
+def leer_vocabularios(registros: Iterable[Any]) -> Tuple[List[str], List[str], List[str], int]:
+    """Barrios, tipos y operaciones (como extraer_*) y cantidad de propiedades, en una sola pasada."""
+    conjuntos: Dict[str, set] = {"neighborhood": set(), "tipo": set(), "operacion": set()}
+    cantidad = 0
+    for p in registros:
+        if not isinstance(p, dict):
+            continue
+        cantidad += 1
+        for campo, valores in conjuntos.items():
+            if p.get(campo):
+                valores.add(str(p[campo]).lower())
+    return sorted(conjuntos["neighborhood"]), sorted(conjuntos["tipo"]), sorted(conjuntos["operacion"]), cantidad
+
+
+class CatalogSnapshot:
+    """Foto inmutable del catálogo: vocabularios para la búsqueda y el prompt, y hash del archivo."""
+
+    def __init__(self, barrios: List[str], tipos: List[str], operaciones: List[str], cantidad: int,
+                 content_hash: str, version: int, path: Optional[str] = None):
+        self.path = path
+        self.cantidad = cantidad
+        self.content_hash = content_hash
+        self.version = version
+        self.loaded_at = time.time()
+        self.barrios = barrios
+        self.tipos = tipos
+        self.operaciones = operaciones
+        # Vocabulario normalizado (sin acentos) para búsquedas por igualdad en la base
+        self.vocabulario = {
+            "neighborhood": {normalizar(b) for b in self.barrios},
+            "tipo": {normalizar(t) for t in self.tipos},
+            "operacion": {normalizar(o) for o in self.operaciones},
+        }
+
+
+class Catalog:
+    """Mantiene el snapshot vigente y lo reemplaza de forma atómica cuando cambia el archivo.
+
+    Las peticiones llaman a `get()`, que sólo devuelve el snapshot vigente. Una tarea en segundo
+    plano (start) hace un `stat` cada CATALOG_CHECK_INTERVAL segundos en un hilo aparte: el archivo
+    sólo se vuelve a leer si cambió mtime/tamaño, y el snapshot sólo se reemplaza (y se avisa a los
+    listeners, en ese mismo hilo) si además cambió el hash del contenido. Ninguna petición espera
+    una recarga.
+    """
+
+    def __init__(self, path: str, check_interval: float):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = CatalogSnapshot([], [], [], 0, "", 0, path)
+        self._stat: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[CatalogSnapshot], None]] = []
+        self.reloads = 0
+
+    def on_reload(self, listener: Callable[[CatalogSnapshot], None]):
+        """Registra una función a llamar cada vez que cambia el contenido del catálogo."""
+        self._listeners.append(listener)
+
+    def get(self) -> CatalogSnapshot:
+        return self._snapshot
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running or self.check_interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                log.warning("⚠️ Error revisando el catálogo %s: %s", self.path, e)
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _read_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Recarga si el archivo cambió (o siempre con force). Devuelve True si hubo un snapshot nuevo."""
+        with self._lock:
+            stat = self._read_stat()
+            if not force and (stat is None or stat == self._stat):
+                return False
+
+            try:
+                # Hash por bloques y vocabularios en streaming: memoria acotada aunque el archivo sea grande
+                content_hash = hash_archivo(self.path)
+                if not force and content_hash == self._snapshot.content_hash:
+                    self._stat = stat
+                    return False
+                barrios, tipos, operaciones, cantidad = leer_vocabularios(leer_json(self.path))
+            except (OSError, ValueError) as e:
+                # Se mantiene el snapshot anterior: mejor datos viejos que ninguno
+                log.warning("⚠️ Error recargando catálogo %s: %s", self.path, e)
+                return False
+
+            self._snapshot = CatalogSnapshot(barrios, tipos, operaciones, cantidad, content_hash,
+                                             self._snapshot.version + 1, self.path)
+            self._stat = stat
+            self.reloads += 1
+            log.info("✅ Catálogo v%s: %s propiedades", self._snapshot.version, cantidad)
+
+            for listener in self._listeners:
+                try:
+                    listener(self._snapshot)
+                except Exception as e:
+                    log.warning("⚠️ Error en listener de recarga del catálogo: %s", e)
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "propiedades": snapshot.cantidad,
+            "hash": snapshot.content_hash[:12],
+            "loaded_at": snapshot.loaded_at,
+            "reloads": self.reloads,
+            "watching": self.running,
+        }
+
+
+catalog = Catalog(CATALOG_PATH, CATALOG_CHECK_INTERVAL)
@@ -0,0 +1,161 @@
+"""Motor de filtros en memoria: columnas NumPy con máscaras booleanas, alternativa a SQLite para el catálogo."""
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from config import PROPERTY_ENGINE
+from texto import normalizar
+from logger import get_logger
+
+log = get_logger(__name__)
+
+# numpy es opcional y sólo se importa si se pidió este motor (no suma al arranque en frío)
+np = None
+if PROPERTY_ENGINE == "numpy":
+    try:
+        import numpy as np
+    except ImportError:
+        log.warning("⚠️ PROPERTY_ENGINE=numpy pero numpy no está instalado: se usa SQLite")
+
+NUMERICAS = ("price", "rooms", "sqm", "expensas", "antiguedad")
+CATEGORICAS = ("neighborhood", "tipo", "operacion")
+
+# filtro -> (columna, comparación), igual que construir_consulta_propiedades
+RANGOS = {
+    "min_price": ("price", "ge"),
+    "max_price": ("price", "le"),
+    "min_rooms": ("rooms", "ge"),
+    "min_sqm": ("sqm", "ge"),
+    "max_sqm": ("sqm", "le"),
+}
+
+
+def _a_float(valor) -> float:
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class _Columnas:
+    """Foto columnar de la tabla properties (en orden de rowid, como la recorre SQLite)."""
+
+    def __init__(self, filas: Sequence[Dict[str, Any]]):
+        self.registros = [
+            {k: v for k, v in fila.items() if not k.endswith("_norm")} for fila in filas
+        ]
+        self.numericas = {
+            col: np.array([_a_float(f.get(col)) for f in filas], dtype=np.float64) for col in NUMERICAS
+        }
+        # Categóricas como códigos enteros sobre la columna *_norm
+        self.categorias: Dict[str, List[str]] = {}
+        self.codigos: Dict[str, "np.ndarray"] = {}
+        for col in CATEGORICAS:
+            valores = [f.get(f"{col}_norm") or "" for f in filas]
+            categorias = sorted(set(valores))
+            indice = {c: i for i, c in enumerate(categorias)}
+            self.categorias[col] = categorias
+            self.codigos[col] = np.array([indice[v] for v in valores], dtype=np.int32)
+        # properties.id es TEXT: se compara como texto, igual que SQLite ('10' < '7', 'prop_…' sin problema)
+        self.ids = np.array([str(f.get("id") or "") for f in filas], dtype=str)
+        # ORDER BY price ASC, id ASC precalculado (en SQLite los NULL van primero); cada consulta sólo filtra
+        precio = self.numericas["price"]
+        self.por_precio = np.lexsort((self.ids, np.where(np.isnan(precio), -np.inf, precio)))
+
+    def __len__(self) -> int:
+        return len(self.registros)
+
+    def mascara_texto(self, col: str, valor, vocabulario) -> "np.ndarray":
+        """Igualdad si el valor está en el vocabulario del catálogo; si no, el equivalente a LIKE '%valor%'."""
+        valor_norm = normalizar(valor)
+        exacto = valor_norm in vocabulario
+        acepta = np.array(
+            [c == valor_norm if exacto else valor_norm in c for c in self.categorias[col]], dtype=bool
+        )
+        return acepta[self.codigos[col]]
+
+
+class ColumnarEngine:
+    """Evalúa los mismos dicts de filtros que query_properties sobre arrays en memoria.
+
+    Se reconstruye cuando cambia la versión del catálogo (`version`). Devuelve None para lo que no
+    sabe resolver (texto libre "q" o valores no numéricos) y ahí sigue respondiendo SQLite.
+    `despues_de` (price, id) pide la página siguiente, con el mismo orden que SQLite.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._columnas: Optional[_Columnas] = None
+        self.version = -1
+        self.queries = 0
+        self.fallbacks = 0
+        self.last_build_ms = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self._columnas is not None
+
+    def rebuild(self, filas: Sequence[Dict[str, Any]], version: int = 0):
+        if not self.enabled:
+            return
+        start = time.perf_counter()
+        self._columnas = _Columnas(filas)
+        self.version = version
+        self.last_build_ms = (time.perf_counter() - start) * 1000
+
+    def buscar(self, filters: Optional[Dict[str, Any]], vocabulario: Dict[str, set], limit: int = 50,
+               despues_de: Optional[Sequence[Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        columnas = self._columnas
+        if not self.enabled or columnas is None:
+            return None
+        filters = filters or {}
+        if filters.get("q"):
+            self.fallbacks += 1
+            return None
+
+        mascara = np.ones(len(columnas), dtype=bool)
+        for col in ("operacion", "tipo", "neighborhood"):
+            if filters.get(col):
+                mascara &= columnas.mascara_texto(col, filters[col], vocabulario[col])
+
+        for filtro, (col, comparacion) in RANGOS.items():
+            if filters.get(filtro) is None:
+                continue
+            try:
+                limite = float(filters[filtro])
+            except (TypeError, ValueError):
+                self.fallbacks += 1
+                return None
+            valores = columnas.numericas[col]
+            mascara &= (valores >= limite) if comparacion == "ge" else (valores <= limite)
+
+        if despues_de is not None:
+            try:
+                precio_cursor = None if despues_de[0] is None else float(despues_de[0])
+                id_cursor = str(despues_de[1])
+            except (TypeError, ValueError, IndexError):
+                self.fallbacks += 1
+                return None
+            precio, ids = columnas.numericas["price"], columnas.ids
+            if precio_cursor is None:
+                mascara &= ~np.isnan(precio) | (ids > id_cursor)
+            else:
+                # NaN nunca es mayor ni igual: las filas sin precio (que van primero) quedan afuera, como en SQL
+                mascara &= (precio > precio_cursor) | ((precio == precio_cursor) & (ids > id_cursor))
+
+        orden = columnas.por_precio[np.flatnonzero(mascara[columnas.por_precio])[:limit]]
+        self.queries += 1
+        return [dict(columnas.registros[i]) for i in orden]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "rows": len(self._columnas) if self._columnas is not None else 0,
+            "version": self.version,
+            "queries": self.queries,
+            "fallbacks": self.fallbacks,
+            "last_build_ms": round(self.last_build_ms, 2),
+        }
+
+
+property_engine = ColumnarEngine(np is not None)
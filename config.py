@@ -17,15 +17,104 @@ except:
 
 # Leer GEMINI_KEYS de variables de entorno
 raw_keys = os.getenv("GEMINI_API_KEYS", "")  # 🔥 CAMBIAR NOMBRE
-print("🧪 Variable cruda:", raw_keys[:50] + "..." if len(raw_keys) > 50 else raw_keys)
 
 API_KEYS = [key.strip() for key in raw_keys.split(",") if key.strip()]
-print(f"🔧 Claves cargadas: {[key[:8] + '...' for key in API_KEYS]}")
+# Nunca se imprime material de las claves, sólo cuántas hay
+print(f"🔧 Claves Gemini cargadas: {len(API_KEYS)}")
 
 # Configuración del modelo y endpoint
 WORKING_MODEL = "gemini-2.0-flash-001"
-ENDPOINT = f"https://generativelanguage.googleapis.com/v1beta/models/{WORKING_MODEL}:generateContent"
+# GEMINI_BASE_URL permite apuntar a otro servidor (p. ej. el Gemini de mentira de bench/gemini_falso.py)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/models").rstrip("/")
+ENDPOINT = f"{GEMINI_BASE_URL}/{WORKING_MODEL}:generateContent"
 MODEL = WORKING_MODEL
 
 print(f"🔧 Modelo configurado: {WORKING_MODEL}")
-print(f"🔧 Endpoint: {ENDPOINT}")
\ No newline at end of file
+
+# Pool HTTP compartido para Gemini
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "100"))
+
+# Planificador de claves: enfriamiento tras un 429 (se duplica en 429 consecutivos)
+GEMINI_COOLDOWN_SECONDS = float(os.getenv("GEMINI_COOLDOWN_SECONDS", "30"))
+GEMINI_MAX_COOLDOWN_SECONDS = float(os.getenv("GEMINI_MAX_COOLDOWN_SECONDS", "600"))
+
+# Hedging opcional: si la clave primaria supera el percentil de latencia, se lanza una segunda
+GEMINI_HEDGE_ENABLED = os.getenv("GEMINI_HEDGE", "0").lower() in ("1", "true", "yes")
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "90"))
+GEMINI_HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "1.5"))
+GEMINI_HEDGE_BUDGET_PERCENT = float(os.getenv("GEMINI_HEDGE_BUDGET_PERCENT", "10"))
+
+# Single-flight: pedidos simultáneos con el mismo prompt comparten una sola llamada a Gemini
+GEMINI_COALESCE_ENABLED = os.getenv("GEMINI_COALESCE", "1").lower() in ("1", "true", "yes")
+
+# Cache de respuestas de Gemini (TTL + LRU con límite en bytes)
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+
+# Catálogo en memoria: archivo fuente y cada cuántos segundos se revisa si cambió (0 = sólo con POST /catalog/reload)
+CATALOG_PATH = os.getenv("CATALOG_PATH", str(Path(__file__).parent / "properties.json"))
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "5"))
+
+# SQLite: conexiones persistentes por hilo (WAL)
+PROPERTIES_DB_PATH = os.getenv("PROPERTIES_DB_PATH", str(Path(__file__).parent / "propiedades.db"))
+LOGS_DB_PATH = os.getenv("LOGS_DB_PATH", str(Path(__file__).parent / "conversaciones.db"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Logs de conversación: cola en memoria volcada por lotes ("drop" descarta si se llena, "block" espera)
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+LOG_QUEUE_POLICY = os.getenv("LOG_QUEUE_POLICY", "drop")
+# Reintentos de un lote cuando la base está bloqueada por otro worker o por la retención (espera creciente)
+LOG_WRITE_RETRIES = int(os.getenv("LOG_WRITE_RETRIES", "5"))
+LOG_WRITE_BACKOFF = float(os.getenv("LOG_WRITE_BACKOFF", "0.1"))
+
+# Motor de búsqueda de propiedades: "sqlite" (por defecto) o "numpy" (columnas en memoria, requiere numpy)
+PROPERTY_ENGINE = os.getenv("PROPERTY_ENGINE", "sqlite").lower()
+
+# Cache de búsquedas de propiedades (los resultados vacíos se guardan con un TTL más corto)
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+QUERY_CACHE_NEGATIVE_TTL = float(os.getenv("QUERY_CACHE_NEGATIVE_TTL", "60"))
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "2000"))
+
+# Varios workers (uvicorn --workers N): métricas, estado de claves y cache de respuestas van a un store SQLite compartido
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+SHARED_STATE_ENABLED = os.getenv("SHARED_STATE", "1" if WEB_CONCURRENCY > 1 else "0").lower() in ("1", "true", "yes")
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", str(Path(__file__).parent / "estado.db"))
+# Identificador de cada arranque (lo fija el comando de inicio); vacío = se deriva del proceso padre
+SHARED_STATE_BOOT_ID = os.getenv("SHARED_STATE_BOOT_ID", "")
+# Cada cuántos segundos cada worker vuelca sus contadores y claves al store y relee las claves de los demás
+SHARED_COUNTERS_FLUSH_INTERVAL = float(os.getenv("SHARED_COUNTERS_FLUSH_INTERVAL", "1"))
+
+# Historial por sesión (historial.py): turnos por sesión en memoria, cuántas sesiones y su TTL en modo multi-worker
+HISTORY_TURNS = int(os.getenv("HISTORY_TURNS", "10"))
+HISTORY_MAX_SESSIONS = int(os.getenv("HISTORY_MAX_SESSIONS", "5000"))
+HISTORY_TTL = float(os.getenv("HISTORY_TTL", "3600"))
+
+# Presupuesto de tokens (estimados) de cada prompt a Gemini; WhatsApp usa uno más chico
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+PROMPT_TOKEN_BUDGET_WHATSAPP = int(os.getenv("PROMPT_TOKEN_BUDGET_WHATSAPP", "700"))
+
+# Retención de conversaciones.db (retencion.py): días que quedan en la tabla logs (0 = no archivar), carpeta
+# de archivos .jsonl.gz, cada cuánto corre, filas por transacción y páginas por VACUUM incremental
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "30"))
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", str(Path(__file__).parent / "archivo_logs"))
+LOG_RETENTION_INTERVAL = float(os.getenv("LOG_RETENTION_INTERVAL", "3600"))
+LOG_RETENTION_BATCH = int(os.getenv("LOG_RETENTION_BATCH", "5000"))
+LOG_VACUUM_PAGES = int(os.getenv("LOG_VACUUM_PAGES", "2000"))
+
+# Logging del proceso (logger.py): nivel, formato ("text" o "json"), fracción de DEBUG que se escribe y cola hacia stdout
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_DEBUG_SAMPLE = float(os.getenv("LOG_DEBUG_SAMPLE", "1"))
+LOGGER_QUEUE_SIZE = int(os.getenv("LOGGER_QUEUE_SIZE", "10000"))
+
+# Salud: /readyz responde con lo último que midió un chequeo en segundo plano cada HEALTH_PROBE_INTERVAL segundos.
+# HEALTH_PROBE_GEMINI consulta los metadatos del modelo con cada clave (no genera texto ni consume cuota de tokens).
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "60"))
+HEALTH_PROBE_GEMINI = os.getenv("HEALTH_PROBE_GEMINI", "1").lower() in ("1", "true", "yes")
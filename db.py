@@ -0,0 +1,124 @@
+"""Acceso a SQLite: una conexión persistente por hilo, en modo WAL y con sentencias cacheadas."""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator, List, Optional
+
+from config import SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE, SQLITE_BUSY_TIMEOUT_MS, PROPERTIES_DB_PATH, LOGS_DB_PATH
+
+DB_PATH = PROPERTIES_DB_PATH
+LOG_PATH = LOGS_DB_PATH
+
+
+class SQLitePool:
+    """Pool de conexiones a un archivo SQLite, una por hilo.
+
+    Cada conexión se abre una sola vez con:
+    - journal_mode=WAL: los lectores nunca esperan al escritor de logs.
+    - synchronous=NORMAL: en WAL sigue siendo seguro ante caídas del proceso, con muchos menos fsync.
+    - mmap_size / cache_size: lecturas servidas desde memoria.
+    - cached_statements: sqlite3 reutiliza las sentencias ya preparadas.
+    - auto_vacuum (opcional): sólo se aplica al crear el archivo; una base existente necesita un VACUUM completo.
+    """
+
+    def __init__(self, path: str, auto_vacuum: Optional[str] = None):
+        self.path = path
+        self.auto_vacuum = auto_vacuum
+        self._local = threading.local()
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,  # autocommit; las escrituras usan transaction()
+            cached_statements=256,
+            check_same_thread=False,  # cada hilo usa la suya; sólo close_all cruza hilos
+        )
+        conn.row_factory = sqlite3.Row
+        if self.auto_vacuum:
+            # Antes de journal_mode, que ya escribe el encabezado de una base nueva
+            conn.execute(f"PRAGMA auto_vacuum = {self.auto_vacuum}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Conexión del hilo actual (se crea la primera vez)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def query(self, sql: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+        return self.connection().execute(sql, tuple(params)).fetchall()
+
+    def query_one(self, sql: str, params: Iterable[Any] = ()) -> Optional[sqlite3.Row]:
+        return self.connection().execute(sql, tuple(params)).fetchone()
+
+    def execute(self, sql: str, params: Iterable[Any] = ()) -> sqlite3.Cursor:
+        return self.connection().execute(sql, tuple(params))
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE … COMMIT (o ROLLBACK si hay excepción) sobre la conexión del hilo.
+
+        Si falla el propio COMMIT (SQLITE_BUSY, error de disco) también se hace ROLLBACK: si no, la
+        conexión del hilo quedaría con la transacción abierta y todo BEGIN siguiente fallaría.
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def stream(self, sql: str, params: Iterable[Any] = (), lote: int = 1000) -> Iterator[sqlite3.Row]:
+        """Recorre un SELECT de a `lote` filas con una conexión propia de sólo lectura (memoria constante).
+
+        La conexión es aparte porque el generador puede avanzar desde distintos hilos (StreamingResponse)
+        y su lectura dura lo que dure la descarga; en WAL no bloquea a los que escriben.
+        """
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(sql, tuple(params))
+            while True:
+                filas = cursor.fetchmany(lote)
+                if not filas:
+                    return
+                yield from filas
+        finally:
+            conn.close()
+
+    def close_all(self):
+        """Cierra todas las conexiones abiertas (shutdown o antes de borrar el archivo)."""
+        with self._lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._all.clear()
+        self._local = threading.local()
+
+
+properties_db = SQLitePool(DB_PATH)
+logs_db = SQLitePool(LOG_PATH, auto_vacuum="INCREMENTAL")
+
+
+def close_all():
+    properties_db.close_all()
+    logs_db.close_all()
@@ -0,0 +1,71 @@
+"""Paginación por cursor (keyset) y exportación en streaming (NDJSON / CSV) para /logs y /properties."""
+import io
+import csv
+import json
+import base64
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# Filas por bloque escrito en la respuesta (un write por bloque, no por fila)
+FILAS_POR_BLOQUE = 500
+
+
+def codificar_cursor(valores: Sequence[Any]) -> str:
+    """Cursor opaco con los valores de orden de la última fila entregada."""
+    return base64.urlsafe_b64encode(json.dumps(list(valores), separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: Optional[str], largo: int) -> Optional[List[Any]]:
+    """Valores del cursor (None si no vino); 400 si no es un cursor de este endpoint."""
+    if not cursor:
+        return None
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        valores = None
+    if not isinstance(valores, list) or len(valores) != largo:
+        raise HTTPException(status_code=400, detail="cursor inválido")
+    return valores
+
+
+def _ndjson(filas: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    bloque = []
+    for fila in filas:
+        bloque.append(json.dumps(fila, ensure_ascii=False, default=str))
+        if len(bloque) >= FILAS_POR_BLOQUE:
+            yield "\n".join(bloque) + "\n"
+            bloque = []
+    if bloque:
+        yield "\n".join(bloque) + "\n"
+
+
+def _csv(filas: Iterable[Dict[str, Any]], columnas: Sequence[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(columnas), extrasaction="ignore")
+    writer.writeheader()
+    for i, fila in enumerate(filas, start=1):
+        writer.writerow(fila)
+        if i % FILAS_POR_BLOQUE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def respuesta_export(filas: Iterable[Dict[str, Any]], columnas: Sequence[str], formato: str, nombre: str) -> StreamingResponse:
+    """StreamingResponse que va serializando `filas` (un generador) sin juntarlas en memoria."""
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail=f"format debe ser uno de: {', '.join(FORMATOS)}")
+    cuerpo = _ndjson(filas) if formato == "ndjson" else _csv(filas, columnas)
+    return StreamingResponse(
+        cuerpo,
+        media_type=FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'},
+    )
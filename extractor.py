@@ -0,0 +1,185 @@
+"""Extracción de filtros del mensaje del usuario en una sola pasada, con patrones compilados al importar."""
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from texto import normalizar
+
+# Barrios conocidos aunque hoy no haya propiedades publicadas en ellos
+BARRIOS = [
+    'palermo', 'recoleta', 'belgrano', 'almagro', 'caballito',
+    'microcentro', 'balvanera', 'villa crespo', 'san telmo', 'boca',
+    'nuñez', 'monserrat', 'constitución', 'flores', 'parque chas',
+    'villa urquiza', 'boedo', 'villa luro', 'villa devoto', 'villa soldati',
+    'villa ramos mejía', 'liniers', 'mataderos', 'velez sarsfield', 'versalles',
+    'paternal', 'chacarita', 'agronomia', 'villa pueyrredón', 'saavedra',
+    'coghlan', 'belgrano r', 'belgrano c', 'olivos', 'san isidro',
+    'vicente lopez', 'puerto madero', 'colegiales', 'soho', 'barrio norte'
+]
+
+OPERACIONES = {
+    'alquiler': 'alquiler',
+    'alquilar': 'alquiler',
+    'renta': 'alquiler',
+    'venta': 'venta',
+    'comprar': 'venta',
+    'compra': 'venta',
+    'vender': 'venta'
+}
+
+TIPOS = {
+    'departamento': 'departamento',
+    'depto': 'departamento',
+    'casa': 'casa',
+    'ph': 'ph',
+    'casaquinta': 'casaquinta',
+    'terreno': 'terreno',
+    'lote': 'terreno',
+}
+
+# Patrones numéricos sobre texto normalizado (sin acentos). El precio máximo respeta el orden de prioridad.
+PRECIO_MAXIMO = (
+    r"hasta \$?\s*{num}",                 # "hasta $280000"
+    r"maximo \$?\s*{num}",                # "máximo 280000"
+    r"precio(?:(?!desde ).)*?\$?\s*{num}", # "precio 280000" (no "precio desde 280000")
+    r"menos de \$?\s*{num}",              # "menos de 280000"
+    r"\$?\s*{num}\s*pesos",               # "280000 pesos"
+    r"de \$?\s*{num}(?![0-9\.]|\s*(?:amb|m2|metros))",  # "de $280000" (no "de 3 ambientes")
+    r"valor(?:(?!desde ).)*?\$?\s*{num}",  # "valor 280000"
+)
+PRECIO_MINIMO = r"desde \$?\s*{num}"
+# Una sola alternancia para los dos extremos: cada tramo del texto cuenta para uno solo, así
+# "desde 100000 pesos" es sólo mínimo. El grupo `min` va primero; `max0`..`max6` según prioridad.
+PRECIO = re.compile("|".join(
+    [PRECIO_MINIMO.format(num=r"(?P<min>[0-9\.]+)")]
+    + [patron.format(num=rf"(?P<max{i}>[0-9\.]+)") for i, patron in enumerate(PRECIO_MAXIMO)]
+))
+AMBIENTES = re.compile(r"(\d+)\s*amb")
+METROS = re.compile(r"(\d+)\s*(?:m2|metros)")
+
+
+class Filtros:
+    """Filtros tipados extraídos de un mensaje; `as_dict()` da el formato que usa query_properties."""
+
+    __slots__ = ("neighborhood", "tipo", "operacion", "min_price", "max_price", "min_rooms", "min_sqm")
+
+    def __init__(self):
+        self.neighborhood: Optional[str] = None
+        self.tipo: Optional[str] = None
+        self.operacion: Optional[str] = None
+        self.min_price: Optional[int] = None
+        self.max_price: Optional[int] = None
+        self.min_rooms: Optional[int] = None
+        self.min_sqm: Optional[int] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {campo: getattr(self, campo) for campo in self.__slots__ if getattr(self, campo) is not None}
+
+    def __bool__(self) -> bool:
+        return any(getattr(self, campo) is not None for campo in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"Filtros({self.as_dict()})"
+
+
+def _numero(valor: str) -> Optional[int]:
+    try:
+        return int(valor.replace('.', ''))
+    except ValueError:
+        return None
+
+
+def _primer_numero(patron: re.Pattern, texto: str) -> Optional[int]:
+    match = patron.search(texto)
+    return _numero(match.group(1)) if match else None
+
+
+class FilterExtractor:
+    """Encuentra todos los términos del vocabulario en una sola pasada sobre el mensaje.
+
+    Los términos (barrios, tipos, operaciones y sus sinónimos, sin acentos) se compilan en una
+    única alternancia de palabras completas ordenada de más larga a más corta, así "belgrano r"
+    gana sobre "belgrano" y "casaquinta" sobre "casa". Se acepta el plural en "s"/"es". Por cada
+    campo queda el primer término que aparece en el texto.
+    """
+
+    def __init__(self, vocabulario: Iterable[Tuple[str, str, str]]):
+        self._terminos: Dict[str, Tuple[str, str]] = {}
+        for campo, termino, valor in vocabulario:
+            termino = normalizar(termino)
+            if termino:
+                self._terminos.setdefault(termino, (campo, valor))
+        alternancia = "|".join(re.escape(t) for t in sorted(self._terminos, key=len, reverse=True))
+        self._patron = re.compile(rf"\b({alternancia})(?:e?s)?\b") if self._terminos else None
+
+    @classmethod
+    def desde_catalogo(cls, barrios: List[str], tipos: List[str], operaciones: List[str]) -> "FilterExtractor":
+        """Vocabulario del catálogo vigente más las listas fijas de barrios y sinónimos."""
+        vocabulario = [("operacion", o, o) for o in operaciones]
+        vocabulario += [("operacion", k, v) for k, v in OPERACIONES.items()]
+        vocabulario += [("tipo", t, t) for t in tipos]
+        vocabulario += [("tipo", k, v) for k, v in TIPOS.items()]
+        vocabulario += [("neighborhood", b, b) for b in barrios]
+        vocabulario += [("neighborhood", b, b) for b in BARRIOS]
+        return cls(vocabulario)
+
+    def extraer(self, texto: str) -> Filtros:
+        filtros = Filtros()
+        texto = normalizar(texto)
+
+        if self._patron is not None:
+            for match in self._patron.finditer(texto):
+                campo, valor = self._terminos[match.group(1)]
+                if getattr(filtros, campo) is None:
+                    setattr(filtros, campo, valor)
+
+        prioridad_maximo = len(PRECIO_MAXIMO)
+        for match in PRECIO.finditer(texto):
+            precio = _numero(match.group(match.lastgroup))
+            if precio is None:
+                continue
+            if match.lastgroup == "min":
+                if filtros.min_price is None:
+                    filtros.min_price = precio
+            elif int(match.lastgroup[3:]) < prioridad_maximo:
+                prioridad_maximo = int(match.lastgroup[3:])
+                filtros.max_price = precio
+        filtros.min_rooms = _primer_numero(AMBIENTES, texto)
+        filtros.min_sqm = _primer_numero(METROS, texto)
+        return filtros
+
+
+_extractor: Optional[FilterExtractor] = None
+_extractor_version = -1
+_lock = threading.Lock()
+
+
+def extractor_para(snapshot) -> FilterExtractor:
+    """Extractor compilado para un snapshot del catálogo; se recompila sólo cuando cambia la versión."""
+    global _extractor, _extractor_version
+    if _extractor is None or _extractor_version != snapshot.version:
+        with _lock:
+            if _extractor is None or _extractor_version != snapshot.version:
+                _extractor = FilterExtractor.desde_catalogo(snapshot.barrios, snapshot.tipos, snapshot.operaciones)
+                _extractor_version = snapshot.version
+    return _extractor
+
+
+# Micro-benchmark: python extractor.py
+if __name__ == "__main__":
+    import timeit
+
+    mensajes = [
+        "Busco departamento en alquiler en Palermo hasta $280.000",
+        "quiero comprar una casa de 3 ambientes en Belgrano R",
+        "hay algún PH en Villa Crespo de más de 80 m2?",
+        "hola, qué opciones tienen desde 100000 pesos",
+        "terrenos en venta zona Núñez",
+    ]
+    extractor = FilterExtractor.desde_catalogo([], [], [])
+    for mensaje in mensajes:
+        print(f"{mensaje!r} -> {extractor.extraer(mensaje)}")
+
+    repeticiones = 20000
+    segundos = timeit.timeit(lambda: [extractor.extraer(m) for m in mensajes], number=repeticiones)
+    print(f"\n⏱️ {segundos / (repeticiones * len(mensajes)) * 1e6:.1f} µs por mensaje")
@@ -0,0 +1,80 @@
+"""Búsqueda de texto libre sobre las propiedades con SQLite FTS5 (sin acentos, ranking BM25)."""
+import re
+from typing import Iterable, List, Optional
+
+from texto import normalizar
+
+# Tabla FTS5 de contenido externo: el texto vive en `properties` y los triggers mantienen el índice.
+# remove_diacritics 2 hace que "balcón" y "balcon" sean el mismo token.
+FTS_SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS properties_fts USING fts5(
+        title, description, amenities, direccion,
+        content='properties', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS properties_fts_ai AFTER INSERT ON properties BEGIN
+        INSERT INTO properties_fts(rowid, title, description, amenities, direccion)
+        VALUES (new.rowid, new.title, new.description, new.amenities, new.direccion);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS properties_fts_ad AFTER DELETE ON properties BEGIN
+        INSERT INTO properties_fts(properties_fts, rowid, title, description, amenities, direccion)
+        VALUES ('delete', old.rowid, old.title, old.description, old.amenities, old.direccion);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS properties_fts_au AFTER UPDATE ON properties BEGIN
+        INSERT INTO properties_fts(properties_fts, rowid, title, description, amenities, direccion)
+        VALUES ('delete', old.rowid, old.title, old.description, old.amenities, old.direccion);
+        INSERT INTO properties_fts(rowid, title, description, amenities, direccion)
+        VALUES (new.rowid, new.title, new.description, new.amenities, new.direccion);
+    END
+    ''',
+]
+
+# Pesos BM25 por columna: title, description, amenities, direccion
+BM25_WEIGHTS = "10.0, 5.0, 3.0, 1.0"
+
+# Palabras que no aportan a la búsqueda: gramática del español y vocabulario que ya cubren los filtros
+PALABRAS_VACIAS = {
+    "a", "al", "ante", "con", "de", "del", "desde", "el", "ella", "en", "entre", "es", "esta", "este",
+    "hasta", "la", "las", "lo", "los", "mas", "me", "mi", "muy", "no", "o", "para", "pero", "por",
+    "que", "se", "si", "sin", "sobre", "su", "un", "una", "uno", "unos", "unas", "y", "ya", "cerca",
+    "hola", "gracias", "busco", "buscar", "buscando", "quiero", "queria", "necesito", "tenes",
+    "tienen", "hay", "algo", "alguna", "algun", "favor", "ver", "mostrame", "dame",
+    "propiedad", "propiedades", "departamento", "departamentos", "depto", "casa", "casas", "ph",
+    "casaquinta", "terreno", "terrenos", "lote", "lotes", "alquiler", "alquilar", "renta", "venta",
+    "comprar", "compra", "vender", "ambiente", "ambientes", "amb", "m2", "metros", "precio",
+    "pesos", "dolares", "usd", "valor", "maximo", "minimo", "menos", "zona", "barrio",
+    "como", "estas", "esta", "tal", "bien", "buen", "buenas", "buenos", "dias", "tardes", "noches",
+    "info", "informacion", "consulta", "consultar", "saber", "puede", "podes", "pueden",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def terminos_libres(texto: str, excluir: Iterable[str] = ()) -> List[str]:
+    """Palabras del texto que sirven para buscar: normalizadas, sin repetir, sin vacías ni `excluir`."""
+    excluidas = PALABRAS_VACIAS | {normalizar(e) for e in excluir}
+    terminos = []
+    for token in _TOKEN_RE.findall(normalizar(texto)):
+        if len(token) < 3 or token.isdigit() or token in excluidas or token in terminos:
+            continue
+        terminos.append(token)
+    return terminos
+
+
+def consulta_fts(texto: str) -> Optional[str]:
+    """Convierte texto libre en una expresión MATCH de FTS5, o None si no queda nada útil.
+
+    Cada palabra se busca por prefijo ("balcon*" encuentra "balcones") y se combinan con OR:
+    el orden lo decide BM25, así que las propiedades que cumplen más términos quedan primero.
+    """
+    terminos = terminos_libres(texto)
+    if not terminos:
+        return None
+    return " OR ".join(f'"{t}"*' for t in terminos)
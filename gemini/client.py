@@ -1,83 +1,301 @@
-import requests
+# Módulo Gemini inicializado
+"""Cliente asíncrono de Gemini con un pool HTTP keep-alive compartido por todo el proceso."""
+import asyncio
+import json
+import re
 import time
-from config import API_KEYS, WORKING_MODEL  # ← Cambiar ENDPOINT por WORKING_MODEL
+from typing import Optional, AsyncIterator
 
+import httpx
 
-def call_gemini(prompt, key):
-    # ⚠️ CORREGIR ESTA LÍNEA - usar el modelo que SÍ funciona
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{WORKING_MODEL}:generateContent"
-    
-    headers = {
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "contents": [
-            {
-                "parts": [
-                    {"text": prompt}
-                ]
-            }
-        ]
+from config import WORKING_MODEL, GEMINI_BASE_URL, GEMINI_TIMEOUT, GEMINI_MAX_CONNECTIONS
+from .keys import key_scheduler, KeyState
+from .hedge import hedge_policy
+from .coalesce import single_flight
+from latencias import histogramas
+from logger import get_logger
+
+log = get_logger(__name__)
+
+BASE_URL = GEMINI_BASE_URL
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "topP": 0.8,
+    "topK": 40,
+}
+
+ALL_KEYS_FAILED = "❌ Todas las claves agotadas. Intente más tarde."
+
+
+class GeminiError(Exception):
+    """Error devuelto por Gemini (HTTP no 200, respuesta vacía o fallo de red)."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+_RETRY_DELAY_RE = re.compile(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"')
+
+
+def _parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Segundos de espera sugeridos por Gemini (header Retry-After o retryDelay del cuerpo)."""
+    header = response.headers.get("retry-after")
+    if header and header.replace(".", "", 1).isdigit():
+        return float(header)
+    match = _RETRY_DELAY_RE.search(response.text)
+    return float(match.group(1)) if match else None
+
+
+# ✅ POOL HTTP COMPARTIDO
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Devuelve el AsyncClient del proceso, creándolo la primera vez."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(GEMINI_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=GEMINI_MAX_CONNECTIONS,
+                max_keepalive_connections=GEMINI_MAX_CONNECTIONS,
+                keepalive_expiry=60.0,
+            ),
+            headers={"Content-Type": "application/json"},
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Cierra el pool HTTP (se llama desde el lifespan de la app)."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+def _build_payload(prompt: str) -> dict:
+    return {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": GENERATION_CONFIG,
     }
 
-    # 🔍 Log de entrada
-    print(f"🔗 URL final: {url}?key={key[:10]}...")
-    print(f"🔧 Modelo: {WORKING_MODEL}")
-    print(f"📩 Prompt: {prompt}")
-    print(f"📦 Payload: {payload}")
 
+def _extract_text(data: dict) -> str:
+    content = (data.get("candidates") or [{}])[0].get("content", {})
+    parts = content.get("parts", [])
+    if not parts or "text" not in parts[0]:
+        raise GeminiError("Respuesta vacía de Gemini")
+    return "".join(p.get("text", "") for p in parts).strip()
+
+
+async def generate(prompt: str, key: str) -> str:
+    """Hace una única llamada generateContent con la clave indicada; lanza GeminiError si falla."""
+    url = f"{BASE_URL}/{WORKING_MODEL}:generateContent"
+    try:
+        response = await get_http_client().post(url, params={"key": key}, json=_build_payload(prompt))
+    except httpx.HTTPError as e:
+        raise GeminiError(f"Error al conectar con Gemini: {type(e).__name__}") from e
+
+    if response.status_code != 200:
+        raise GeminiError(
+            f"Error HTTP {response.status_code}: {response.text[:200]}",
+            response.status_code,
+            _parse_retry_after(response) if response.status_code == 429 else None,
+        )
+
+    return _extract_text(response.json())
+
+
+async def stream_generate(prompt: str, key: str) -> AsyncIterator[str]:
+    """Versión streaming de generate (streamGenerateContent con alt=sse): va entregando fragmentos de texto."""
+    url = f"{BASE_URL}/{WORKING_MODEL}:streamGenerateContent"
+    try:
+        async with get_http_client().stream("POST", url, params={"key": key, "alt": "sse"}, json=_build_payload(prompt)) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise GeminiError(
+                    f"Error HTTP {response.status_code}: {response.text[:200]}",
+                    response.status_code,
+                    _parse_retry_after(response) if response.status_code == 429 else None,
+                )
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[5:].strip() or "{}")
+                parts = (data.get("candidates") or [{}])[0].get("content", {}).get("parts", [])
+                for part in parts:
+                    if part.get("text"):
+                        yield part["text"]
+    except httpx.HTTPError as e:
+        raise GeminiError(f"Error al conectar con Gemini: {type(e).__name__}") from e
+
+
+async def probe_key(key: str) -> Optional[int]:
+    """Chequeo de salud de una clave: GET de los metadatos del modelo (no genera ni consume cuota de tokens).
+
+    Devuelve el código HTTP, o None si no se pudo conectar.
+    """
+    try:
+        response = await get_http_client().get(f"{BASE_URL}/{WORKING_MODEL}", params={"key": key}, timeout=5.0)
+    except httpx.HTTPError:
+        return None
+    return response.status_code
+
+
+async def call_gemini(prompt, key):
+    """Compatibilidad: devuelve el texto o un mensaje de error en vez de lanzar."""
     try:
-        response = requests.post(f"{url}?key={key}", headers=headers, json=payload, timeout=30)
-        print(f"📥 Status: {response.status_code}")
-        
-        if response.status_code != 200:
-            print(f"❌ Error HTTP {response.status_code}: {response.text[:200]}")
-            return f"❌ Error HTTP {response.status_code}"
-            
-        data = response.json()
-        print(f"✅ Respuesta exitosa")
-
-        # 🧠 Validación defensiva
-        content = data.get("candidates", [{}])[0].get("content", {})
-        parts = content.get("parts", [])
-        if not parts or "text" not in parts[0]:
-            return "La respuesta de Gemini está vacía o mal formada."
-
-        text_response = parts[0]["text"]
-        print(f"💬 Respuesta: {text_response}")
-        return text_response
-
-    except requests.exceptions.HTTPError as http_err:
-        return f"❌ Error HTTP {http_err.response.status_code}: {http_err.response.text}"
-    except Exception as e:
-        return f"❌ Error al conectar con Gemini: {str(e)}"
-
-# 🔁 Función de rotación de claves
-def call_gemini_with_rotation(prompt):
-    print(f"\n🎯 INICIANDO ROTACIÓN DE CLAVES")
-    print(f"🔧 Modelo configurado: {WORKING_MODEL}")
-    print(f"🔑 Claves disponibles: {len(API_KEYS)}")
-    
-    for key in API_KEYS:
-        print("=" * 60)
-        print(f"Probando clave: {key[:10]}...")
+        return await generate(prompt, key)
+    except GeminiError as e:
+        return f"❌ {e}"
+
+
+def _outcome(error: GeminiError) -> str:
+    """Etiqueta del resultado de una llamada fallida: el código HTTP o "error" (red, respuesta vacía)."""
+    return str(error.status_code) if error.status_code else "error"
+
+
+def _release_failure(state: KeyState, error: GeminiError):
+    key_scheduler.release_failure(state, error.status_code, error.retry_after)
+    if error.status_code == 429:
+        log.warning("⚠️ Clave %s agotada, en enfriamiento", state.index + 1)
+    elif error.status_code in (401, 403):
+        log.error("❌ Clave %s no autorizada, descartada", state.index + 1)
+    else:
+        log.error("❌ Clave %s error: %s", state.index + 1, str(error)[:100])
+
+
+async def _call_on_key(prompt: str, state: KeyState) -> str:
+    """Llama a Gemini con una clave ya reservada y devuelve el cupo al planificador."""
+    start = time.time()
+    try:
+        answer = await generate(prompt, state.key)
+    except GeminiError as e:
+        histogramas.observe("gemini_call_seconds", time.time() - start, key=state.label, outcome=_outcome(e))
+        _release_failure(state, e)
+        raise
+    except BaseException:
+        key_scheduler.release_cancelled(state)
+        raise
+    latency = time.time() - start
+    histogramas.observe("gemini_call_seconds", latency, key=state.label, outcome="ok")
+    key_scheduler.release_success(state, latency)
+    hedge_policy.observe(latency)
+    return answer
+
+
+async def _hedged_call(prompt: str, primary_state: KeyState, tried: list) -> str:
+    """Carrera entre la clave primaria y, si se retrasa, una segunda clave sana: gana la primera respuesta."""
+    primary = asyncio.ensure_future(_call_on_key(prompt, primary_state))
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=hedge_policy.deadline())
+        if done:
+            return primary.result()
+
+        hedge_state = key_scheduler.acquire(exclude=tried)
+        if hedge_state is None:
+            return await primary
+        if not hedge_policy.try_spend():
+            key_scheduler.release_cancelled(hedge_state)
+            return await primary
+        tried.append(hedge_state)
+        hedge = asyncio.ensure_future(_call_on_key(prompt, hedge_state))
+        pending.add(hedge)
+
+        last_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        hedge_policy.record_win()
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+# 🔁 Rotación de claves guiada por su salud
+async def _call_with_rotation(prompt: str) -> str:
+    tried = []
+    while True:
+        state = key_scheduler.acquire(exclude=tried)
+        if state is None:
+            break
+        tried.append(state)
+        hedge_policy.record_primary()
+        try:
+            if hedge_policy.enabled:
+                return await _hedged_call(prompt, state, tried)
+            return await _call_on_key(prompt, state)
+        except GeminiError:
+            continue
+
+    return ALL_KEYS_FAILED
+
+
+async def _stream_with_rotation(prompt: str) -> AsyncIterator[str]:
+    """Como _call_with_rotation pero en streaming (sin hedging).
+
+    Sólo se pasa a otra clave si la actual falla antes del primer fragmento;
+    una vez empezada la respuesta no se puede reiniciar en otra clave y se
+    propaga el GeminiError.
+    """
+    tried = []
+    while True:
+        state = key_scheduler.acquire(exclude=tried)
+        if state is None:
+            break
+        tried.append(state)
         start = time.time()
-        response = call_gemini(prompt, key)
-        duration = time.time() - start
-        print(f"⏱️ Duración: {duration:.2f} segundos")
-        
-        # Verificar si la respuesta es exitosa
-        if not any(err in response for err in ["❌ Error", "Error HTTP", "403", "404", "429", "Quota exceeded"]):
-            print(f"✅ ✅ ✅ CLAVE ACEPTADA: {key[:10]}...")
-            return response
-        else:
-            print(f"❌ Clave rechazada: {key[:10]}... - {response[:100]}")
-        print("=" * 60)
-
-    print("❌ Ninguna clave fue aceptada por Gemini.")
-    return "Todas las claves están agotadas o no autorizadas. Verificá la configuración."
+        started = False
+        try:
+            async for chunk in stream_generate(prompt, state.key):
+                started = True
+                yield chunk
+        except GeminiError as e:
+            histogramas.observe("gemini_call_seconds", time.time() - start, key=state.label, outcome=_outcome(e), stream="1")
+            _release_failure(state, e)
+            if started:
+                raise
+            continue
+        except BaseException:
+            key_scheduler.release_cancelled(state)
+            raise
+        histogramas.observe("gemini_call_seconds", time.time() - start, key=state.label, outcome="ok", stream="1")
+        key_scheduler.release_success(state, time.time() - start)
+        if started:
+            return
+
+    yield ALL_KEYS_FAILED
+
+
+async def call_gemini_with_rotation(prompt: str) -> str:
+    """Respuesta de Gemini; los pedidos simultáneos con el mismo prompt comparten una sola llamada."""
+    return await single_flight.call(prompt, _call_with_rotation)
+
+
+async def stream_gemini_with_rotation(prompt: str) -> AsyncIterator[str]:
+    """Respuesta en streaming; los pedidos simultáneos con el mismo prompt siguen la misma llamada."""
+    async for chunk in single_flight.stream(prompt, _stream_with_rotation):
+        yield chunk
+
 
 # Test opcional
 if __name__ == "__main__":
-    test_response = call_gemini_with_rotation("Responde solo con OK")
-    print(f"\n🎯 TEST FINAL: {test_response}")
\ No newline at end of file
+    import asyncio
+
+    async def _test():
+        try:
+            return await call_gemini_with_rotation("Responde solo con OK")
+        finally:
+            await close_http_client()
+
+    print(f"\n🎯 TEST FINAL: {asyncio.run(_test())}")
@@ -0,0 +1,132 @@
+"""Single-flight: pedidos simultáneos con el mismo prompt esperan una sola llamada a Gemini y comparten su respuesta."""
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import GEMINI_COALESCE_ENABLED
+
+
+class _Vuelo:
+    """Una llamada en curso: los fragmentos que ya llegaron y cuántos pedidos la están esperando."""
+
+    def __init__(self):
+        self.partes: List[str] = []
+        self.terminado = False
+        self.error: Optional[BaseException] = None
+        self.aviso = asyncio.Event()
+        self.esperando = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def avisar(self):
+        self.aviso.set()
+        self.aviso = asyncio.Event()
+
+
+class SingleFlight:
+    """Agrupa por hash del prompt las llamadas que están en vuelo al mismo tiempo.
+
+    - El primer pedido lanza la llamada en una tarea aparte; los que llegan mientras tanto se
+      suman a ella (y en streaming reciben primero los fragmentos que ya llegaron).
+    - Si un pedido se cancela (el cliente cortó) la llamada sigue para los demás; sólo se
+      cancela cuando no queda nadie esperando.
+    - Un error se propaga a todos los que esperaban; el próximo pedido vuelve a llamar.
+    - No es un cache: al terminar la llamada se olvida (para eso está el cache de respuestas).
+
+    El agrupamiento es por proceso: con varios workers cada uno hace a lo sumo una llamada por prompt.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._vuelos: Dict[Tuple[str, str], _Vuelo] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    @staticmethod
+    def clave(modo: str, prompt: str) -> Tuple[str, str]:
+        return modo, hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    async def _producir(self, vuelo: _Vuelo, fuente: AsyncIterator[str]):
+        try:
+            async for parte in fuente:
+                vuelo.partes.append(parte)
+                vuelo.avisar()
+        except BaseException as e:
+            vuelo.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            vuelo.terminado = True
+            vuelo.avisar()
+
+    async def _seguir(self, clave: Tuple[str, str], vuelo: _Vuelo) -> AsyncIterator[str]:
+        vuelo.esperando += 1
+        self.max_waiters = max(self.max_waiters, vuelo.esperando)
+        try:
+            i = 0
+            while True:
+                aviso = vuelo.aviso
+                while i < len(vuelo.partes):
+                    yield vuelo.partes[i]
+                    i += 1
+                if vuelo.terminado:
+                    if vuelo.error is not None:
+                        raise vuelo.error
+                    return
+                await aviso.wait()
+        finally:
+            vuelo.esperando -= 1
+            if self._vuelos.get(clave) is vuelo and (vuelo.terminado or vuelo.esperando == 0):
+                del self._vuelos[clave]
+            if vuelo.esperando == 0 and not vuelo.terminado:
+                vuelo.task.cancel()
+
+    def _unirse(self, modo: str, prompt: str, fuente: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        clave = self.clave(modo, prompt)
+        vuelo = self._vuelos.get(clave)
+        if vuelo is None or vuelo.terminado:
+            vuelo = _Vuelo()
+            vuelo.task = asyncio.ensure_future(self._producir(vuelo, fuente()))
+            self._vuelos[clave] = vuelo
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return self._seguir(clave, vuelo)
+
+    async def call(self, prompt: str, llamar: Callable[[str], Awaitable[str]]) -> str:
+        """`await llamar(prompt)` compartido entre los pedidos simultáneos con el mismo prompt."""
+        if not self.enabled:
+            return await llamar(prompt)
+
+        async def fuente() -> AsyncIterator[str]:
+            yield await llamar(prompt)
+
+        return "".join([parte async for parte in self._unirse("call", prompt, fuente)])
+
+    async def stream(self, prompt: str, llamar: Callable[[str], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Como `call` pero fragmento a fragmento: todos reciben la respuesta completa, en orden."""
+        if not self.enabled:
+            async for parte in llamar(prompt):
+                yield parte
+            return
+        seguidor = self._unirse("stream", prompt, lambda: llamar(prompt))
+        try:
+            async for parte in seguidor:
+                yield parte
+        finally:
+            # Si el cliente corta, se deja de esperar ya (no cuando el recolector cierre el generador)
+            await seguidor.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        pedidos = self.calls + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._vuelos),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "saved_ratio": round(self.coalesced / pedidos, 3) if pedidos else 0.0,
+            "max_waiters": self.max_waiters,
+        }
+
+
+single_flight = SingleFlight(GEMINI_COALESCE_ENABLED)
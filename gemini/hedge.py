@@ -0,0 +1,72 @@
+"""Política de hedging: si la primera clave tarda más que el percentil configurado, se lanza una segunda."""
+from collections import deque
+from typing import Dict, Any
+
+from config import (
+    GEMINI_HEDGE_ENABLED,
+    GEMINI_HEDGE_PERCENTILE,
+    GEMINI_HEDGE_MIN_DELAY,
+    GEMINI_HEDGE_BUDGET_PERCENT,
+)
+
+
+class HedgePolicy:
+    """Decide cuándo conviene duplicar una llamada y lleva la cuenta del presupuesto gastado."""
+
+    MIN_SAMPLES = 20
+
+    def __init__(self, enabled: bool, percentile: float, min_delay: float, budget_percent: float, window: int = 200):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.budget_percent = budget_percent
+        self.latencies = deque(maxlen=window)
+        self.primary_calls = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+
+    def observe(self, latency: float):
+        """Registra la latencia de una llamada exitosa."""
+        self.latencies.append(latency)
+
+    def deadline(self) -> float:
+        """Segundos a esperar a la clave primaria antes de lanzar el hedge."""
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return self.min_delay
+        ordered = sorted(self.latencies)
+        idx = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+        return max(ordered[idx], self.min_delay)
+
+    def record_primary(self):
+        self.primary_calls += 1
+
+    def try_spend(self) -> bool:
+        """Reserva un hedge si no supera el presupuesto (% de llamadas primarias)."""
+        if (self.hedges_sent + 1) * 100 > self.primary_calls * self.budget_percent:
+            self.budget_denied += 1
+            return False
+        self.hedges_sent += 1
+        return True
+
+    def record_win(self):
+        self.hedge_wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "deadline_seconds": round(self.deadline(), 3),
+            "primary_calls": self.primary_calls,
+            "hedges_sent": self.hedges_sent,
+            "hedge_wins": self.hedge_wins,
+            "budget_denied": self.budget_denied,
+            "budget_percent": self.budget_percent,
+        }
+
+
+hedge_policy = HedgePolicy(
+    GEMINI_HEDGE_ENABLED,
+    GEMINI_HEDGE_PERCENTILE,
+    GEMINI_HEDGE_MIN_DELAY,
+    GEMINI_HEDGE_BUDGET_PERCENT,
+)
@@ -0,0 +1,142 @@
+"""Planificador de claves Gemini: elige la clave más sana en vez de rotar siempre desde la primera."""
+import time
+from typing import Optional, List, Dict, Any, Iterable
+
+from config import API_KEYS, GEMINI_COOLDOWN_SECONDS, GEMINI_MAX_COOLDOWN_SECONDS
+from shared_state import shared_state
+
+
+class KeyState:
+    """Estado de salud de una clave: enfriamiento, baja definitiva y llamadas en curso."""
+
+    def __init__(self, index: int, key: str):
+        self.index = index
+        self.key = key
+        self.cooldown_until = 0.0
+        self.dead = False
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_429 = 0
+        self.last_status: Optional[int] = None
+        self.last_latency: Optional[float] = None
+
+    @property
+    def label(self) -> str:
+        return f"key_{self.index + 1}"
+
+    def available(self, now: float) -> bool:
+        return not self.dead and now >= self.cooldown_until
+
+    def as_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "key": f"{self.key[:4]}…" if self.key else "",
+            "state": "dead" if self.dead else ("cooldown" if now < self.cooldown_until else "ok"),
+            "cooldown_remaining": round(max(self.cooldown_until - now, 0.0), 1),
+            "in_flight": self.in_flight,
+            "successes": self.successes,
+            "failures": self.failures,
+            "last_status": self.last_status,
+            "last_latency": round(self.last_latency, 3) if self.last_latency is not None else None,
+        }
+
+
+class KeyScheduler:
+    """Reparte las llamadas entre claves sanas (menos carga primero, round-robin en empates).
+
+    - 429 / cuota agotada: la clave entra en enfriamiento (Retry-After de Gemini o backoff exponencial).
+    - 401 / 403: la clave se marca muerta y no se vuelve a usar hasta reiniciar.
+    - Otros errores: enfriamiento corto para no martillar una clave con problemas.
+
+    Con `store` (modo multi-worker) enfriamientos y bajas se publican y se leen del store
+    compartido; la carga en curso (in_flight) sigue siendo de cada proceso. El store publica y
+    relee la tabla en su tarea de segundo plano: acquire() nunca toca SQLite.
+    """
+
+    TRANSIENT_COOLDOWN = 5.0
+
+    def __init__(self, keys: Iterable[str], store=None):
+        self.keys: List[KeyState] = [KeyState(i, k) for i, k in enumerate(keys)]
+        self._next = 0
+        self.store = store
+
+    def _sync(self):
+        """Trae del store (en memoria) los enfriamientos y bajas que publicaron otros workers."""
+        shared = self.store.load_keys()
+        for state in self.keys:
+            if state.label in shared:
+                state.cooldown_until, state.dead, state.consecutive_429 = shared[state.label]
+
+    def _publish(self, state: KeyState):
+        if self.store is not None:
+            self.store.save_key(state.label, state.cooldown_until, state.dead, state.consecutive_429)
+
+    def acquire(self, exclude: Iterable[KeyState] = ()) -> Optional[KeyState]:
+        """Reserva la clave más sana que no esté en `exclude`; None si no queda ninguna."""
+        if self.store is not None:
+            self._sync()
+        now = time.time()
+        excluded = {s.index for s in exclude}
+        n = len(self.keys)
+        candidates = [
+            self.keys[(self._next + offset) % n]
+            for offset in range(n)
+            if self.keys[(self._next + offset) % n].index not in excluded
+        ]
+        candidates = [s for s in candidates if s.available(now)]
+        if not candidates:
+            return None
+
+        # min() es estable: a igual carga gana la siguiente en el orden round-robin
+        chosen = min(candidates, key=lambda s: (s.in_flight, s.consecutive_429))
+        self._next = (chosen.index + 1) % n
+        chosen.in_flight += 1
+        return chosen
+
+    def release_success(self, state: KeyState, latency: float):
+        state.in_flight = max(state.in_flight - 1, 0)
+        state.successes += 1
+        state.last_status = 200
+        state.last_latency = latency
+        if state.consecutive_429:
+            state.consecutive_429 = 0
+            self._publish(state)
+
+    def release_failure(self, state: KeyState, status_code: Optional[int], retry_after: Optional[float] = None):
+        state.in_flight = max(state.in_flight - 1, 0)
+        state.failures += 1
+        state.last_status = status_code
+        now = time.time()
+
+        if status_code in (401, 403):
+            state.dead = True
+        elif status_code == 429:
+            state.consecutive_429 += 1
+            backoff = GEMINI_COOLDOWN_SECONDS * (2 ** (state.consecutive_429 - 1))
+            state.cooldown_until = now + min(retry_after or backoff, GEMINI_MAX_COOLDOWN_SECONDS)
+        else:
+            state.cooldown_until = now + self.TRANSIENT_COOLDOWN
+        self._publish(state)
+
+    def release_cancelled(self, state: KeyState):
+        """La llamada se abandonó sin resultado (p. ej. cancelada): sólo libera el cupo."""
+        state.in_flight = max(state.in_flight - 1, 0)
+
+    def discard(self, state: KeyState, status_code: Optional[int]):
+        """Baja detectada fuera de una llamada (el chequeo de salud recibió 401/403)."""
+        state.dead = True
+        state.last_status = status_code
+        self._publish(state)
+
+    def healthy_count(self) -> int:
+        if self.store is not None:
+            self._sync()
+        now = time.time()
+        return sum(1 for s in self.keys if s.available(now))
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {s.label: s.as_dict(now) for s in self.keys}
+
+
+key_scheduler = KeyScheduler(API_KEYS, shared_state if shared_state.enabled else None)
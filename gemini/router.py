@@ -7,5 +7,5 @@ router = APIRouter()
 async def chat(request: Request):
     data = await request.json()
     prompt = data.get("message", "")
-    response = call_gemini_with_rotation(prompt)
+    response = await call_gemini_with_rotation(prompt)
     return {"response": response}
\ No newline at end of file
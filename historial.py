@@ -0,0 +1,114 @@
+"""Historial de conversación por sesión: últimos turnos en memoria (acotado) y la tabla logs como respaldo."""
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from config import HISTORY_TURNS, HISTORY_MAX_SESSIONS, HISTORY_TTL
+from db import logs_db
+from shared_state import shared_state
+
+Turno = Tuple[str, str]  # (mensaje del usuario, respuesta del bot)
+
+
+class HistorialSesiones:
+    """Ring buffer de los últimos `max_turnos` turnos de cada sesión activa.
+
+    - Una sesión que no está en memoria se carga de logs con el índice (session_id, id).
+    - Se guardan a lo sumo `max_sesiones` sesiones; al pasarse se descarta la usada hace más tiempo.
+    - Sin session_id no hay historial: nunca se mezclan turnos de usuarios distintos.
+
+    Con `store` (varios workers) los turnos van al cache compartido, así cualquier worker ve el
+    historial completo de la sesión.
+    """
+
+    def __init__(self, max_turnos: int, max_sesiones: int, store=None, ttl: float = 3600):
+        self.max_turnos = max_turnos
+        self.max_sesiones = max_sesiones
+        self._sesiones: "OrderedDict[str, Deque[Turno]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._compartido = store.cache("historial", ttl, max_sesiones) if store is not None else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _cargar(self, session_id: str) -> List[Turno]:
+        rows = logs_db.query(
+            "SELECT user_message, bot_response FROM logs WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, self.max_turnos),
+        )
+        return [(r["user_message"], r["bot_response"]) for r in reversed(rows)]
+
+    def turnos(self, session_id: Optional[str]) -> List[Turno]:
+        """Turnos de la sesión, del más viejo al más nuevo."""
+        if not session_id:
+            return []
+        if self._compartido is not None:
+            guardados = self._compartido.get(session_id)
+            if guardados is None:
+                cargados = self._cargar(session_id)
+                # Si otro worker la guardó mientras se leía logs, gana la suya (puede tener turnos más nuevos)
+                guardados = self._compartido.update(session_id, lambda actual: cargados if actual is None else None)
+            return [tuple(t) for t in guardados]
+
+        with self._lock:
+            buffer = self._sesiones.get(session_id)
+            if buffer is not None:
+                self._sesiones.move_to_end(session_id)
+                self.hits += 1
+                return list(buffer)
+        turnos = self._cargar(session_id)
+        with self._lock:
+            buffer = self._sesiones.setdefault(session_id, deque(turnos, maxlen=self.max_turnos))
+            self._sesiones.move_to_end(session_id)
+            self.misses += 1
+            while len(self._sesiones) > self.max_sesiones:
+                self._sesiones.popitem(last=False)
+                self.evictions += 1
+            return list(buffer)
+
+    def agregar(self, session_id: Optional[str], user_message: str, bot_response: str):
+        """Suma un turno a la sesión si está en memoria; si no, se cargará de logs cuando se pida."""
+        if not session_id:
+            return
+        if self._compartido is not None:
+            # Leer, sumar y escribir en una transacción: dos turnos simultáneos de la sesión no se pisan
+            turno = [user_message, bot_response]
+            self._compartido.update(
+                session_id, lambda guardados: None if guardados is None else (guardados + [turno])[-self.max_turnos:]
+            )
+            return
+        with self._lock:
+            buffer = self._sesiones.get(session_id)
+            if buffer is not None:
+                buffer.append((user_message, bot_response))
+
+    def mensajes(self, session_id: Optional[str], limite: int = 3) -> List[str]:
+        """Últimos mensajes del usuario (lo que va al prompt como "Historial reciente")."""
+        return [mensaje for mensaje, _ in self.turnos(session_id)[-limite:]] if limite > 0 else []
+
+    def ultima_respuesta(self, session_id: Optional[str]) -> Optional[str]:
+        turnos = self.turnos(session_id)
+        return turnos[-1][1] if turnos else None
+
+    def clear(self):
+        with self._lock:
+            self._sesiones.clear()
+        if self._compartido is not None:
+            self._compartido.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        if self._compartido is not None:
+            return {"max_turns": self.max_turnos, **self._compartido.stats()}
+        with self._lock:
+            return {
+                "shared": False,
+                "sessions": len(self._sesiones),
+                "max_sessions": self.max_sesiones,
+                "max_turns": self.max_turnos,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+historial = HistorialSesiones(HISTORY_TURNS, HISTORY_MAX_SESSIONS, shared_state if shared_state.enabled else None, HISTORY_TTL)
@@ -0,0 +1,404 @@
+"""Ingesta de catálogos a la tabla properties: lectura en streaming (JSON, JSONL, CSV, XLSX),
+normalización de campos y tipos, y sincronización incremental (sólo lo que cambió) con reporte
+de errores por fila.
+
+Uso:  python ingesta.py properties.json [--lote 1000] [--sin-borrar]
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import hashlib
+import argparse
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from db import properties_db
+from texto import normalizar
+
+COLUMNAS = (
+    "id", "title", "neighborhood", "price", "rooms", "sqm", "description", "operacion", "tipo",
+    "direccion", "antiguedad", "estado", "orientacion", "piso", "expensas", "amenities", "cochera",
+    "balcon", "pileta", "acepta_mascotas", "aire_acondicionado", "info_multimedia",
+)
+NUMERICAS = {"price": float, "sqm": float, "expensas": float, "rooms": int, "antiguedad": int}
+
+# Nombres alternativos que usan las distintas fuentes (ya normalizados: minúsculas, sin acentos, "_")
+ALIAS = {
+    "id_temporal": "id",
+    "titulo": "title",
+    "barrio": "neighborhood",
+    "precio": "price",
+    "ambientes": "rooms",
+    "metros": "sqm",
+    "m2": "sqm",
+    "superficie": "sqm",
+    "descripcion": "description",
+    "mascotas": "acepta_mascotas",
+    "aire": "aire_acondicionado",
+    "multimedia": "info_multimedia",
+}
+
+COLUMNAS_DB = COLUMNAS + ("neighborhood_norm", "operacion_norm", "tipo_norm", "row_hash")
+UPSERT_PROPERTY = (
+    f"INSERT INTO properties ({', '.join(COLUMNAS_DB)}) VALUES ({', '.join('?' for _ in COLUMNAS_DB)}) "
+    f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in COLUMNAS_DB[1:])}"
+)
+
+MAX_ERRORES_DETALLE = 1000
+
+
+# --- Normalización ---
+
+@lru_cache(maxsize=1024)
+def _columna(nombre: Any) -> str:
+    clave = normalizar(nombre).replace(" ", "_")
+    return ALIAS.get(clave, clave)
+
+
+def _numero(valor: Any, tipo=float):
+    """280000 / '280.000' / '$ 1.234,5' / '68,5' -> número; None si viene vacío; ValueError si no es un número."""
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)):
+        return tipo(valor)
+    texto = re.sub(r"[^\d,.\-]", "", str(valor))
+    if not texto:
+        if str(valor).strip():
+            raise ValueError(f"no es un número: {valor!r}")
+        return None
+    if "," in texto:
+        # Formato local: el punto separa miles y la coma decimales
+        texto = texto.replace(".", "").replace(",", ".")
+    elif texto.count(".") > 1 or re.fullmatch(r"-?\d{1,3}(\.\d{3})+", texto):
+        texto = texto.replace(".", "")
+    numero = float(texto)
+    return int(numero) if tipo is int else numero
+
+
+def normalizar_propiedad(raw: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Registro de cualquier fuente -> tupla en el orden de COLUMNAS_DB, sin row_hash (ValueError si no se puede)."""
+    if not isinstance(raw, dict):
+        raise ValueError(f"se esperaba un objeto, llegó {type(raw).__name__}")
+    campos: Dict[str, Any] = {}
+    for nombre, valor in raw.items():
+        columna = _columna(nombre)
+        if columna in COLUMNAS and campos.get(columna) in (None, ""):
+            campos[columna] = valor
+
+    fila = {}
+    for columna in COLUMNAS[1:]:
+        valor = campos.get(columna)
+        if columna in NUMERICAS:
+            try:
+                fila[columna] = _numero(valor, NUMERICAS[columna])
+            except ValueError:
+                raise ValueError(f"{columna}: no es un número ({valor!r})") from None
+        else:
+            fila[columna] = str(valor).strip() if valor is not None else ""
+
+    if not fila["title"] and not fila["neighborhood"]:
+        raise ValueError("sin título ni barrio")
+
+    identificador = campos.get("id")
+    if identificador in (None, ""):
+        # Sin id en la fuente: uno estable a partir del contenido, para que el upsert no duplique
+        identificador = "prop_" + hashlib.sha1(json.dumps(fila, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+    fila["id"] = str(identificador).strip()
+
+    return tuple(fila[c] for c in COLUMNAS) + (
+        normalizar(fila["neighborhood"]), normalizar(fila["operacion"]), normalizar(fila["tipo"]),
+    )
+
+
+# --- Lectores en streaming: devuelven un dict por propiedad ---
+
+_SEPARADORES = re.compile(r"[\s,]*")
+
+
+# Tamaño máximo de un objeto del array: más que esto es un objeto mal formado que nunca va a cerrar
+MAX_OBJETO_JSON = 16 << 20
+
+
+def leer_json(path: str, chunk_size: int = 1 << 16, max_objeto: int = MAX_OBJETO_JSON) -> Iterator[Dict[str, Any]]:
+    """Recorre un array JSON de objetos sin cargarlo entero: en memoria queda un bloque y un objeto.
+
+    Un objeto que no se puede decodificar aunque ocupe más de `max_objeto` caracteres es un error
+    (ValueError), en vez de seguir sumando el resto del archivo al buffer.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8-sig") as f:
+        buffer, pos, fin = f.read(chunk_size), 0, False
+        pos = _SEPARADORES.match(buffer, pos).end()
+        if buffer[pos:pos + 1] != "[":
+            raise ValueError(f"{path}: se esperaba un array JSON")
+        pos += 1
+        while True:
+            pos = _SEPARADORES.match(buffer, pos).end()
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            try:
+                if pos >= len(buffer):
+                    raise json.JSONDecodeError("fin del bloque", buffer, pos)
+                objeto, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if fin:
+                    raise ValueError(f"{path}: JSON inválido o incompleto") from None
+                if len(buffer) - pos > max_objeto:
+                    raise ValueError(f"{path}: JSON inválido (objeto de más de {max_objeto} caracteres sin cerrar)") from None
+                chunk = f.read(chunk_size)
+                fin = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield objeto
+
+
+def leer_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for linea in f:
+            if linea.strip():
+                yield json.loads(linea)
+
+
+def leer_csv(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def leer_xlsx(path: str) -> Iterator[Dict[str, Any]]:
+    """Primera hoja, con la primera fila como encabezado; read_only lee las filas de a una."""
+    from openpyxl import load_workbook
+
+    libro = load_workbook(path, read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        encabezado = next(filas, None) or ()
+        for fila in filas:
+            if any(v is not None for v in fila):
+                yield {str(k): v for k, v in zip(encabezado, fila) if k is not None}
+    finally:
+        libro.close()
+
+
+LECTORES = {".json": leer_json, ".jsonl": leer_jsonl, ".ndjson": leer_jsonl, ".csv": leer_csv, ".xlsx": leer_xlsx}
+
+
+def leer_fuente(path: str) -> Iterator[Dict[str, Any]]:
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in LECTORES:
+        raise ValueError(f"formato no soportado: {extension} (se aceptan {', '.join(LECTORES)})")
+    return LECTORES[extension](path)
+
+
+def hash_archivo(path: str) -> str:
+    """sha1 del archivo leído por bloques (el mismo hash que usa el catálogo)."""
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(bloque)
+    return sha1.hexdigest()
+
+
+# --- Carga ---
+
+def hash_registro(raw: Dict[str, Any]) -> str:
+    """Huella del registro tal como viene de la fuente: si no cambió, no hace falta normalizarlo ni escribirlo."""
+    return hashlib.sha1(json.dumps(raw, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _id_fuente(raw: Dict[str, Any]) -> Optional[str]:
+    for nombre, valor in raw.items():
+        if _columna(nombre) == "id" and valor not in (None, ""):
+            return str(valor).strip()
+    return None
+
+
+class ResultadoIngesta:
+    """Contadores de una sincronización y detalle (acotado) de las filas rechazadas."""
+
+    def __init__(self):
+        self.leidas = 0
+        self.insertadas = 0
+        self.actualizadas = 0
+        self.sin_cambios = 0
+        self.borradas = 0
+        self.lotes = 0
+        self.errores = 0
+        self.detalle_errores: List[Dict[str, Any]] = []
+        self.version = 0
+        self.fatal: Optional[str] = None
+        self.segundos = 0.0
+
+    @property
+    def cargadas(self) -> int:
+        return self.insertadas + self.actualizadas
+
+    @property
+    def cambios(self) -> int:
+        return self.insertadas + self.actualizadas + self.borradas
+
+    def error(self, fila: int, raw: Any, mensaje: str):
+        self.errores += 1
+        if len(self.detalle_errores) < MAX_ERRORES_DETALLE:
+            identificador = _id_fuente(raw) if isinstance(raw, dict) else None
+            self.detalle_errores.append({"fila": fila, "id": identificador, "error": mensaje})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "leidas": self.leidas,
+            "insertadas": self.insertadas,
+            "actualizadas": self.actualizadas,
+            "sin_cambios": self.sin_cambios,
+            "borradas": self.borradas,
+            "errores": self.errores,
+            "lotes": self.lotes,
+            "version": self.version,
+            "fatal": self.fatal,
+            "segundos": round(self.segundos, 3),
+            "detalle_errores": self.detalle_errores[:20],
+        }
+
+
+def hash_cargado() -> Optional[str]:
+    """Hash de la fuente que se cargó por última vez (tabla meta), o None."""
+    row = properties_db.query_one("SELECT value FROM meta WHERE key = 'catalog_hash'")
+    return row[0] if row is not None else None
+
+
+def version_catalogo() -> int:
+    """Versión de los datos de properties: aumenta con cada sincronización que cambió algo.
+
+    Vive en la base (no en memoria) para que todos los workers vean la misma.
+    """
+    row = properties_db.query_one("SELECT value FROM meta WHERE key = 'catalog_version'")
+    return int(row[0]) if row is not None else 0
+
+
+def ingestar(registros: Iterable[Dict[str, Any]], lote: int = 1000, borrar_faltantes: bool = True,
+             content_hash: Optional[str] = None) -> ResultadoIngesta:
+    """Sincroniza la tabla properties con la fuente en una sola transacción.
+
+    Por cada lote de `lote` registros se leen las huellas guardadas (row_hash) de esos ids y sólo
+    se normalizan y escriben los nuevos o modificados. Con borrar_faltantes se borran los que ya
+    no vienen (los ids vistos se anotan en una tabla temporal, no en memoria). Si algo cambió
+    aumenta catalog_version. Un error de lectura deshace la sincronización completa.
+    """
+    resultado = ResultadoIngesta()
+    inicio = time.perf_counter()
+    conn = properties_db.connection()
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS ingesta_ids (id TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.ingesta_ids")
+
+    pendientes: List[Tuple[int, Dict[str, Any], str, Optional[str]]] = []
+
+    def aplicar(tx):
+        ids = [p[3] for p in pendientes if p[3] is not None]
+        guardadas = {}
+        for i in range(0, len(ids), 500):  # de a 500: límite de parámetros de SQLite viejos
+            tramo = ids[i:i + 500]
+            sql = f"SELECT id, row_hash FROM properties WHERE id IN ({', '.join('?' * len(tramo))})"
+            guardadas.update(tx.execute(sql, tramo).fetchall())
+
+        escribir, vistos = [], []
+        for fila, raw, huella, identificador in pendientes:
+            if identificador is not None and guardadas.get(identificador) == huella:
+                resultado.sin_cambios += 1
+                vistos.append((identificador,))
+                continue
+            try:
+                propiedad = normalizar_propiedad(raw) + (huella,)
+            except (ValueError, TypeError) as e:
+                resultado.error(fila, raw, str(e))
+                continue
+            if identificador is None:
+                # id derivado del contenido: se busca de a uno (las fuentes con id son la norma)
+                row = tx.execute("SELECT row_hash FROM properties WHERE id = ?", (propiedad[0],)).fetchone()
+                if row is not None:
+                    guardadas[propiedad[0]] = row[0]
+                if row is not None and row[0] == huella:
+                    resultado.sin_cambios += 1
+                    vistos.append((propiedad[0],))
+                    continue
+            if propiedad[0] in guardadas:
+                resultado.actualizadas += 1
+            else:
+                resultado.insertadas += 1
+            escribir.append(propiedad)
+            vistos.append((propiedad[0],))
+
+        if escribir:
+            tx.executemany(UPSERT_PROPERTY, escribir)
+        tx.executemany("INSERT OR IGNORE INTO temp.ingesta_ids (id) VALUES (?)", vistos)
+        resultado.lotes += 1
+        pendientes.clear()
+
+    try:
+        with properties_db.transaction() as tx:
+            for fila, raw in enumerate(registros, start=1):
+                resultado.leidas += 1
+                if not isinstance(raw, dict):
+                    resultado.error(fila, raw, f"se esperaba un objeto, llegó {type(raw).__name__}")
+                    continue
+                pendientes.append((fila, raw, hash_registro(raw), _id_fuente(raw)))
+                if len(pendientes) >= lote:
+                    aplicar(tx)
+            if pendientes:
+                aplicar(tx)
+
+            if borrar_faltantes:
+                cursor = tx.execute("DELETE FROM properties WHERE id NOT IN (SELECT id FROM temp.ingesta_ids)")
+                resultado.borradas = cursor.rowcount
+            if resultado.cambios:
+                tx.execute(
+                    "INSERT INTO meta (key, value) VALUES ('catalog_version', '1') "
+                    "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+                )
+            if content_hash is not None:
+                tx.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('catalog_hash', ?)", (content_hash,))
+    except Exception as e:
+        # Error de lectura (archivo cortado, JSON inválido...): la transacción se deshizo entera
+        resultado.fatal = f"{e} (después de la fila {resultado.leidas}); no se aplicó ningún cambio"
+        resultado.insertadas = resultado.actualizadas = resultado.borradas = 0
+    finally:
+        conn.execute("DELETE FROM temp.ingesta_ids")
+
+    if resultado.cambios:
+        # Estadísticas frescas para que el planificador elija bien los índices
+        properties_db.execute("ANALYZE properties")
+    resultado.version = version_catalogo()
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from migrations import migrar, PROPERTIES_MIGRATIONS
+
+    parser = argparse.ArgumentParser(description="Carga un catálogo de propiedades en propiedades.db")
+    parser.add_argument("archivo", help="JSON (array), JSONL, CSV o XLSX")
+    parser.add_argument("--lote", type=int, default=1000, help="filas por lote de comparación/escritura (default 1000)")
+    parser.add_argument("--sin-borrar", action="store_true", help="no borrar las propiedades que no están en el archivo")
+    args = parser.parse_args(argv)
+
+    migrar(properties_db, PROPERTIES_MIGRATIONS)
+    resultado = ingestar(
+        leer_fuente(args.archivo),
+        lote=args.lote,
+        borrar_faltantes=not args.sin_borrar,
+        content_hash=hash_archivo(args.archivo),
+    )
+    for error in resultado.detalle_errores:
+        print(f"⚠️ Fila {error['fila']} (id {error['id']}): {error['error']}")
+    if resultado.fatal:
+        print(f"❌ Ingesta interrumpida: {resultado.fatal}")
+    print(
+        f"✅ {resultado.leidas} propiedades leídas: {resultado.insertadas} nuevas, {resultado.actualizadas} actualizadas, "
+        f"{resultado.sin_cambios} sin cambios, {resultado.borradas} borradas, {resultado.errores} con error "
+        f"(catálogo v{resultado.version}, {resultado.segundos:.2f}s)"
+    )
+    return 1 if resultado.fatal else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Histogramas de latencia por etapa del pipeline de /chat, exportables en formato de texto de Prometheus."""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from shared_state import shared_state
+
+# Límites superiores (segundos) de los buckets; el último bucket implícito es +Inf
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Canales conocidos: cualquier otro valor va como "otro" para no crear series sin límite
+CANALES = ("web", "whatsapp", "telegram", "facebook")
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+
+def canal_etiqueta(channel: str) -> str:
+    channel = (channel or "").strip().lower()
+    return channel if channel in CANALES else "otro"
+
+
+class Histogramas:
+    """Histogramas con etiquetas: cuenta por bucket, suma y total por (nombre, etiquetas).
+
+    Sin store se guardan en memoria bajo un lock. Con store (varios workers) cada observación
+    suma a contadores compartidos `espacio|nombre|etiquetas|bucket`, así el export refleja a todos
+    (cada juego de buckets usa su propio `espacio`).
+    """
+
+    def __init__(self, buckets=BUCKETS, store=None, espacio: str = "hist"):
+        self.buckets = tuple(buckets)
+        self.store = store
+        self.espacio = espacio
+        self._series: Dict[Tuple[str, Etiquetas], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, nombre: str, segundos: float, **etiquetas: str):
+        clave = tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+        bucket = bisect_left(self.buckets, segundos)
+        if self.store is not None:
+            prefijo = f"{self.espacio}|{nombre}|{','.join(f'{k}={v}' for k, v in clave)}|"
+            self.store.incr(prefijo + str(bucket))
+            self.store.incr(prefijo + "sum", segundos)
+            return
+        with self._lock:
+            # [cuenta por bucket..., +Inf, suma]
+            serie = self._series.setdefault((nombre, clave), [0.0] * (len(self.buckets) + 2))
+            serie[bucket] += 1
+            serie[-1] += segundos
+
+    @contextmanager
+    def medir(self, nombre: str, **etiquetas: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(nombre, time.perf_counter() - inicio, **etiquetas)
+
+    def series(self) -> Dict[Tuple[str, Etiquetas], List[float]]:
+        """Copia de todas las series: {(nombre, etiquetas): [cuenta por bucket..., +Inf, suma]}."""
+        if self.store is None:
+            with self._lock:
+                return {clave: list(serie) for clave, serie in self._series.items()}
+        series: Dict[Tuple[str, Etiquetas], List[float]] = {}
+        for nombre_contador, valor in self.store.counters().items():
+            if not nombre_contador.startswith(self.espacio + "|"):
+                continue
+            _, nombre, etiquetas, bucket = nombre_contador.split("|")
+            clave = tuple(tuple(par.split("=", 1)) for par in etiquetas.split(",") if par)
+            serie = series.setdefault((nombre, clave), [0.0] * (len(self.buckets) + 2))
+            serie[-1 if bucket == "sum" else int(bucket)] += valor
+        return series
+
+    def percentil(self, serie: List[float], p: float) -> float:
+        """Percentil estimado interpolando dentro del bucket (como histogram_quantile de Prometheus)."""
+        cuentas = serie[:-1]
+        total = sum(cuentas)
+        if not total:
+            return 0.0
+        objetivo = total * p / 100
+        acumulado = 0.0
+        for i, cuenta in enumerate(cuentas):
+            if acumulado + cuenta >= objetivo and cuenta:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                inferior = self.buckets[i - 1] if i else 0.0
+                return inferior + (self.buckets[i] - inferior) * (objetivo - acumulado) / cuenta
+            acumulado += cuenta
+        return self.buckets[-1]
+
+    def resumen(self, nombre: str) -> Dict[str, Dict[str, float]]:
+        """Para el /metrics en JSON: cantidad, promedio y p50/p95/p99 (ms) de cada serie de `nombre`."""
+        resultado = {}
+        for (serie_nombre, etiquetas), serie in sorted(self.series().items()):
+            if serie_nombre != nombre:
+                continue
+            cantidad = int(sum(serie[:-1]))
+            resultado[",".join(f"{k}={v}" for k, v in etiquetas)] = {
+                "count": cantidad,
+                "avg_ms": round(serie[-1] / cantidad * 1000, 2) if cantidad else 0.0,
+                "p50_ms": round(self.percentil(serie, 50) * 1000, 2),
+                "p95_ms": round(self.percentil(serie, 95) * 1000, 2),
+                "p99_ms": round(self.percentil(serie, 99) * 1000, 2),
+            }
+        return resultado
+
+    def prometheus(self, prefijo: str = "dante_", ayudas: Optional[Dict[str, str]] = None) -> str:
+        """Series en formato de texto de Prometheus (_bucket acumulado con le, _sum y _count)."""
+        ayudas = ayudas or {}
+        lineas: List[str] = []
+        ultimo = None
+        for (nombre, etiquetas), serie in sorted(self.series().items()):
+            metrica = prefijo + nombre
+            if nombre != ultimo:
+                lineas.append(f"# HELP {metrica} {ayudas.get(nombre, nombre)}")
+                lineas.append(f"# TYPE {metrica} histogram")
+                ultimo = nombre
+            base = [f'{k}="{_escapar(v)}"' for k, v in etiquetas]
+            acumulado = 0.0
+            for limite, cuenta in zip(self.buckets + ("+Inf",), serie[:-1]):
+                acumulado += cuenta
+                le = limite if limite == "+Inf" else f"{limite:g}"
+                etiquetas_bucket = ",".join(base + [f'le="{le}"'])
+                lineas.append(f"{metrica}_bucket{{{etiquetas_bucket}}} {acumulado:g}")
+            sufijo = "{" + ",".join(base) + "}" if base else ""
+            lineas.append(f"{metrica}_sum{sufijo} {serie[-1]:.6f}")
+            lineas.append(f"{metrica}_count{sufijo} {acumulado:g}")
+        return "\n".join(lineas) + "\n" if lineas else ""
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Cronometro:
+    """Tiempos de las etapas de un pedido; se vuelcan juntos al final, cuando ya se conocen sus etiquetas."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas: Dict[str, float] = {}
+
+    @contextmanager
+    def etapa(self, nombre: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sumar(nombre, time.perf_counter() - inicio)
+
+    def sumar(self, nombre: str, segundos: float):
+        self.etapas[nombre] = self.etapas.get(nombre, 0.0) + segundos
+
+    def registrar(self, histogramas: "Histogramas", **etiquetas: str):
+        for nombre, segundos in self.etapas.items():
+            histogramas.observe("chat_stage_seconds", segundos, stage=nombre, **etiquetas)
+        histogramas.observe("chat_stage_seconds", time.perf_counter() - self.inicio, stage="total", **etiquetas)
+
+
+AYUDAS = {
+    "chat_stage_seconds": "Duración de cada etapa del pipeline de /chat y /chat/stream",
+    "gemini_call_seconds": "Duración de cada llamada a Gemini, por clave y resultado",
+    "prompt_tokens": "Tamaño estimado en tokens de cada prompt enviado a Gemini, por plantilla y canal",
+}
+
+histogramas = Histogramas(store=shared_state if shared_state.enabled else None)
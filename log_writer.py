@@ -0,0 +1,151 @@
+"""Escritura de logs de conversación en segundo plano: cola acotada + INSERT por lotes."""
+import asyncio
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import LOG_QUEUE_SIZE, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL, LOG_QUEUE_POLICY, LOG_WRITE_RETRIES, LOG_WRITE_BACKOFF
+from db import logs_db
+from logger import get_logger
+
+log = get_logger(__name__)
+
+_STOP = object()
+
+INSERT_LOG = '''
+    INSERT INTO logs (timestamp, channel, user_message, bot_response, response_time, search_performed, results_count, session_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class LogWriter:
+    """Las peticiones encolan registros y una tarea los vuelca con executemany.
+
+    Se vuelca cuando se juntan `batch_size` registros o pasan `flush_interval` segundos.
+    Con la cola llena, policy="drop" descarta el registro (y lo cuenta) y policy="block"
+    hace esperar a la petición hasta que haya lugar.
+
+    Si la base está bloqueada (otro worker, la retención) el lote se reintenta hasta `retries` veces
+    con espera creciente desde `backoff` segundos; mientras tanto los registros nuevos esperan en la cola.
+    """
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float, policy: str,
+                 retries: int = 5, backoff: float = 0.1):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.retries = retries
+        self.backoff = backoff
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+        self.retried = 0
+        self.lost = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, record: Tuple[Any, ...]) -> bool:
+        """Encola un registro; si el writer no está corriendo lo escribe en el momento."""
+        if not self.running:
+            await asyncio.to_thread(self._write, [record])
+            return True
+        if self.policy == "block":
+            await self._queue.put(record)
+            return True
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch, stopping = [item], False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await asyncio.to_thread(self._write, batch)
+            if stopping:
+                return
+
+    @staticmethod
+    def _transitorio(error: Exception) -> bool:
+        mensaje = str(error).lower()
+        return isinstance(error, sqlite3.OperationalError) and ("locked" in mensaje or "busy" in mensaje)
+
+    def _write(self, batch: List[Tuple[Any, ...]]):
+        start = time.perf_counter()
+        intento = 0
+        while True:
+            try:
+                with logs_db.transaction() as conn:
+                    conn.executemany(INSERT_LOG, batch)
+                self.written += len(batch)
+                self.batches += 1
+                break
+            except Exception as e:
+                if self._transitorio(e) and intento < self.retries:
+                    espera = min(self.backoff * 2 ** intento, 5.0)
+                    intento += 1
+                    self.retried += 1
+                    log.warning("⚠️ Base de logs bloqueada, reintento %s/%s en %ss (%s registros)",
+                                intento, self.retries, format(espera, "g"), len(batch))
+                    time.sleep(espera)
+                    continue
+                self.errors += 1
+                self.lost += len(batch)
+                log.error("❌ Error escribiendo lote de logs, %s registros perdidos: %s", len(batch), e)
+                break
+        self.last_flush_ms = (time.perf_counter() - start) * 1000
+
+    async def stop(self):
+        """Vuelca lo que quede en la cola y detiene la tarea (shutdown del lifespan)."""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "policy": self.policy,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "errors": self.errors,
+            "retried": self.retried,
+            "lost": self.lost,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+
+log_writer = LogWriter(LOG_QUEUE_SIZE, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL, LOG_QUEUE_POLICY, LOG_WRITE_RETRIES, LOG_WRITE_BACKOFF)
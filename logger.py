@@ -0,0 +1,137 @@
+"""Logging del proceso: niveles, muestreo, salida por una cola (el pedido no espera a stdout) y secretos tapados.
+
+Uso en cada módulo:
+
+    from logger import get_logger
+    log = get_logger(__name__)
+    log.debug("🔍 Query ejecutada: %s", q)     # con LOG_LEVEL=INFO no se formatea nada
+
+LOG_LEVEL (INFO por defecto), LOG_FORMAT ("text" o "json"), LOG_DEBUG_SAMPLE (fracción de los
+mensajes DEBUG que se escriben) y LOGGER_QUEUE_SIZE (con la cola llena se descarta y se cuenta).
+"""
+import re
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Any, Dict, Iterable
+
+from config import API_KEYS, LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE, LOGGER_QUEUE_SIZE
+
+RAIZ = "dante"
+
+# Claves de Google y parámetros ?key=... aunque no estén en la configuración
+PATRONES_SECRETOS = [
+    re.compile(r"AIza[0-9A-Za-z_\-]{20,}"),
+    re.compile(r"(?i)([?&]key=)[^&\s\"']+"),
+]
+TAPADO = "***"
+
+
+class Redactor(logging.Filter):
+    """Reemplaza en el mensaje ya formateado las claves configuradas y todo lo que parezca una clave."""
+
+    def __init__(self, secretos: Iterable[str] = ()):
+        super().__init__()
+        self.secretos = sorted({s for s in secretos if len(s) >= 6}, key=len, reverse=True)
+
+    def tapar(self, texto: str) -> str:
+        for secreto in self.secretos:
+            if secreto in texto:
+                texto = texto.replace(secreto, TAPADO)
+        for patron in PATRONES_SECRETOS:
+            texto = patron.sub(lambda m: (m.group(1) if m.groups() else "") + TAPADO, texto)
+        return texto
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = self.tapar(record.getMessage())
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.tapar(logging.Formatter().formatException(record.exc_info))
+        return True
+
+
+class Muestreo(logging.Filter):
+    """Deja pasar sólo una fracción de los DEBUG (o la que indique `extra={"muestreo": p}`)."""
+
+    def __init__(self, fraccion_debug: float):
+        super().__init__()
+        self.fraccion_debug = fraccion_debug
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        fraccion = getattr(record, "muestreo", None)
+        if fraccion is None:
+            fraccion = self.fraccion_debug if record.levelno <= logging.DEBUG else 1.0
+        return fraccion >= 1.0 or random.random() < fraccion
+
+
+class ColaSinBloqueo(logging.handlers.QueueHandler):
+    """QueueHandler que con la cola llena descarta el registro en vez de esperar o fallar."""
+
+    def __init__(self, cola: queue.Queue):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro; los campos de `extra={"campos": {...}}` van al primer nivel."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        datos: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        datos.update(getattr(record, "campos", None) or {})
+        if record.exc_text:
+            datos["exc"] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+def _configurar() -> ColaSinBloqueo:
+    raiz = logging.getLogger(RAIZ)
+    raiz.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    raiz.propagate = False
+
+    salida = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        salida.setFormatter(FormatoJSON())
+    else:
+        salida.setFormatter(logging.Formatter("%(message)s"))
+
+    cola_handler = ColaSinBloqueo(queue.Queue(LOGGER_QUEUE_SIZE))
+    cola_handler.addFilter(Muestreo(LOG_DEBUG_SAMPLE))
+    cola_handler.addFilter(Redactor(API_KEYS))
+    raiz.addHandler(cola_handler)
+
+    listener = logging.handlers.QueueListener(cola_handler.queue, salida, respect_handler_level=False)
+    listener.start()
+    atexit.register(listener.stop)
+    return cola_handler
+
+
+_cola = _configurar()
+
+
+def get_logger(nombre: str) -> logging.Logger:
+    """Logger hijo de "dante" (comparte niveles, filtros y la cola)."""
+    nombre = nombre if nombre != "__main__" else "main"
+    return logging.getLogger(f"{RAIZ}.{nombre}")
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "level": logging.getLevelName(logging.getLogger(RAIZ).level),
+        "queued": _cola.queue.qsize(),
+        "dropped": _cola.descartados,
+    }
@@ -2,96 +2,48 @@
 import os
 import re
 import json
-import sqlite3
-import requests
 import time
-from functools import lru_cache
+import asyncio
+import logging
+import threading
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.openapi.utils import get_openapi
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 from pydantic import BaseModel, Field
-from config import API_KEYS, ENDPOINT, WORKING_MODEL as MODEL
+from config import WEB_CONCURRENCY
+from gemini.client import call_gemini_with_rotation, stream_gemini_with_rotation, close_http_client, ALL_KEYS_FAILED
+from gemini.keys import key_scheduler
+from gemini.hedge import hedge_policy
+from gemini.coalesce import single_flight
+from cache import response_cache, response_cache_key, query_cache, query_cache_key, cache_query
+from catalog import catalog
+from db import properties_db, logs_db, DB_PATH, LOG_PATH
+import db
+from log_writer import log_writer
+from shared_state import shared_state
+from texto import normalizar
+from extractor import extractor_para
+from columnar import property_engine
+from fts import BM25_WEIGHTS, consulta_fts, terminos_libres
+from migrations import migrar, PROPERTIES_MIGRATIONS, LOGS_MIGRATIONS
+from ingesta import ingestar, hash_cargado, version_catalogo, leer_json
+from latencias import histogramas, Cronometro, canal_etiqueta, AYUDAS
+from logger import get_logger
+import logger
+from salud import sondeo
+from historial import historial
+from prompts import prompts, estimar_tokens
+from retencion import retencion
+from exportar import codificar_cursor, decodificar_cursor, respuesta_export
+
+
+log = get_logger(__name__)
 
 
-# Después de las importaciones, agrega:
-print(f"🔍 API Keys cargadas: {API_KEYS}")
-print(f"🔍 Endpoint: {ENDPOINT}")
-
-# Al inicio, después de las importaciones
-print("🔍 TODAS LAS VARIABLES DE ENTORNO:")
-for key, value in os.environ.items():
-    if "GEMINI" in key or "API" in key:
-        print(f"   {key}: {value}")
-
-
-
-# 🔥 AGREGAR ESTO TEMPORALMENTE:
-print("🔍 TODAS LAS VARIABLES DE ENTORNO RELACIONADAS:")
-for key, value in os.environ.items():
-    if "GEMINI" in key.upper() or "API" in key.upper() or "KEY" in key.upper():
-        print(f"   {key}: {value[:20]}...")  # Mostrar solo primeros 20 chars
-
-print("🔍 VARIABLE GEMINI_API_KEYS específica:")
-print(f"   GEMINI_API_KEYS: {os.getenv('GEMINI_API_KEYS', 'NO DEFINIDA')}")
-
-print("🔍 VARIABLE GEMINI_KEYS específica:")
-print(f"   GEMINI_KEYS: {os.getenv('GEMINI_KEYS', 'NO DEFINIDA')}")
-
-
-
-def call_gemini_with_rotation(prompt: str) -> str:
-    import google.generativeai as genai
-    
-    print(f"🎯 INICIANDO ROTACIÓN DE CLAVES")
-    print(f"🔧 Modelo: {MODEL}")
-    print(f"🔑 Claves disponibles: {len(API_KEYS)}")
-    
-    for i, key in enumerate(API_KEYS):
-        if not key.strip():
-            continue
-            
-        print(f"🔄 Probando clave {i+1}/{len(API_KEYS)}...")
-        
-        try:
-            genai.configure(api_key=key.strip())
-            model = genai.GenerativeModel(MODEL)
-            
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,
-                    top_p=0.8,
-                    top_k=40,
-                )
-            )
-            
-            if not response.parts:
-                raise Exception("Respuesta vacía de Gemini")
-            
-            answer = response.text.strip()
-            print(f"✅ Éxito con clave {i+1}")
-            
-            return answer
-
-        except Exception as e:
-            error_type = type(e).__name__
-            
-            # 🔥 MENSAJES MÁS LIMPIOS
-            if "ResourceExhausted" in error_type or "429" in str(e):
-                print(f"❌ Clave {i+1} agotada")
-            elif "PermissionDenied" in error_type or "401" in str(e):
-                print(f"❌ Clave {i+1} no autorizada") 
-            else:
-                print(f"❌ Clave {i+1} error: {error_type}")
-            
-            continue
-    
-    return "❌ Todas las claves agotadas. Intente más tarde."
-
 def diagnosticar_problemas():
     """Función de diagnóstico"""
     print("🔍 INICIANDO DIAGNÓSTICO...")
@@ -127,15 +79,11 @@ def diagnosticar_problemas():
     except Exception as e:
         print(f"   ❌ Error importando gemini client: {e}")
 
-# Ejecutar diagnóstico inmediatamente
-diagnosticar_problemas()
-
-
-
 # ✅ MODELOS DE DATOS PYDANTIC
 class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1, max_length=1000, description="Mensaje del usuario")
     channel: str = Field(default="web", description="Canal de comunicación (web, whatsapp, etc.)")
+    session_id: Optional[str] = Field(default=None, max_length=128, description="Identificador de la conversación (usuario o sesión); sin él no se usa historial")
     filters: Optional[Dict[str, Any]] = Field(default=None, description="Filtros aplicados desde el frontend")
     # 👇 AGREGAR ESTOS CAMPOS NUEVOS
     contexto_anterior: Optional[Dict[str, Any]] = Field(default=None, description="Contexto de la conversación anterior")
@@ -157,44 +105,74 @@ class PropertyResponse(BaseModel):
     sqm: float
     description: str
 
-# ✅ MÉTRICAS Y ESTADÍSTICAS
+# ✅ MÉTRICAS Y ESTADÍSTICAS (con varios workers se suman en el store compartido)
 class Metrics:
-    def __init__(self):
-        self.requests_count = 0
-        self.successful_requests = 0
-        self.failed_requests = 0
-        self.gemini_calls = 0
-        self.search_queries = 0
+    COUNTERS = ("requests_count", "successful_requests", "failed_requests", "gemini_calls", "search_queries")
+
+    def __init__(self, store=None):
+        self.store = store
+        self._local = dict.fromkeys(self.COUNTERS, 0)
+        self._lock = threading.Lock()
         self.start_time = time.time()
     
+    def _increment(self, name):
+        if self.store is not None:
+            self.store.incr(name)
+        else:
+            # Los endpoints sync corren en el threadpool: += no es atómico entre hilos
+            with self._lock:
+                self._local[name] += 1
+    
+    def snapshot(self) -> Dict[str, int]:
+        if self.store is None:
+            with self._lock:
+                return dict(self._local)
+        totals = self.store.counters()
+        return {name: int(totals.get(name, 0)) for name in self.COUNTERS}
+    
     def increment_requests(self):
-        self.requests_count += 1
+        self._increment("requests_count")
     
     def increment_success(self):
-        self.successful_requests += 1
+        self._increment("successful_requests")
     
     def increment_failures(self):
-        self.failed_requests += 1
+        self._increment("failed_requests")
     
     def increment_gemini_calls(self):
-        self.gemini_calls += 1
+        self._increment("gemini_calls")
     
     def increment_searches(self):
-        self.search_queries += 1
+        self._increment("search_queries")
     
     def get_uptime(self):
-        return time.time() - self.start_time
+        start = self.store.started_at if self.store is not None else self.start_time
+        return time.time() - start
 
 # ✅ INICIALIZACIÓN
-metrics = Metrics()
+metrics = Metrics(shared_state if shared_state.enabled else None)
 
 @asynccontextmanager
 async def lifespan(app):
-    print("🔄 Iniciando ciclo de vida...")
+    log.info("🔄 Iniciando ciclo de vida...")
     # Inicialización de bases de datos y recursos
-    initialize_databases()
+    # Con varios workers las migraciones corren de a un worker por vez
+    with shared_state.arranque():
+        initialize_databases()
+    await shared_state.start()
+    await log_writer.start()
+    await catalog.start()
+    await sondeo.start()
+    await retencion.start()
     yield
-    print("✅ Finalizando ciclo de vida...")
+    await retencion.stop()
+    await sondeo.stop()
+    await catalog.stop()
+    await log_writer.stop()
+    await shared_state.stop()
+    await close_http_client()
+    db.close_all()
+    log.info("✅ Finalizando ciclo de vida...")
 
 # ✅ APP PRINCIPAL
 app = FastAPI(
@@ -204,11 +182,6 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# ✅ CONFIGURACIONES
-DB_PATH = os.path.join(os.path.dirname(__file__), "propiedades.db")
-LOG_PATH = os.path.join(os.path.dirname(__file__), "conversaciones.db")
-CACHE_DURATION = 300  # 5 minutos para cache
-
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -216,752 +189,259 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ✅ CACHE PARA CONSULTAS FRECUENTES
-query_cache = {}
-
-def get_cache_key(filters: Dict[str, Any]) -> str:
-    """Genera una clave única para el cache basada en los filtros"""
-    return json.dumps(filters, sort_keys=True)
-
-def cache_query_results(filters: Dict[str, Any], results: List[Dict]):
-    """Almacena resultados en cache"""
-    cache_key = get_cache_key(filters)
-    query_cache[cache_key] = {
-        'results': results,
-        'timestamp': time.time()
-    }
-
-def get_cached_results(filters: Dict[str, Any]) -> Optional[List[Dict]]:
-    """Obtiene resultados del cache si están disponibles y no han expirado"""
-    cache_key = get_cache_key(filters)
-    cached = query_cache.get(cache_key)
-    
-    if cached and (time.time() - cached['timestamp']) < CACHE_DURATION:
-        return cached['results']
-    return None
-
-
-
 # ✅ FUNCIONES MEJORADAS
-def cargar_propiedades_a_db():
-    """Carga las propiedades del JSON a la base de datos SQLite con mapeo correcto de campos y tipos"""
+def _reconstruir_motor(version=None):
+    """Motor columnar (PROPERTY_ENGINE=numpy): se rearma desde la tabla properties si cambió la versión del catálogo"""
+    if not property_engine.enabled:
+        return
+    version = version_catalogo() if version is None else version
+    if property_engine.version != version:
+        rows = properties_db.query(f"SELECT {PROPERTY_COLUMNS}, neighborhood_norm, operacion_norm, tipo_norm FROM properties ORDER BY rowid")
+        property_engine.rebuild([dict(r) for r in rows], version)
+
+def cargar_propiedades_a_db(snapshot=None):
+    """Sincroniza el catálogo en SQLite: sólo escribe las propiedades que cambiaron (nada si el hash del JSON es el mismo).
+
+    El archivo se lee en streaming (leer_json), así que la memoria no crece con el tamaño del catálogo.
+    """
     try:
-        propiedades = cargar_propiedades_json("properties.json")
-        if not propiedades:
-            print("❌ No hay propiedades para cargar")
+        snapshot = snapshot or catalog.get()
+        content_hash = snapshot.content_hash
+        if not snapshot.cantidad:
+            log.error("❌ No hay propiedades para cargar")
             return
         
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        
-        # Limpiar tabla existente
-        cur.execute("DELETE FROM properties")
-        
-        # Insertar nuevas propiedades con CONVERSIÓN DE TIPOS
-        propiedades_cargadas = 0
-        for prop in propiedades:
-            try:
-                # 🔥 CONVERTIR TIPOS DE DATOS
-                id_prop = prop.get('id_temporal') or f"prop_{propiedades_cargadas}"
-                titulo = str(prop.get('titulo', ''))
-                barrio = str(prop.get('barrio', ''))
-                
-                # Convertir precio a float
-                precio_str = str(prop.get('precio', '0')).replace(',', '.')
-                precio = float(precio_str) if precio_str.replace('.', '').isdigit() else 0.0
-                
-                # Convertir ambientes a int
-                ambientes_str = str(prop.get('ambientes', '0'))
-                ambientes = int(ambientes_str) if ambientes_str.isdigit() else 0
-                
-                # Convertir metros a float
-                metros_str = str(prop.get('metros', '0')).replace(',', '.')
-                metros = float(metros_str) if metros_str.replace('.', '').isdigit() else 0.0
-                
-                # Convertir expensas a float
-                expensas_str = str(prop.get('expensas', '0')).replace(',', '.')
-                expensas = float(expensas_str) if expensas_str.replace('.', '').isdigit() else 0.0
-                
-                # Convertir antiguedad a int
-                antiguedad_str = str(prop.get('antiguedad', '0'))
-                antiguedad = int(antiguedad_str) if antiguedad_str.isdigit() else 0
-                
-                # Resto de campos como texto
-                descripcion = str(prop.get('descripcion', ''))
-                operacion = str(prop.get('operacion', ''))
-                tipo = str(prop.get('tipo', ''))
-                direccion = str(prop.get('direccion', ''))
-                estado = str(prop.get('estado', ''))
-                orientacion = str(prop.get('orientacion', ''))
-                piso = str(prop.get('piso', ''))
-                amenities = str(prop.get('amenities', ''))
-                cochera = str(prop.get('cochera', ''))
-                balcon = str(prop.get('balcon', ''))
-                pileta = str(prop.get('pileta', ''))
-                acepta_mascotas = str(prop.get('acepta_mascotas', ''))
-                aire_acondicionado = str(prop.get('aire_acondicionado', ''))
-                info_multimedia = str(prop.get('info_multimedia', ''))
-                
-                # 🔥 DEBUG DETALLADO - Mostrar tipos reales
-                print(f"🔍 DEBUG - Tipos de datos para '{titulo}':")
-                print(f"   id: {type(id_prop).__name__} = {id_prop}")
-                print(f"   precio: {type(precio).__name__} = {precio}")
-                print(f"   ambientes: {type(ambientes).__name__} = {ambientes}")
-                print(f"   metros: {type(metros).__name__} = {metros}")
-                print(f"   antiguedad: {type(antiguedad).__name__} = {antiguedad}")
-                print(f"   expensas: {type(expensas).__name__} = {expensas}")
-                
-                # 🔥 VERIFICAR ESQUEMA DE LA TABLA
-                if propiedades_cargadas == 0:  # Solo una vez
-                    print("🔍 Verificando esquema de la tabla...")
-                    cur.execute("PRAGMA table_info(properties)")
-                    schema = cur.fetchall()
-                    for col in schema:
-                        print(f"   Columna: {col[1]}, Tipo: {col[2]}")
-                
-                cur.execute('''
-                    INSERT INTO properties (
-                        id, title, neighborhood, price, rooms, sqm, description, 
-                        operacion, tipo, direccion, antiguedad, estado, orientacion, 
-                        piso, expensas, amenities, cochera, balcon, pileta, 
-                        acepta_mascotas, aire_acondicionado, info_multimedia
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    id_prop, titulo, barrio, precio, ambientes, metros, descripcion,
-                    operacion, tipo, direccion, antiguedad, estado, orientacion,
-                    piso, expensas, amenities, cochera, balcon, pileta,
-                    acepta_mascotas, aire_acondicionado, info_multimedia
-                ))
-                propiedades_cargadas += 1
-                print(f"✅ Cargada: {titulo}")
-                
-            except Exception as e:
-                print(f"⚠️ Error cargando propiedad {prop.get('titulo', 'N/A')}: {e}")
-                import traceback
-                traceback.print_exc()
-                continue
-        
-        conn.commit()
-        conn.close()
-        print(f"✅ {propiedades_cargadas}/{len(propiedades)} propiedades cargadas exitosamente")
-        
-    except Exception as e:
-        print(f"❌ Error cargando propiedades a DB: {e}")
-        import traceback
-        traceback.print_exc()
-
-
-def reparar_esquema_base_datos():
-    """Repara el esquema de la base de datos para que coincida con los tipos de datos"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        
-        # 1. Backup de datos existentes (si los hay)
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='properties'")
-        tabla_existe = cur.fetchone()
-        
-        if tabla_existe:
-            print("🔄 Reparando esquema existente...")
-            # Crear tabla temporal con estructura correcta
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS properties_new (
-                    id TEXT PRIMARY KEY,
-                    title TEXT,
-                    neighborhood TEXT,
-                    price REAL,
-                    rooms INTEGER,
-                    sqm REAL,
-                    description TEXT,
-                    operacion TEXT,
-                    tipo TEXT,
-                    direccion TEXT,
-                    antiguedad INTEGER,
-                    estado TEXT,
-                    orientacion TEXT,
-                    piso TEXT,
-                    expensas REAL,
-                    amenities TEXT,
-                    cochera TEXT,
-                    balcon TEXT,
-                    pileta TEXT,
-                    acepta_mascotas TEXT,
-                    aire_acondicionado TEXT,
-                    info_multimedia TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Intentar migrar datos si es posible
-            try:
-                cur.execute('''
-                    INSERT INTO properties_new (
-                        id, title, neighborhood, price, rooms, sqm, description,
-                        operacion, tipo, direccion, antiguedad, estado, orientacion,
-                        piso, expensas, amenities, cochera, balcon, pileta,
-                        acepta_mascotas, aire_acondicionado, info_multimedia
-                    )
-                    SELECT 
-                        id, title, neighborhood, 
-                        CAST(price AS REAL), CAST(rooms AS INTEGER), CAST(sqm AS REAL),
-                        description, operacion, tipo, direccion, 
-                        CAST(antiguedad AS INTEGER), estado, orientacion,
-                        piso, CAST(expensas AS REAL), amenities, cochera, balcon, pileta,
-                        acepta_mascotas, aire_acondicionado, info_multimedia
-                    FROM properties
-                ''')
-                print("✅ Datos migrados al nuevo esquema")
-            except Exception as mig_error:
-                print(f"ℹ️ No se pudieron migrar datos: {mig_error}")
-            
-            # Reemplazar tabla vieja
-            cur.execute("DROP TABLE properties")
-            cur.execute("ALTER TABLE properties_new RENAME TO properties")
-            
-        else:
-            # Crear tabla nueva si no existe
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS properties (
-                    id TEXT PRIMARY KEY,
-                    title TEXT,
-                    neighborhood TEXT,
-                    price REAL,
-                    rooms INTEGER,
-                    sqm REAL,
-                    description TEXT,
-                    operacion TEXT,
-                    tipo TEXT,
-                    direccion TEXT,
-                    antiguedad INTEGER,
-                    estado TEXT,
-                    orientacion TEXT,
-                    piso TEXT,
-                    expensas REAL,
-                    amenities TEXT,
-                    cochera TEXT,
-                    balcon TEXT,
-                    pileta TEXT,
-                    acepta_mascotas TEXT,
-                    aire_acondicionado TEXT,
-                    info_multimedia TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            print("✅ Tabla creada con esquema correcto")
+        # 🔥 Arranque rápido: si la tabla ya tiene esta versión del JSON no se toca
+        if content_hash and hash_cargado() == content_hash:
+            log.info("✅ Tabla properties al día (%s)", content_hash[:12])
+            _reconstruir_motor()
+            return
         
-        conn.commit()
-        conn.close()
-        print("✅ Esquema de base de datos reparado/creado correctamente")
+        resultado = ingestar(leer_json(snapshot.path or catalog.path), content_hash=content_hash)
+        for error in resultado.detalle_errores:
+            log.warning("⚠️ Propiedad rechazada (fila %s, id %s): %s", error['fila'], error['id'], error['error'])
+        if resultado.fatal:
+            log.error("❌ Sincronización del catálogo abortada: %s", resultado.fatal)
+            return
+        if resultado.cambios:
+            _reconstruir_motor(resultado.version)
+            # Las claves de los caches ya incluyen la versión: limpiar sólo libera memoria
+            query_cache.clear()
+            response_cache.clear()
+        log.info("✅ Catálogo v%s: %s nuevas, %s actualizadas, %s borradas, %s sin cambios (%s ms)", resultado.version, resultado.insertadas, resultado.actualizadas, resultado.borradas, resultado.sin_cambios, format(resultado.segundos * 1000, ".0f"))
         
     except Exception as e:
-        print(f"❌ Error reparando esquema: {e}")
-        import traceback
-        traceback.print_exc()
+        log.error("❌ Error cargando propiedades a DB: %s", e, exc_info=True)
 
+# Cada vez que cambia properties.json se recarga la tabla properties
+catalog.on_reload(cargar_propiedades_a_db)
 
 
 def initialize_databases():
-    """Inicializa las bases de datos si no existen"""
+    """Migra los esquemas (idempotente, PRAGMA user_version) y carga el catálogo si properties.json cambió"""
     try:
-        # 🔥 FORZAR ELIMINACIÓN DE BASES DE DATOS VIEJAS EN RENDER
-        if os.path.exists(DB_PATH):
-            os.remove(DB_PATH)
-            print("🗑️ Base de datos propiedades eliminada forzadamente")
-        if os.path.exists(LOG_PATH):
-            os.remove(LOG_PATH)
-            print("🗑️ Base de datos logs eliminada forzadamente")
-        
-        # Base de datos de logs
-        conn = sqlite3.connect(LOG_PATH)
-        cur = conn.cursor()
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT,
-                channel TEXT,
-                user_message TEXT,
-                bot_response TEXT,
-                response_time REAL,
-                search_performed BOOLEAN DEFAULT 0,
-                results_count INTEGER DEFAULT 0
-            )
-        ''')
-        conn.commit()
-        conn.close()
-        print("✅ Tabla 'logs' creada/verificada")
-        
-        # Base de datos de propiedades - CON MÁS LOGGING
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        
-        # 🔥 VERIFICAR SI LA TABLA EXISTE ANTES
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='properties'")
-        tabla_existe = cur.fetchone()
-        print(f"🔍 Tabla 'properties' existe antes de crear: {tabla_existe is not None}")
-        
-        # Crear tabla
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS properties (
-                id TEXT PRIMARY KEY,
-                title TEXT,
-                neighborhood TEXT,
-                price REAL,
-                rooms INTEGER,
-                sqm REAL,
-                description TEXT,
-                operacion TEXT,
-                tipo TEXT,
-                direccion TEXT,
-                antiguedad INTEGER,
-                estado TEXT,
-                orientacion TEXT,
-                piso TEXT,
-                expensas REAL,
-                amenities TEXT,
-                cochera TEXT,
-                balcon TEXT,
-                pileta TEXT,
-                acepta_mascotas TEXT,
-                aire_acondicionado TEXT,
-                info_multimedia TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # 🔥 VERIFICAR ESQUEMA DESPUÉS DE CREAR
-        cur.execute("PRAGMA table_info(properties)")
-        schema = cur.fetchall()
-        print("🔍 Esquema de la tabla 'properties':")
-        for col in schema:
-            print(f"   {col[1]} : {col[2]}")
-        
-        conn.commit()
-        conn.close()
-        print("✅ Tabla 'properties' creada/verificada")
+        version_logs = migrar(logs_db, LOGS_MIGRATIONS)
+        version_propiedades = migrar(properties_db, PROPERTIES_MIGRATIONS)
+        log.info("✅ Esquemas: logs v%s, properties v%s", version_logs, version_propiedades)
 
-        # ✅ CARGAR PROPIEDADES DESDE JSON
-        cargar_propiedades_a_db()
-        
-        print("✅ Bases de datos inicializadas correctamente con nuevo esquema")
-        
-    except Exception as e:
-        print(f"❌ Error inicializando bases de datos: {e}")
-        import traceback
-        traceback.print_exc()
-        
+        # ✅ CARGAR PROPIEDADES DESDE JSON (el listener del catálogo compara el hash y sólo recarga si cambió)
+        catalog.refresh(force=True)
         
-def reparar_esquema_base_datos():
-    """Repara el esquema de la base de datos para que coincida con los tipos de datos"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        
-        # 1. Crear tabla temporal con datos existentes
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS properties_temp AS 
-            SELECT * FROM properties LIMIT 0
-        ''')
-        
-        # 2. Eliminar tabla original
-        cur.execute("DROP TABLE IF EXISTS properties")
-        
-        # 3. Crear tabla con esquema CORRECTO
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS properties (
-                id TEXT PRIMARY KEY,
-                title TEXT,
-                neighborhood TEXT,
-                price REAL,
-                rooms INTEGER,
-                sqm REAL,
-                description TEXT,
-                operacion TEXT,
-                tipo TEXT,
-                direccion TEXT,
-                antiguedad INTEGER,
-                estado TEXT,
-                orientacion TEXT,
-                piso TEXT,
-                expensas REAL,
-                amenities TEXT,
-                cochera TEXT,
-                balcon TEXT,
-                pileta TEXT,
-                acepta_mascotas TEXT,
-                aire_acondicionado TEXT,
-                info_multimedia TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # 4. Copiar datos de temporal a nueva tabla (si existen)
-        try:
-            cur.execute('''
-                INSERT INTO properties 
-                SELECT * FROM properties_temp
-            ''')
-        except:
-            print("ℹ️ No hay datos para migrar")
-        
-        # 5. Eliminar tabla temporal
-        cur.execute("DROP TABLE IF EXISTS properties_temp")
-        
-        conn.commit()
-        conn.close()
-        print("✅ Esquema de base de datos reparado")
-        
-    except Exception as e:
-        print(f"❌ Error reparando esquema: {e}")
-        
-
-
-def cargar_propiedades_json(filename):
-    try:
-        # Usar utf-8-sig que maneja automáticamente el BOM
-        with open(filename, "r", encoding="utf-8-sig") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print(f"⚠️ Archivo {filename} no encontrado")
-        return []
-    except json.JSONDecodeError as e:
-        print(f"⚠️ Error decodificando JSON en {filename}: {e}")
-        return []
     except Exception as e:
-        print(f"⚠️ Error al cargar {filename}: {e}")
-        return []
-
-def extraer_barrios(propiedades):
-    return sorted(set(p.get("neighborhood", "").lower() for p in propiedades if p.get("neighborhood")))
+        log.error("❌ Error inicializando bases de datos: %s", e, exc_info=True)
 
-def extraer_tipos(propiedades):
-    return sorted(set(p.get("tipo", "").lower() for p in propiedades if p.get("tipo")))
 
-def extraer_operaciones(propiedades):
-    return sorted(set(p.get("operacion", "").lower() for p in propiedades if p.get("operacion")))
-
-def get_historial_canal(canal="web", limite=3):
+def get_historial_sesion(session_id, limite=3):
+    """Últimos mensajes del usuario en esta sesión (ring buffer en memoria; logs si la sesión no está cargada)"""
     try:
-        conn = sqlite3.connect(LOG_PATH)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT user_message FROM logs WHERE channel = ? ORDER BY id DESC LIMIT ?",
-            (canal, limite)
-        )
-        rows = cur.fetchall()
-        conn.close()
-        return [r["user_message"] for r in reversed(rows)]
+        return historial.mensajes(session_id, limite)
     except Exception as e:
-        print(f"❌ Error obteniendo historial: {e}")
+        log.error("❌ Error obteniendo historial: %s", e)
         return []
 
-def get_last_bot_response(channel="web"):
+def get_last_bot_response(session_id):
     try:
-        conn = sqlite3.connect(LOG_PATH)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT bot_response FROM logs WHERE channel = ? ORDER BY id DESC LIMIT 1",
-            (channel,)
-        )
-        row = cur.fetchone()
-        conn.close()
-        return row["bot_response"] if row else None
+        return historial.ultima_respuesta(session_id)
     except Exception as e:
-        print(f"❌ Error obteniendo la última respuesta del bot: {e}")
+        log.error("❌ Error obteniendo la última respuesta del bot: %s", e)
         return None
 
-@lru_cache(maxsize=100)
-def query_properties_cached(filters_json: str):
-    """Versión cacheada de query_properties"""
-    filters = json.loads(filters_json) if filters_json else {}
-    return query_properties(filters)
+PROPERTY_COLUMNS = (
+    "id, title, neighborhood, price, rooms, sqm, description, operacion, tipo, direccion, antiguedad, "
+    "estado, orientacion, piso, expensas, amenities, cochera, balcon, pileta, acepta_mascotas, "
+    "aire_acondicionado, info_multimedia"
+)
 
+def _filtro_texto(columna, valor, vocabulario, where_clauses, params):
+    """Igualdad exacta (usa índice) si el valor es parte del vocabulario del catálogo; si no, LIKE sobre la columna normalizada"""
+    valor_norm = normalizar(valor)
+    if valor_norm in vocabulario:
+        where_clauses.append(f"{columna} = ?")
+        params.append(valor_norm)
+    else:
+        where_clauses.append(f"{columna} LIKE ?")
+        params.append(f"%{valor_norm}%")
+
+def _keyset_propiedades(despues_de, con_rank, where_clauses, params):
+    """Condición "después de la última fila entregada" para el orden (rank,) price, id (price NULL va primero)"""
+    *rank, price, id_ = despues_de
+    if price is None:
+        condicion = "(price IS NOT NULL OR id > ?)"
+        valores = [id_]
+    else:
+        condicion = "(price > ? OR (price = ? AND id > ?))"
+        valores = [price, price, id_]
+    if con_rank:
+        condicion = f"(fts.rank > ? OR (fts.rank = ? AND {condicion}))"
+        valores = [rank[0], rank[0], *valores]
+    where_clauses.append(condicion)
+    params.extend(valores)
+
+def construir_consulta_propiedades(filters=None, limit=50, despues_de=None):
+    """Arma el SELECT (y sus parámetros) que ejecuta query_properties para un dict de filtros.
+
+    El orden se desempata por id (estable entre páginas), con texto libre se devuelve también la
+    relevancia como _rank, y `despues_de` (valores del cursor) pide la página siguiente.
+    """
+    q = f"SELECT {PROPERTY_COLUMNS} FROM properties"
+    params = []
+    orden = "price ASC"
+    
+    # 🔥 Texto libre: se cruza con el índice FTS5 y se ordena por relevancia (BM25)
+    match = consulta_fts(filters["q"]) if filters and filters.get("q") else None
+    if match:
+        q = f"SELECT {PROPERTY_COLUMNS}, fts.rank AS _rank FROM properties"
+        q += (
+            f" JOIN (SELECT rowid AS fts_rowid, bm25(properties_fts, {BM25_WEIGHTS}) AS rank"
+            " FROM properties_fts WHERE properties_fts MATCH ?) fts ON fts.fts_rowid = properties.rowid"
+        )
+        params.append(match)
+        orden = "fts.rank ASC, price ASC"
+    orden += ", id ASC"
+    
+    where_clauses = []
+    if filters:
+        vocabulario = catalog.get().vocabulario
+        
+        if filters.get("operacion"):
+            _filtro_texto("operacion_norm", filters["operacion"], vocabulario["operacion"], where_clauses, params)
+        
+        if filters.get("tipo"):
+            _filtro_texto("tipo_norm", filters["tipo"], vocabulario["tipo"], where_clauses, params)
+        
+        if filters.get("neighborhood"):
+            _filtro_texto("neighborhood_norm", filters["neighborhood"], vocabulario["neighborhood"], where_clauses, params)
+        
+        for key, condicion in (
+            ("min_price", "price >= ?"),
+            ("max_price", "price <= ?"),
+            ("min_rooms", "rooms >= ?"),
+            ("min_sqm", "sqm >= ?"),
+            ("max_sqm", "sqm <= ?"),
+        ):
+            if filters.get(key) is not None:
+                where_clauses.append(condicion)
+                params.append(filters[key])
+    
+    if despues_de is not None:
+        _keyset_propiedades(despues_de, bool(match), where_clauses, params)
+    
+    if where_clauses:
+        q += " WHERE " + " AND ".join(where_clauses)
+    
+    q += f" ORDER BY {orden} LIMIT ?"
+    params.append(limit)
+    return q, params
 
 
+def query_properties(filters=None, limit=50, despues_de=None):
+    """Propiedades que cumplen los filtros (cache -> motor columnar -> SQLite); `despues_de` pide la página siguiente.
 
-def query_properties(filters=None):
+    Con texto libre cada fila trae su relevancia en _rank (para armar el cursor); no modificar las
+    filas devueltas: son las mismas que guarda el cache.
+    """
     try:
-        # Verificar cache primero
-        if filters:
-            cached_results = get_cached_results(filters)
-            if cached_results is not None:
-                print("🔍 Usando resultados cacheados")
-                return cached_results
-        
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
+        # Verificar cache primero (la clave incluye la versión del catálogo: una sincronización con cambios invalida todo)
+        version = version_catalogo()
+        cache_key = query_cache_key(filters, limit, version, despues_de)
+        cached_results = query_cache.get(cache_key)
+        if cached_results is not None:
+            log.debug("🔍 Usando resultados cacheados")
+            return cached_results
         
-        q = "SELECT id, title, neighborhood, price, rooms, sqm, description, operacion, tipo, direccion, antiguedad, estado, orientacion, piso, expensas, amenities, cochera, balcon, pileta, acepta_mascotas, aire_acondicionado, info_multimedia FROM properties"
-        params = []
-        
-        if filters:
-            where_clauses = []
+        # 🔥 Motor columnar en memoria si está activo (al día con la versión); None = resolver con SQLite
+        _reconstruir_motor(version)
+        results = property_engine.buscar(filters, catalog.get().vocabulario, limit, despues_de)
+        if results is None:
+            q, params = construir_consulta_propiedades(filters, limit, despues_de)
             
-            if filters.get("neighborhood"):
-                where_clauses.append("LOWER(neighborhood) LIKE LOWER(?)")
-                params.append(f"%{filters['neighborhood']}%")
-                print(f"🔍 Filtro barrio aplicado: {filters['neighborhood']}")  # <-- AGREGAR ESTE PRINT
-                
-            if filters.get("min_price") is not None:
-                where_clauses.append("price >= ?")
-                params.append(filters["min_price"])
-                print(f"🔍 Filtro precio mínimo: {filters['min_price']}")  # <-- AGREGAR ESTE PRINT
-                
-            if filters.get("max_price") is not None:
-                where_clauses.append("price <= ?")
-                params.append(filters["max_price"])
-                print(f"🔍 Filtro precio máximo: {filters['max_price']}")  # <-- AGREGAR ESTE PRINT
-                
-            if filters.get("operacion"):
-                where_clauses.append("LOWER(operacion) LIKE LOWER(?)")
-                params.append(f"%{filters['operacion']}%")
-                print(f"🔍 Filtro operación: {filters['operacion']}")  # <-- AGREGAR ESTE PRINT
+            log.debug("🔍 Query ejecutada: %s", q)
+            log.debug("🔍 Parámetros: %s", params)
             
-            if filters.get("min_rooms") is not None:
-                where_clauses.append("rooms >= ?")
-                params.append(filters["min_rooms"])
-                print(f"🔍 Filtro ambientes: {filters['min_rooms']}")  # <-- AGREGAR ESTE PRINT
-                
-            if filters.get("tipo"):
-                where_clauses.append("LOWER(tipo) LIKE LOWER(?)")
-                params.append(f"%{filters['tipo']}%")
-                print(f"🔍 Filtro tipo: {filters['tipo']}")  # <-- AGREGAR ESTE PRINT
-                
-            if filters.get("min_sqm") is not None:
-                where_clauses.append("sqm >= ?")
-                params.append(filters["min_sqm"])
-                print(f"🔍 Filtro metros mínimos: {filters['min_sqm']}")  # <-- AGREGAR ESTE PRINT
-                
-            if filters.get("max_sqm") is not None:
-                where_clauses.append("sqm <= ?")
-                params.append(filters["max_sqm"])
-                print(f"🔍 Filtro metros máximos: {filters['max_sqm']}")  # <-- AGREGAR ESTE PRINT
-                
-            if where_clauses:
-                q += " WHERE " + " AND ".join(where_clauses)
-        
-        q += " ORDER BY price ASC LIMIT 50"
-        
-        print(f"🔍 Query ejecutada: {q}")
-        print(f"🔍 Parámetros: {params}")
-        
-        cur.execute(q, params)
-        rows = cur.fetchall()
-        conn.close()
-        
-        results = [dict(r) for r in rows]
+            rows = properties_db.query(q, params)
+            
+            results = [dict(r) for r in rows]
         
-        # DEBUG: Mostrar qué propiedades se encontraron  # <-- AGREGAR ESTA SECCIÓN
-        if results:
-            print(f"✅ {len(results)} propiedades encontradas:")
+        # DEBUG: Mostrar qué propiedades se encontraron (sólo si el nivel lo pide: el bucle no se ejecuta en INFO)
+        if results and log.isEnabledFor(logging.DEBUG):
+            log.debug("✅ %s propiedades encontradas:", len(results))
             for prop in results[:3]:  # Mostrar primeras 3
-                print(f"   📍 {prop['title']} - {prop['neighborhood']} - ${prop['price']} - {prop['tipo']}")
-        else:
-            print("❌ No se encontraron propiedades con los filtros aplicados")
+                log.debug("   📍 %s - %s - $%s - %s", prop['title'], prop['neighborhood'], prop['price'], prop['tipo'])
+        elif not results:
+            log.debug("❌ No se encontraron propiedades con los filtros aplicados")
         
-        # Almacenar en cache si hay filtros
-        if filters and results:
-            cache_query_results(filters, results)
+        # Almacenar en cache (también los vacíos, con TTL corto)
+        cache_query(cache_key, results)
         
         return results
     except Exception as e:
-        print(f"❌ Error en query_properties: {e}")
+        log.error("❌ Error en query_properties: %s", e)
         return []
     
     
 
-def build_prompt(user_text, results=None, filters=None, channel="web", style_hint="", property_details=None):
-    whatsapp_tone = channel == "whatsapp"
+def sin_rank(filas):
+    """Copias de las filas sin la relevancia interna _rank (las originales pueden ser las del cache)."""
+    return [{k: v for k, v in f.items() if k != "_rank"} if "_rank" in f else f for f in filas]
 
+def prompt_template_name(results=None, property_details=None):
+    """Nombre de la plantilla que usará build_prompt (parte de la clave del cache de respuestas)."""
     if property_details:
-        details = "\n".join([f"- {key.replace('_', ' ').capitalize()}: {value}" for key, value in property_details.items()])
-        return (
-            style_hint + f"\n\nEl usuario está pidiendo más detalles sobre la propiedad '{property_details['title']}'. Aquí están todos los detalles de la propiedad:\n"
-            + details
-            + "\n\nRedactá una respuesta cálida y profesional que presente estos detalles de forma clara y atractiva. "
-            "Ofrecé ayuda personalizada y sugerí continuar la conversación por WhatsApp. "
-            "Cerrá con un agradecimiento y tono amable."
-            + ("\nUsá emojis si el canal es WhatsApp." if whatsapp_tone else "")
-        )
-    
-    if results is not None and results:
-        bullets = [
-            f"{r['title']} — {r['neighborhood']} — ${r['price']:,.0f} — {r['rooms']} amb — {r['sqm']} m2"
-            for r in results[:8]
-        ]
-        return (
-            style_hint + f"\n\nEl usuario está buscando propiedades con los siguientes filtros: {filters}. Aquí hay resultados relevantes:\n"
-            + "\n".join(bullets)
-            + "\n\nRedactá una respuesta cálida y profesional que resuma los resultados, "
-            "ofrezca ayuda personalizada y sugiera continuar la conversación por WhatsApp. "
-            "Cerrá con un agradecimiento y tono amable."
-            + ("\nUsá emojis si el canal es WhatsApp." if whatsapp_tone else "")
-        )
-    elif results is not None:
-        return (
-            f"{style_hint}\n\nEl usuario busca propiedades con estos filtros: {filters} pero no hay resultados. "
-            "Redactá una respuesta amable que sugiera alternativas cercanas, pida más detalles "
-            "y ofrezca continuar la conversación por WhatsApp. Cerrá con un agradecimiento."
-            + ("\nUsá emojis si el canal es WhatsApp." if whatsapp_tone else "")
-        )
-    else:
-        return (
-            f"{style_hint}\n\nActuá como asistente inmobiliario para Dante Propiedades. "
-            "Respondé la siguiente consulta de forma cálida, profesional y breve. "
-            "Si es posible, ofrecé continuar por WhatsApp y agradecé el contacto."
-            + ("\nUsá emojis si el canal es WhatsApp." if whatsapp_tone else "")
-            + "\nConsulta: " + user_text
-        )
-
-def log_conversation(user_text, response_text, channel="web", response_time=0.0, search_performed=False, results_count=0):
+        return "detalle_propiedad"
+    if results:
+        return "resultados"
+    if results is not None:
+        return "sin_resultados"
+    return "general"
+
+def build_prompt(user_text, results=None, filters=None, channel="web", historial_reciente=(), property_details=None, template=None):
+    """Prompt dentro del presupuesto de tokens del canal (ver prompts.py); `template` fuerza la plantilla."""
+    template = template or prompt_template_name(results, property_details)
+    return prompts.armar(template, channel, user_text, filters, results, property_details, historial_reciente, catalog.get())
+
+async def en_hilo_si_compartido(funcion, *args):
+    """Con SHARED_STATE la función lee/escribe el SQLite compartido (puede esperar su lock): va a un hilo aparte.
+
+    Sin él (cache y ring buffer en memoria) se llama directo; lo que siempre toca SQLite, como
+    preparar_consulta, va siempre por asyncio.to_thread"""
+    if shared_state.enabled:
+        return await asyncio.to_thread(funcion, *args)
+    return funcion(*args)
+
+async def log_conversation(user_text, response_text, channel="web", response_time=0.0, search_performed=False, results_count=0, session_id=None):
+    """Suma el turno al historial de la sesión y encola el registro para el writer en segundo plano (no espera al disco)"""
     try:
-        conn = sqlite3.connect(LOG_PATH)
-        cur = conn.cursor()
-        cur.execute('''
-            INSERT INTO logs (timestamp, channel, user_message, bot_response, response_time, search_performed, results_count)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (datetime.now().isoformat(), channel, user_text, response_text, response_time, search_performed, results_count))
-        conn.commit()
-        conn.close()
+        await en_hilo_si_compartido(historial.agregar, session_id, user_text, response_text)
+        await log_writer.submit(
+            (datetime.now().isoformat(), channel, user_text, response_text, response_time, search_performed, results_count, session_id)
+        )
     except Exception as e:
-        print(f"❌ Error en log: {e}")
+        log.error("❌ Error en log: %s", e)
 
 def detect_filters(text_lower: str) -> Dict[str, Any]:
-    """Detecta y extrae filtros del texto del usuario - VERSIÓN MEJORADA Y GENÉRICA"""
-    import re
-    filters = {}
-    
-    # Lista COMPLETA de barrios (expandible)
-    barrio_keywords = [
-        'palermo', 'recoleta', 'belgrano', 'almagro', 'caballito',
-        'microcentro', 'balvanera', 'villa crespo', 'san telmo', 'boca',
-        'nuñez', 'monserrat', 'constitución', 'flores', 'parque chas',
-        'villa urquiza', 'boedo', 'villa luro', 'villa devoto', 'villa soldati',
-        'villa ramos mejía', 'liniers', 'mataderos', 'velez sarsfield', 'versalles',
-        'paternal', 'chacarita', 'agronomia', 'villa pueyrredón', 'saavedra',
-        'coghlan', 'belgrano r', 'belgrano c', 'nuñez', 'olivos', 'san isidro',
-        'vicente lopez', 'puerto madero', 'colegiales', 'soho', 'barrio norte'
-    ]
-    
-    operacion_keywords = {
-        'alquiler': 'alquiler',
-        'alquilar': 'alquiler', 
-        'renta': 'alquiler',
-        'venta': 'venta',
-        'comprar': 'venta',
-        'compra': 'venta',
-        'vender': 'venta'
-    }
-    
-    tipo_keywords = {
-        'departamento': 'departamento',
-        'depto': 'departamento',
-        'casa': 'casa',
-        'ph': 'ph',
-        'casaquinta': 'casaquinta',
-        'terreno': 'terreno',
-        'terrenos': 'terreno',
-        'lote': 'terreno',
-        'lotes': 'terreno'
-    }
-    
-    # 🔥 DETECCIÓN MEJORADA DE BARRIO (MÁS FLEXIBLE)
-    barrio_detectado = None
-    
-    # 1. Detectar barrio por palabras clave exactas
-    for barrio in barrio_keywords:
-        if barrio in text_lower:
-            barrio_detectado = barrio
-            print(f"📍 Barrio detectado (keyword): {barrio_detectado}")
-            break
-    
-    # 2. Si no se detectó, buscar con patrones regex (más flexible)
-    if not barrio_detectado:
-        barrio_patterns = [
-            r"en ([a-zA-Záéíóúñ\s]+)",           # "en Palermo", "en Belgrano R"
-            r"barrio ([a-zA-Záéíóúñ\s]+)",       # "barrio Palermo"
-            r"zona ([a-zA-Záéíóúñ\s]+)",         # "zona Recoleta"  
-            r"de ([a-zA-Záéíóúñ\s]+)$",          # "departamento de Palermo"
-            r"el de ([a-zA-Záéíóúñ\s]+)",        # "el de Colegiales"
-            r"la de ([a-zA-Záéíóúñ\s]+)",        # "la de Villa Crespo"
-        ]
-        
-        for pattern in barrio_patterns:
-            match = re.search(pattern, text_lower)
-            if match:
-                potential_barrio = match.group(1).strip().lower()
-                # Verificar que sea un barrio válido y no otra palabra
-                if (potential_barrio in barrio_keywords and 
-                    potential_barrio not in operacion_keywords and
-                    potential_barrio not in tipo_keywords):
-                    barrio_detectado = potential_barrio
-                    print(f"📍 Barrio detectado (regex): {barrio_detectado}")
-                    break
-    
-    if barrio_detectado:
-        filters["neighborhood"] = barrio_detectado
-    
-    # 🔥 DETECCIÓN MEJORADA DE TIPO
-    for keyword, tipo in tipo_keywords.items():
-        if keyword in text_lower:
-            filters["tipo"] = tipo
-            print(f"🏠 Tipo detectado: {filters['tipo']}")
-            break
-    
-    # 🔥 DETECCIÓN MEJORADA DE OPERACIÓN
-    for keyword, operacion in operacion_keywords.items():
-        if keyword in text_lower:
-            filters["operacion"] = operacion
-            print(f"🏢 Operación detectada: {filters['operacion']}")
-            break
-    
-    # 🔥 DETECCIÓN GENÉRICA DE PRECIO
-    precio_patterns = [
-        r"hasta \$?\s*([0-9\.]+)",           # "hasta $280000"
-        r"máximo \$?\s*([0-9\.]+)",          # "máximo 280000"
-        r"precio.*?\$?\s*([0-9\.]+)",        # "precio 280000"
-        r"menos de \$?\s*([0-9\.]+)",        # "menos de 280000"
-        r"\$?\s*([0-9\.]+)\s*pesos",         # "280000 pesos"
-        r"de \$?\s*([0-9\.]+)",              # "de $280000"
-        r"valor.*?\$?\s*([0-9\.]+)",         # "valor 280000"
-    ]
-    
-    for pattern in precio_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            try:
-                precio = int(match.group(1).replace('.', ''))
-                filters["max_price"] = precio
-                print(f"💰 Precio máximo detectado: ${precio}")
-                break
-            except ValueError:
-                continue
-    
-    # Precio mínimo
-    min_price_match = re.search(r"desde \$?\s*([0-9\.]+)", text_lower)
-    if min_price_match:
-        try:
-            min_price = int(min_price_match.group(1).replace('.', ''))
-            filters["min_price"] = min_price
-            print(f"💰 Precio mínimo detectado: ${min_price}")
-        except ValueError:
-            pass
-    
-    # Ambientes
-    rooms_match = re.search(r"(\d+)\s*amb", text_lower)
-    if rooms_match:
-        filters["min_rooms"] = int(rooms_match.group(1))
-        print(f"🚪 Ambientes detectados: {filters['min_rooms']}")
-    
-    # Metros cuadrados
-    sqm_match = re.search(r"(\d+)\s*m2", text_lower) or re.search(r"(\d+)\s*metros", text_lower)
-    if sqm_match:
-        filters["min_sqm"] = int(sqm_match.group(1))
-        print(f"📏 Metros cuadrados detectados: {filters['min_sqm']}")
-
-    print(f"🎯 Filtros finales detectados: {filters}")
+    """Detecta y extrae filtros del texto del usuario (extractor compilado con el vocabulario del catálogo)"""
+    filters = extractor_para(catalog.get()).extraer(text_lower).as_dict()
+    log.debug("🎯 Filtros finales detectados: %s", filters)
     return filters
 
 
@@ -969,25 +449,33 @@ def detect_filters(text_lower: str) -> Dict[str, Any]:
 
 
 # ✅ ENDPOINTS MEJORADOS
+@app.get("/healthz")
+def healthz():
+    """Liveness: el proceso responde (sin tocar bases ni Gemini)"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: último resultado del chequeo en segundo plano (bases + claves Gemini); 503 si no está listo"""
+    estado = sondeo.estado()
+    return JSONResponse(estado, status_code=200 if estado["ready"] else 503)
+
 @app.get("/status")
 def status():
-    """Endpoint de estado del servicio"""
-    test_prompt = "Respondé solo con OK"
-    try:
-        response = call_gemini_with_rotation(test_prompt)
-        gemini_status = "OK" if "OK" in response else "ERROR"
-    except Exception as e:
-        gemini_status = f"ERROR: {str(e)}"
+    """Endpoint de estado del servicio (Gemini según el último chequeo de salud, sin llamar a la API)"""
+    claves = sondeo.estado()["checks"].get("gemini_keys", {})
+    gemini_status = "OK" if claves.get("healthy") else "ERROR: sin claves sanas"
     
+    contadores = metrics.snapshot()
     return {
         "status": "activo",
         "gemini_api": gemini_status,
         "uptime_seconds": metrics.get_uptime(),
-        "total_requests": metrics.requests_count,
-        "successful_requests": metrics.successful_requests,
-        "failed_requests": metrics.failed_requests,
-        "gemini_calls": metrics.gemini_calls,
-        "search_queries": metrics.search_queries
+        "total_requests": contadores["requests_count"],
+        "successful_requests": contadores["successful_requests"],
+        "failed_requests": contadores["failed_requests"],
+        "gemini_calls": contadores["gemini_calls"],
+        "search_queries": contadores["search_queries"]
     }
 
 @app.get("/")
@@ -995,38 +483,92 @@ def root():
     return {
         "status": "Backend activo",
         "endpoint": "/chat",
+        "streaming": "/chat/stream (Server-Sent Events)",
         "método": "POST",
         "uso": "Enviar mensaje como JSON: { message: '...', channel: 'web', filters: {...} }",
         "documentación": "/docs"
     }
 
+LOG_COLUMNS = ("id", "timestamp", "channel", "session_id", "user_message", "bot_response", "response_time", "search_performed", "results_count")
+
+def _filtros_logs(channel=None, session_id=None, desde=None, hasta=None):
+    """WHERE (y parámetros) comunes a /logs y /logs/export; desde/hasta comparan contra el timestamp ISO"""
+    where, params = [], []
+    for condicion, valor in (("session_id = ?", session_id), ("channel = ?", channel), ("timestamp >= ?", desde), ("timestamp < ?", hasta)):
+        if valor:
+            where.append(condicion)
+            params.append(valor)
+    return where, params
+
 @app.get("/logs")
-def get_logs(limit: int = 10, channel: Optional[str] = None):
-    """Obtiene logs de conversaciones con filtros opcionales"""
+def get_logs(limit: int = 10, channel: Optional[str] = None, session_id: Optional[str] = None, cursor: Optional[str] = None):
+    """Obtiene logs de conversaciones con filtros opcionales, del más nuevo al más viejo.
+
+    Paginación por cursor: el header X-Next-Cursor (vacío en la última página) se pasa como ?cursor=.
+    """
+    despues_de = decodificar_cursor(cursor, 1)
     try:
-        conn = sqlite3.connect(LOG_PATH)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        
-        if channel:
-            cur.execute(
-                "SELECT timestamp, channel, user_message, bot_response, response_time, search_performed, results_count FROM logs WHERE channel = ? ORDER BY id DESC LIMIT ?",
-                (channel, limit)
-            )
-        else:
-            cur.execute(
-                "SELECT timestamp, channel, user_message, bot_response, response_time, search_performed, results_count FROM logs ORDER BY id DESC LIMIT ?",
-                (limit,)
-            )
-        
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        where, params = _filtros_logs(channel, session_id)
+        if despues_de is not None:
+            where.append("id < ?")
+            params.append(despues_de[0])
+        rows = logs_db.query(
+            f"SELECT {', '.join(LOG_COLUMNS)} FROM logs"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY id DESC LIMIT ?",
+            (*params, limit + 1)
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo logs: {str(e)}")
+    
+    logs = [dict(r) for r in rows[:limit]]
+    siguiente = codificar_cursor([logs[-1]["id"]]) if len(rows) > limit and logs else ""
+    return JSONResponse(logs, headers={"X-Next-Cursor": siguiente})
+
+@app.get("/logs/export")
+def export_logs(format: str = "ndjson", channel: Optional[str] = None, session_id: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None):
+    """Descarga los logs (del más viejo al más nuevo) en NDJSON o CSV, en streaming y con memoria constante"""
+    where, params = _filtros_logs(channel, session_id, desde, hasta)
+    filas = logs_db.stream(
+        f"SELECT {', '.join(LOG_COLUMNS)} FROM logs" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id",
+        params
+    )
+    return respuesta_export((dict(f) for f in filas), LOG_COLUMNS, format, "logs")
+
+@app.get("/logs/stats")
+def get_logs_stats(period: str = "day", channel: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None, limit: int = 60):
+    """Analítica de conversaciones desde los resúmenes (logs_rollup), sin recorrer la tabla logs.
+
+    period "hour" o "day"; desde/hasta comparan contra el inicio del período (AAAA-MM-DD o AAAA-MM-DDTHH:00).
+    Cubre hasta la última hora cerrada que procesó la retención.
+    """
+    if period not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="period debe ser 'hour' o 'day'")
+    where, params = ["period = ?"], [period]
+    if channel:
+        where.append("channel = ?")
+        params.append(channel)
+    if desde:
+        where.append("bucket >= ?")
+        params.append(desde)
+    if hasta:
+        where.append("bucket <= ?")
+        params.append(hasta)
+    rows = logs_db.query(
+        "SELECT bucket, channel, turns, searches, zero_results, results_total, avg_ms, p50_ms, p95_ms, p99_ms "
+        f"FROM logs_rollup WHERE {' AND '.join(where)} ORDER BY bucket DESC, channel LIMIT ?",
+        (*params, limit)
+    )
+    return [
+        {
+            **dict(r),
+            "search_rate": round(r["searches"] / r["turns"], 3) if r["turns"] else 0.0,
+            "avg_results": round(r["results_total"] / r["searches"], 2) if r["searches"] else 0.0,
+        }
+        for r in rows
+    ]
 
-@app.get("/properties")
-def get_properties(
+def filtros_propiedades(
     neighborhood: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
@@ -1035,9 +577,9 @@ def get_properties(
     tipo: Optional[str] = None,
     min_sqm: Optional[float] = None,
     max_sqm: Optional[float] = None,
-    limit: int = 20
-):
-    """Endpoint directo para buscar propiedades con filtros"""
+    q: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Filtros de /properties y /properties/export a partir de los parámetros de la URL"""
     filters = {}
     if neighborhood:
         filters["neighborhood"] = neighborhood
@@ -1055,14 +597,41 @@ def get_properties(
         filters["min_sqm"] = min_sqm
     if max_sqm is not None:
         filters["max_sqm"] = max_sqm
+    if q:
+        filters["q"] = q
+    return filters
+
+@app.get("/properties")
+def get_properties(filters: Dict[str, Any] = Depends(filtros_propiedades), limit: int = 20, cursor: Optional[str] = None):
+    """Endpoint directo para buscar propiedades con filtros (q= texto libre, ordenado por relevancia).
+
+    Orden estable por precio (o relevancia) e id; next_cursor se pasa como ?cursor= para la página siguiente.
+    Cada página pasa por query_properties (cache de búsquedas y motor columnar, como /chat).
+    """
+    con_rank = bool(filters.get("q") and consulta_fts(filters["q"]))
+    despues_de = decodificar_cursor(cursor, 3 if con_rank else 2)
+    rows = query_properties(filters, limit + 1, despues_de)
     
-    results = query_properties(filters)
+    results = sin_rank(rows[:limit])
+    siguiente = None
+    if len(rows) > limit and results:
+        ultima = rows[limit - 1]
+        siguiente = codificar_cursor(([ultima["_rank"]] if con_rank else []) + [ultima["price"], ultima["id"]])
     return {
         "count": len(results),
         "filters": filters,
-        "properties": results[:limit]
+        "properties": results,
+        "next_cursor": siguiente
     }
 
+@app.get("/properties/export")
+def export_properties(filters: Dict[str, Any] = Depends(filtros_propiedades), format: str = "ndjson"):
+    """Descarga todas las propiedades que cumplen los filtros en NDJSON o CSV, en streaming"""
+    q, params = construir_consulta_propiedades(filters, -1)
+    columnas = [c.strip() for c in PROPERTY_COLUMNS.split(",")]
+    filas = ({k: f[k] for k in columnas} for f in properties_db.stream(q, params))
+    return respuesta_export(filas, columnas, format, "propiedades")
+
 @app.get("/debug")
 def debug_info():
     """Endpoint de diagnóstico para producción"""
@@ -1095,143 +664,224 @@ def debug_info():
 
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """Endpoint principal para chat con el asistente inmobiliario"""
-    start_time = time.time()
-    metrics.increment_requests()
+def preparar_consulta(request: ChatRequest, cronometro: Optional[Cronometro] = None) -> Dict[str, Any]:
+    """Todo el pipeline de /chat previo a Gemini: contexto, filtros, búsqueda, prompt y clave de cache.
+
+    Lo comparten /chat y /chat/stream; no hace llamadas de red. Si se pasa un cronometro, anota
+    cuánto tardó cada etapa (catalog, history, filters, db_query, prompt).
+    """
+    cronometro = cronometro or Cronometro()
+    user_text = request.message.strip()
+    channel = request.channel.strip()
+    session_id = (request.session_id or "").strip() or None
+    filters_from_frontend = request.filters if request.filters else {}
+
+    # 👇 AGREGAR DETECCIÓN DE CONTEXTO
+    contexto_anterior = request.contexto_anterior if hasattr(request, 'contexto_anterior') else None
+    es_seguimiento = request.es_seguimiento if hasattr(request, 'es_seguimiento') else False
+
+    if not user_text:
+        raise HTTPException(status_code=400, detail="El mensaje no puede estar vacío")
+
+    log.debug("📥 Mensaje recibido: %s", user_text)
+    log.debug("📱 Canal: %s", channel)
+    log.debug("🎯 Filtros del frontend: %s", filters_from_frontend)
+    # 👇 AGREGAR LOGS DE CONTEXTO
+    log.debug("🔍 CONTEXTO - Es seguimiento: %s", es_seguimiento)
+    if contexto_anterior:
+        log.debug("📋 Contexto anterior: %s propiedades", len(contexto_anterior.get('resultados', [])))
+        if contexto_anterior.get('resultados'):
+            primera_propiedad = contexto_anterior['resultados'][0]
+            log.debug("🏠 Propiedad en contexto: %s - $%s", primera_propiedad.get('title', 'N/A'), primera_propiedad.get('price', 'N/A'))
+
+    # Catálogo en memoria (vocabularios precalculados)
+    with cronometro.etapa("catalog"):
+        snapshot = catalog.get()
     
-    try:
-        user_text = request.message.strip()
-        channel = request.channel.strip()
-        filters_from_frontend = request.filters if request.filters else {}
-
-        # 👇 AGREGAR DETECCIÓN DE CONTEXTO
-        contexto_anterior = request.contexto_anterior if hasattr(request, 'contexto_anterior') else None
-        es_seguimiento = request.es_seguimiento if hasattr(request, 'es_seguimiento') else False
-
-        if not user_text:
-            raise HTTPException(status_code=400, detail="El mensaje no puede estar vacío")
-
-        print(f"📥 Mensaje recibido: {user_text}")
-        print(f"📱 Canal: {channel}")
-        print(f"🎯 Filtros del frontend: {filters_from_frontend}")
-        # 👇 AGREGAR LOGS DE CONTEXTO
-        print(f"🔍 CONTEXTO - Es seguimiento: {es_seguimiento}")
-        if contexto_anterior:
-            print(f"📋 Contexto anterior: {len(contexto_anterior.get('resultados', []))} propiedades")
-            if contexto_anterior.get('resultados'):
-                primera_propiedad = contexto_anterior['resultados'][0]
-                print(f"🏠 Propiedad en contexto: {primera_propiedad.get('title', 'N/A')} - ${primera_propiedad.get('price', 'N/A')}")
-
-        # Cargar datos de propiedades desde JSON
-        propiedades_json = cargar_propiedades_json("properties.json")
-        barrios_disponibles = extraer_barrios(propiedades_json)
-        tipos_disponibles = extraer_tipos(propiedades_json)
-        operaciones_disponibles = extraer_operaciones(propiedades_json)
-        
-        historial = get_historial_canal(channel)
-        contexto_historial = "\nHistorial reciente:\n" + "\n".join(f"- {m}" for m in historial) if historial else ""
+    with cronometro.etapa("history"):
+        mensajes_previos = get_historial_sesion(session_id)
+
+    text_lower = user_text.lower()
+    filters, results = {}, None
+    search_performed = False
+    property_details = None
+
+    # 👇 AGREGAR DETECCIÓN MEJORADA DE SEGUIMIENTO
+    palabras_seguimiento_backend = [
+        'más', 'mas', 'detalles', 'brindar', 'brindame', 'dime', 'cuéntame', 
+        'cuentame', 'información', 'informacion', 'características', 'caracteristicas',
+        'este', 'esta', 'ese', 'esa', 'primero', 'primera', 'segundo', 'segunda',
+        'propiedad', 'departamento', 'casa', 'ph', 'casaquinta', 'terreno', 'terrenos'
+    ]
 
-        contexto_dinamico = (
-            f"Barrios disponibles: {', '.join(barrios_disponibles)}.\n"
-            f"Tipos de propiedad: {', '.join(tipos_disponibles)}.\n"
-            f"Operaciones disponibles: {', '.join(operaciones_disponibles)}."
-        )
+    es_seguimiento_backend = any(palabra in text_lower for palabra in palabras_seguimiento_backend)
 
-        text_lower = user_text.lower()
-        filters, results = {}, None
-        search_performed = False
-        property_details = None
-
-        # 👇 AGREGAR DETECCIÓN MEJORADA DE SEGUIMIENTO
-        palabras_seguimiento_backend = [
-            'más', 'mas', 'detalles', 'brindar', 'brindame', 'dime', 'cuéntame', 
-            'cuentame', 'información', 'informacion', 'características', 'caracteristicas',
-            'este', 'esta', 'ese', 'esa', 'primero', 'primera', 'segundo', 'segunda',
-            'propiedad', 'departamento', 'casa', 'ph', 'casaquinta', 'terreno', 'terrenos'
-        ]
-
-        es_seguimiento_backend = any(palabra in text_lower for palabra in palabras_seguimiento_backend)
-
-        # COMBINAR: seguimiento del frontend + detección backend
-        es_seguimiento_final = es_seguimiento or es_seguimiento_backend
-
-        print(f"🔍 CONTEXTO - Es seguimiento frontend: {es_seguimiento}")
-        print(f"🔍 CONTEXTO - Es seguimiento backend: {es_seguimiento_backend}")
-        print(f"🔍 CONTEXTO - Es seguimiento FINAL: {es_seguimiento_final}")
-
-        if contexto_anterior:
-            print(f"📋 Contexto anterior recibido: {len(contexto_anterior.get('resultados', []))} propiedades")
-            if contexto_anterior.get('resultados'):
-                primera_propiedad = contexto_anterior['resultados'][0]
-                print(f"🏠 Propiedad en contexto: {primera_propiedad.get('title', 'N/A')} - ${primera_propiedad.get('price', 'N/A')}")
-        
-        # 👇 DETECCIÓN MEJORADA DE SEGUIMIENTO (usa contexto o historial)
-        
-        # PRIORIDAD 1: Usar contexto del frontend si está disponible
+    # COMBINAR: seguimiento del frontend + detección backend
+    es_seguimiento_final = es_seguimiento or es_seguimiento_backend
 
+    log.debug("🔍 CONTEXTO - Es seguimiento frontend: %s", es_seguimiento)
+    log.debug("🔍 CONTEXTO - Es seguimiento backend: %s", es_seguimiento_backend)
+    log.debug("🔍 CONTEXTO - Es seguimiento FINAL: %s", es_seguimiento_final)
 
+    if contexto_anterior:
+        log.debug("📋 Contexto anterior recibido: %s propiedades", len(contexto_anterior.get('resultados', [])))
+        if contexto_anterior.get('resultados'):
+            primera_propiedad = contexto_anterior['resultados'][0]
+            log.debug("🏠 Propiedad en contexto: %s - $%s", primera_propiedad.get('title', 'N/A'), primera_propiedad.get('price', 'N/A'))
+    
+    # 👇 DETECCIÓN MEJORADA DE SEGUIMIENTO (usa contexto o historial)
+    
+    # PRIORIDAD 1: Usar contexto del frontend si está disponible
 
-        if es_seguimiento and contexto_anterior and contexto_anterior.get('resultados'):
-            print("🎯 Usando contexto del frontend para seguimiento")
-            propiedades_contexto = contexto_anterior['resultados']
+
+
+    if es_seguimiento and contexto_anterior and contexto_anterior.get('resultados'):
+        log.debug("🎯 Usando contexto del frontend para seguimiento")
+        propiedades_contexto = contexto_anterior['resultados']
+        if propiedades_contexto:
+            # 🔥 REEMPLAZAR CON LÓGICA DE DETECCIÓN INTELIGENTE:
+            propiedad_especifica = None
+            
+            # 1. Detectar por PRECIO específico
+            import re
+            precio_pattern = r'(?:\$?\s*)?(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d+)?)\s*(?:mil|mil|k|K)?'
+            match_precio = re.search(precio_pattern, user_text)
+            log.debug("🔍 DEBUG Precio - Match: %s", match_precio)
+            log.debug("🔍 DEBUG Precio - Texto original: '%s'", user_text)
+            
+            if match_precio:
+                precio_texto = match_precio.group(1)
+                log.debug("🔍 DEBUG Precio - Texto capturado: '%s'", precio_texto)
+                
+                precio_limpio = precio_texto.replace('.', '').replace(',', '')
+                log.debug("🔍 DEBUG Precio - Texto limpio: '%s'", precio_limpio)
+                
+                try:
+                    precio_buscado = int(precio_limpio)
+                    log.debug("🎯 Precio detectado en consulta: $%s", precio_buscado)
+                    
+                    for prop in propiedades_contexto:
+                        log.debug("🔍 DEBUG - Comparando: %s - $%s", prop.get('title'), prop.get('price'))
+                        if prop.get('price') == precio_buscado:
+                            propiedad_especifica = prop
+                            log.debug("🎯 Detectada propiedad por precio: %s - $%s", propiedad_especifica.get('title'), propiedad_especifica.get('price'))
+                            break
+                    if not propiedad_especifica:
+                        log.warning("⚠️ No se encontró propiedad con precio $%s", precio_buscado)
+                except ValueError as e:
+                    log.warning("⚠️ No se pudo convertir el precio detectado: %s", e)
+            
+            # 2. Detectar por BARRIO específico
+            if not propiedad_especifica:
+                barrios = ["colegiales", "palermo", "boedo", "belgrano", "recoleta", "soho","almagro", "villa crespo", "san isidro", "vicente lopez"]
+                for barrio in barrios:
+                    if barrio in user_text.lower():
+                        for prop in propiedades_contexto:
+                           if (barrio in prop.get('neighborhood', '').lower() or 
+                                barrio in prop.get('title', '').lower()):
+                                propiedad_especifica = prop
+                                log.debug("🎯 Detectada propiedad por barrio: %s - %s", propiedad_especifica.get('title'), propiedad_especifica.get('neighborhood'))
+                                break
+                        if propiedad_especifica:
+                            break
+
+            # 3. Detectar por TIPO específico
+            if not propiedad_especifica:
+                tipos = ["departamento", "casa", "ph", "terreno"]
+                for tipo in tipos:
+                    if tipo in user_text.lower():
+                        for prop in propiedades_contexto:
+                            if tipo in prop.get('tipo', '').lower():
+                                propiedad_especifica = prop
+                                log.debug("🎯 Detectada propiedad por tipo: %s - %s", propiedad_especifica.get('title'), propiedad_especifica.get('tipo'))
+                                break
+                        if propiedad_especifica:
+                            break
+
+            # 4. Detectar por NÚMERO (primero, segundo, etc.)
+            if not propiedad_especifica:
+                if any(word in user_text.lower() for word in ['primero', 'primera', '1']):
+                    propiedad_especifica = propiedades_contexto[0]
+                    log.debug("🎯 Detectada primera propiedad: %s", propiedad_especifica.get('title'))
+                elif any(word in user_text.lower() for word in ['segundo', 'segunda', '2']) and len(propiedades_contexto) > 1:
+                    propiedad_especifica = propiedades_contexto[1]
+                    log.debug("🎯 Detectada segunda propiedad: %s", propiedad_especifica.get('title'))
+                elif any(word in user_text.lower() for word in ['tercero', 'tercera', '3']) and len(propiedades_contexto) > 2:
+                    propiedad_especifica = propiedades_contexto[2]
+                    log.debug("🎯 Detectada tercera propiedad: %s", propiedad_especifica.get('title'))
+
+            # 5. Si no se detecta específicamente, usar la primera del contexto
+            if not propiedad_especifica and propiedades_contexto:
+                propiedad_especifica = propiedades_contexto[0]
+                log.debug("🎯 Usando primera propiedad por defecto: %s", propiedad_especifica.get('title'))
+            
+            property_details = propiedad_especifica
+            log.debug("🏠 Propiedad seleccionada: %s", property_details.get('title', 'N/A'))
+          
+    
+    # PRIORIDAD 2: Si no hay contexto, usar detección por palabras clave MEJORADA
+    elif any(keyword in text_lower for keyword in [
+        "más información", "mas informacion", "más detalles", "mas detalles", 
+        "brindar", "dime más", "cuéntame más", "información del", "detalles del",
+        "primero", "primera", "este", "esta", "ese", "esa", "el de", "la de"
+    ]):
+        log.debug("🔍 Detectado seguimiento por palabras clave")
+        
+        # Si hay contexto anterior, usarlo directamente
+        if contexto_anterior and contexto_anterior.get('resultados'):
+            propiedades_contexto = contexto_anterior['resultados']              
             if propiedades_contexto:
-                # 🔥 REEMPLAZAR CON LÓGICA DE DETECCIÓN INTELIGENTE:
+                # DETECTAR QUÉ PROPIEDAD ESPECÍFICA QUIERE
                 propiedad_especifica = None
+                import re
                 
                 # 1. Detectar por PRECIO específico
                 import re
                 precio_pattern = r'(?:\$?\s*)?(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d+)?)\s*(?:mil|mil|k|K)?'
                 match_precio = re.search(precio_pattern, user_text)
-                print(f"🔍 DEBUG Precio - Match: {match_precio}")
-                print(f"🔍 DEBUG Precio - Texto original: '{user_text}'")
+                log.debug("🔍 DEBUG Precio - Match: %s", match_precio)
                 
                 if match_precio:
-                    precio_texto = match_precio.group(1)
-                    print(f"🔍 DEBUG Precio - Texto capturado: '{precio_texto}'")
-                    
-                    precio_limpio = precio_texto.replace('.', '').replace(',', '')
-                    print(f"🔍 DEBUG Precio - Texto limpio: '{precio_limpio}'")
+                    precio_texto = match_precio.group(1).replace('.', '').replace(',', '')
+                    log.debug("🔍 DEBUG Precio - Texto: %s", precio_texto)
                     
                     try:
-                        precio_buscado = int(precio_limpio)
-                        print(f"🎯 Precio detectado en consulta: ${precio_buscado}")
+                        precio_buscado = int(precio_texto)
+                        log.debug("🎯 Precio detectado en consulta: $%s", precio_buscado)
                         
                         for prop in propiedades_contexto:
-                            print(f"🔍 DEBUG - Comparando: {prop.get('title')} - ${prop.get('price')}")
+                            log.debug("🔍 DEBUG - Comparando: %s - $%s", prop.get('title'), prop.get('price'))
                             if prop.get('price') == precio_buscado:
                                 propiedad_especifica = prop
-                                print(f"🎯 Detectada propiedad por precio: {propiedad_especifica.get('title')} - ${propiedad_especifica.get('price')}")
+                                log.debug("🎯 Detectada propiedad por precio: %s - $%s", propiedad_especifica.get('title'), propiedad_especifica.get('price'))
                                 break
-                        if not propiedad_especifica:
-                            print(f"⚠️ No se encontró propiedad con precio ${precio_buscado}")
                     except ValueError as e:
-                        print(f"⚠️ No se pudo convertir el precio detectado: {e}")
-                
+                        log.warning("⚠️ No se pudo convertir el precio detectado: %s", e)
+               
+                # 🔥 CORRECCIÓN CRÍTICA: AGREGAR 'elif' AQUÍ
                 # 2. Detectar por BARRIO específico
                 if not propiedad_especifica:
-                    barrios = ["colegiales", "palermo", "boedo", "belgrano", "recoleta", "soho","almagro", "villa crespo", "san isidro", "vicente lopez"]
+                    barrios = ["colegiales", "palermo", "soho","boedo", "belgrano", "recoleta", "almagro", "villa crespo", "san isidro", "vicente lopez"]
                     for barrio in barrios:
                         if barrio in user_text.lower():
                             for prop in propiedades_contexto:
-                               if (barrio in prop.get('neighborhood', '').lower() or 
+                                if (barrio in prop.get('neighborhood', '').lower() or 
                                     barrio in prop.get('title', '').lower()):
                                     propiedad_especifica = prop
-                                    print(f"🎯 Detectada propiedad por barrio: {propiedad_especifica.get('title')} - {propiedad_especifica.get('neighborhood')}")
+                                    log.debug("🎯 Detectada propiedad por barrio: %s - %s", propiedad_especifica.get('title'), propiedad_especifica.get('neighborhood'))
                                     break
                             if propiedad_especifica:
                                 break
 
                 # 3. Detectar por TIPO específico
-                if not propiedad_especifica:
+                elif not propiedad_especifica:
                     tipos = ["departamento", "casa", "ph", "terreno"]
                     for tipo in tipos:
                         if tipo in user_text.lower():
                             for prop in propiedades_contexto:
                                 if tipo in prop.get('tipo', '').lower():
                                     propiedad_especifica = prop
-                                    print(f"🎯 Detectada propiedad por tipo: {propiedad_especifica.get('title')} - {propiedad_especifica.get('tipo')}")
+                                    log.debug("🎯 Detectada propiedad por tipo: %s - %s", propiedad_especifica.get('title'), propiedad_especifica.get('tipo'))
                                     break
                             if propiedad_especifica:
                                 break
@@ -1240,237 +890,160 @@ async def chat(request: ChatRequest):
                 if not propiedad_especifica:
                     if any(word in user_text.lower() for word in ['primero', 'primera', '1']):
                         propiedad_especifica = propiedades_contexto[0]
-                        print(f"🎯 Detectada primera propiedad: {propiedad_especifica.get('title')}")
+                        log.debug("🎯 Detectada primera propiedad: %s", propiedad_especifica.get('title'))
                     elif any(word in user_text.lower() for word in ['segundo', 'segunda', '2']) and len(propiedades_contexto) > 1:
                         propiedad_especifica = propiedades_contexto[1]
-                        print(f"🎯 Detectada segunda propiedad: {propiedad_especifica.get('title')}")
+                        log.debug("🎯 Detectada segunda propiedad: %s", propiedad_especifica.get('title'))
                     elif any(word in user_text.lower() for word in ['tercero', 'tercera', '3']) and len(propiedades_contexto) > 2:
                         propiedad_especifica = propiedades_contexto[2]
-                        print(f"🎯 Detectada tercera propiedad: {propiedad_especifica.get('title')}")
+                        log.debug("🎯 Detectada tercera propiedad: %s", propiedad_especifica.get('title'))
 
                 # 5. Si no se detecta específicamente, usar la primera del contexto
                 if not propiedad_especifica and propiedades_contexto:
                     propiedad_especifica = propiedades_contexto[0]
-                    print(f"🎯 Usando primera propiedad por defecto: {propiedad_especifica.get('title')}")
+                    log.debug("🎯 Usando primera propiedad por defecto: %s", propiedad_especifica.get('title'))
                 
                 property_details = propiedad_especifica
-                print(f"🏠 Propiedad seleccionada: {property_details.get('title', 'N/A')}")
-              
-        
-        # PRIORIDAD 2: Si no hay contexto, usar detección por palabras clave MEJORADA
-        elif any(keyword in text_lower for keyword in [
-            "más información", "mas informacion", "más detalles", "mas detalles", 
-            "brindar", "dime más", "cuéntame más", "información del", "detalles del",
-            "primero", "primera", "este", "esta", "ese", "esa", "el de", "la de"
-        ]):
-            print("🔍 Detectado seguimiento por palabras clave")
-            
-            # Si hay contexto anterior, usarlo directamente
-            if contexto_anterior and contexto_anterior.get('resultados'):
-                propiedades_contexto = contexto_anterior['resultados']              
-                if propiedades_contexto:
-                    # DETECTAR QUÉ PROPIEDAD ESPECÍFICA QUIERE
-                    propiedad_especifica = None
-                    import re
-                    
-                    # 1. Detectar por PRECIO específico
-                    import re
-                    precio_pattern = r'(?:\$?\s*)?(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d+)?)\s*(?:mil|mil|k|K)?'
-                    match_precio = re.search(precio_pattern, user_text)
-                    print(f"🔍 DEBUG Precio - Match: {match_precio}")
-                    
-                    if match_precio:
-                        precio_texto = match_precio.group(1).replace('.', '').replace(',', '')
-                        print(f"🔍 DEBUG Precio - Texto: {precio_texto}")
-                        
-                        try:
-                            precio_buscado = int(precio_texto)
-                            print(f"🎯 Precio detectado en consulta: ${precio_buscado}")
-                            
-                            for prop in propiedades_contexto:
-                                print(f"🔍 DEBUG - Comparando: {prop.get('title')} - ${prop.get('price')}")
-                                if prop.get('price') == precio_buscado:
-                                    propiedad_especifica = prop
-                                    print(f"🎯 Detectada propiedad por precio: {propiedad_especifica.get('title')} - ${propiedad_especifica.get('price')}")
-                                    break
-                        except ValueError as e:
-                            print(f"⚠️ No se pudo convertir el precio detectado: {e}")
-                   
-                    # 🔥 CORRECCIÓN CRÍTICA: AGREGAR 'elif' AQUÍ
-                    # 2. Detectar por BARRIO específico
-                    if not propiedad_especifica:
-                        barrios = ["colegiales", "palermo", "soho","boedo", "belgrano", "recoleta", "almagro", "villa crespo", "san isidro", "vicente lopez"]
-                        for barrio in barrios:
-                            if barrio in user_text.lower():
-                                for prop in propiedades_contexto:
-                                    if (barrio in prop.get('neighborhood', '').lower() or 
-                                        barrio in prop.get('title', '').lower()):
-                                        propiedad_especifica = prop
-                                        print(f"🎯 Detectada propiedad por barrio: {propiedad_especifica.get('title')} - {propiedad_especifica.get('neighborhood')}")
-                                        break
-                                if propiedad_especifica:
-                                    break
-
-                    # 3. Detectar por TIPO específico
-                    elif not propiedad_especifica:
-                        tipos = ["departamento", "casa", "ph", "terreno"]
-                        for tipo in tipos:
-                            if tipo in user_text.lower():
-                                for prop in propiedades_contexto:
-                                    if tipo in prop.get('tipo', '').lower():
-                                        propiedad_especifica = prop
-                                        print(f"🎯 Detectada propiedad por tipo: {propiedad_especifica.get('title')} - {propiedad_especifica.get('tipo')}")
-                                        break
-                                if propiedad_especifica:
-                                    break
-
-                    # 4. Detectar por NÚMERO (primero, segundo, etc.)
-                    if not propiedad_especifica:
-                        if any(word in user_text.lower() for word in ['primero', 'primera', '1']):
-                            propiedad_especifica = propiedades_contexto[0]
-                            print(f"🎯 Detectada primera propiedad: {propiedad_especifica.get('title')}")
-                        elif any(word in user_text.lower() for word in ['segundo', 'segunda', '2']) and len(propiedades_contexto) > 1:
-                            propiedad_especifica = propiedades_contexto[1]
-                            print(f"🎯 Detectada segunda propiedad: {propiedad_especifica.get('title')}")
-                        elif any(word in user_text.lower() for word in ['tercero', 'tercera', '3']) and len(propiedades_contexto) > 2:
-                            propiedad_especifica = propiedades_contexto[2]
-                            print(f"🎯 Detectada tercera propiedad: {propiedad_especifica.get('title')}")
-
-                    # 5. Si no se detecta específicamente, usar la primera del contexto
-                    if not propiedad_especifica and propiedades_contexto:
-                        propiedad_especifica = propiedades_contexto[0]
-                        print(f"🎯 Usando primera propiedad por defecto: {propiedad_especifica.get('title')}")
-                    
-                    property_details = propiedad_especifica
-                    print(f"🏠 Propiedad desde contexto: {property_details.get('title', 'N/A')}")       
-            else:
-                # Try to find the property from the conversation history
-                if historial:
-                    last_bot_response = get_last_bot_response(channel)
-                    if last_bot_response:
-                        # Extract property title from last bot response
-                        match = re.search(r"\* \*\*(.*?):\*\*", last_bot_response)
-                        if match:
-                            property_title = match.group(1)
-                            # Get property details from the database
-                            conn = sqlite3.connect(DB_PATH)
-                            conn.row_factory = sqlite3.Row
-                            cur = conn.cursor()
-                            cur.execute("SELECT * FROM properties WHERE title = ?", (property_title,))
-                            row = cur.fetchone()
-                            if row:
-                                property_details = dict(row)
-                            conn.close()
-        
-        
-        
-        
-        # 🔥 COMBINAR FILTROS: frontend + detección automática
-        
-        # 1. Agregar filtros del frontend si existen
-        if filters_from_frontend:
-            filters.update(filters_from_frontend)
-            print(f"🎯 Filtros aplicados desde frontend: {filters_from_frontend}")
-        
-        # 2. Detectar filtros adicionales del texto
+                log.debug("🏠 Propiedad desde contexto: %s", property_details.get('title', 'N/A'))       
+        else:
+            # Try to find the property from the conversation history
+            if mensajes_previos:
+                with cronometro.etapa("history"):
+                    last_bot_response = get_last_bot_response(session_id)
+                if last_bot_response:
+                    # Extract property title from last bot response
+                    match = re.search(r"\* \*\*(.*?):\*\*", last_bot_response)
+                    if match:
+                        property_title = match.group(1)
+                        # Get property details from the database
+                        with cronometro.etapa("db_query"):
+                            row = properties_db.query_one(f"SELECT {PROPERTY_COLUMNS} FROM properties WHERE title = ?", (property_title,))
+                        if row:
+                            property_details = dict(row)
+    
+    
+    
+    
+    # 🔥 COMBINAR FILTROS: frontend + detección automática
+    
+    # 1. Agregar filtros del frontend si existen
+    if filters_from_frontend:
+        filters.update(filters_from_frontend)
+        log.debug("🎯 Filtros aplicados desde frontend: %s", filters_from_frontend)
+    
+    # 2. Detectar filtros adicionales del texto
+    with cronometro.etapa("filters"):
         detected_filters = detect_filters(text_lower)
-        if detected_filters:
-            filters.update(detected_filters)
-            print(f"🎯 Filtros detectados del texto: {detected_filters}")
+    if detected_filters:
+        filters.update(detected_filters)
+        log.debug("🎯 Filtros detectados del texto: %s", detected_filters)
+
+    # 3. Texto libre que sobra después de extraer los filtros ("luminoso con balcón") -> búsqueda FTS
+    #    (también sin filtros estructurados: el texto libre solo ya dispara la búsqueda)
+    if "q" not in filters:
+        ya_filtrado = {
+            palabra
+            for valores in snapshot.vocabulario.values()
+            for valor in valores
+            for palabra in valor.split()
+        }
+        with cronometro.etapa("filters"):
+            libres = terminos_libres(user_text, excluir=ya_filtrado)
+        if libres:
+            filters["q"] = " ".join(libres)
+            log.debug("🎯 Texto libre para FTS: %s", filters['q'])
 
-        # Si hay filtros, realizar búsqueda
+    # Si hay filtros, realizar búsqueda
+    
+    # 👇 EVITAR BÚSQUEDA SI HAY CONTEXTO DE SEGUIMIENTO
+    if filters and not property_details and not (es_seguimiento_final and contexto_anterior):
+        log.debug("🎯 Activando búsqueda con filtros combinados...")
+        search_performed = True
+        metrics.increment_searches()
         
-        # 👇 EVITAR BÚSQUEDA SI HAY CONTEXTO DE SEGUIMIENTO
-        if filters and not property_details and not (es_seguimiento_final and contexto_anterior):
-            print("🎯 Activando búsqueda con filtros combinados...")
+        with cronometro.etapa("db_query"):
+            results = sin_rank(query_properties(filters))
+            if not results and "q" in filters:
+                # El texto libre no matcheó nada: mejor los resultados de los filtros estructurados que ninguno
+                filters.pop("q")
+                if filters:
+                    results = query_properties(filters)
+                else:
+                    # Sólo había texto libre y no describe ninguna propiedad: es una consulta general
+                    results, search_performed = None, False
+        log.debug("📊 Resultados encontrados: %s", len(results or []))
+    else:
+        log.debug("🔄 Modo seguimiento - usando contexto anterior")
+        # Usar el contexto anterior si está disponible
+        if contexto_anterior and contexto_anterior.get('resultados'):
+            results = contexto_anterior['resultados']
+            log.debug("📋 Usando %s propiedades del contexto anterior", len(results))
             search_performed = True
-            metrics.increment_searches()
-            
-            results = query_properties(filters)
-            print(f"📊 Resultados encontrados: {len(results)}")
-        else:
-            print("🔄 Modo seguimiento - usando contexto anterior")
-            # Usar el contexto anterior si está disponible
-            if contexto_anterior and contexto_anterior.get('resultados'):
-                results = contexto_anterior['resultados']
-                print(f"📋 Usando {len(results)} propiedades del contexto anterior")
-                search_performed = True
-        
-        # Tono según canal
-        if channel == "whatsapp":
-            style_hint = "Respondé de forma breve, directa y cálida como si fuera un mensaje de WhatsApp."
-        else:
-            style_hint = "Respondé de forma explicativa, profesional y cálida como si fuera una consulta web."
-
-        # 👇 AGREGAR PROMPT ESPECÍFICO PARA SEGUIMIENTO
-         # 👇 AGREGAR PROMPT ESPECÍFICO PARA SEGUIMIENTO
-        if es_seguimiento_final and (contexto_anterior or property_details):
-            print("🎯 MODO SEGUIMIENTO ACTIVADO")
-            
-            # Si tenemos property_details (de contexto o detección), usar prompt específico
-            if property_details:
-                print(f"🎯 PROPIEDAD ESPECÍFICA: {property_details.get('title')}")
-                
-                detalles_propiedad = f"""
-        PROPIEDAD ESPECÍFICA:
-        - Título: {property_details.get('title', 'N/A')}
-        - Precio: ${property_details.get('price', 'N/A')}
-        - Barrio: {property_details.get('neighborhood', 'N/A')}
-        - Ambientes: {property_details.get('rooms', 'N/A')}
-        - Metros: {property_details.get('sqm', 'N/A')}m²
-        - Operación: {property_details.get('operacion', 'N/A')}
-        - Tipo: {property_details.get('tipo', 'N/A')}
-        - Descripción: {property_details.get('description', 'N/A')}
-        - Dirección: {property_details.get('direccion', 'N/A')}
-        - Antigüedad: {property_details.get('antiguedad', 'N/A')}
-        - Amenities: {property_details.get('amenities', 'N/A')}
-        - Cochera: {property_details.get('cochera', 'N/A')}
-        - Balcón: {property_details.get('balcon', 'N/A')}
-        - Aire acondicionado: {property_details.get('aire_acondicionado', 'N/A')}
-        - Expensas: {property_details.get('expensas', 'N/A')}
-        - Estado: {property_details.get('estado', 'N/A')}
-        """
-                
-                prompt = f"""
-        ERES UN ASISTENTE INMOBILIARIO. El usuario está preguntando específicamente sobre ESTA propiedad:
-
-        {detalles_propiedad}
-
-        PREGUNTA DEL USUARIO: "{user_text}"
+    
+    # Prompt con presupuesto de tokens por canal: sólo el vocabulario del catálogo que viene al caso
+    inicio_prompt = time.perf_counter()
+    template = prompt_template_name(results, property_details)
+    if es_seguimiento_final and property_details:
+        # Pregunta puntual sobre una propiedad ya mostrada: se responde sólo sobre ella
+        log.debug("🎯 MODO SEGUIMIENTO - propiedad específica: %s", property_details.get('title'))
+        template = "seguimiento_detalle"
+    prompt = build_prompt(user_text, results, filters, channel, mensajes_previos, property_details, template)
+    log.debug("🧠 Prompt %s: %s tokens estimados", template, estimar_tokens(prompt))
+
+    # 🔥 CACHE DE RESPUESTAS: misma intención + mismos resultados = misma respuesta
+    if property_details:
+        result_ids = [property_details.get("id")]
+    else:
+        result_ids = [r.get("id") for r in (results or [])[:8]]
+    uses_text = template in ("general", "detalle_propiedad", "seguimiento_detalle")
+    cache_key = response_cache_key(template, channel, filters, result_ids, user_text if uses_text else "", version_catalogo())
+    cronometro.sumar("prompt", time.perf_counter() - inicio_prompt)
 
-        INSTRUCCIONES ESTRICTAS:
-        1. Responde EXCLUSIVAMENTE sobre esta propiedad específica
-        2. Proporciona TODOS los detalles disponibles listados arriba
-        3. NO menciones otras propiedades
-        4. NO hagas preguntas adicionales al usuario
-        5. Si faltan datos, menciona "No disponible" para ese campo
-        6. {style_hint}
+    return {
+        "user_text": user_text,
+        "channel": channel,
+        "session_id": session_id,
+        "filters": filters,
+        "results": results,
+        "search_performed": search_performed,
+        "contexto_anterior": contexto_anterior,
+        "prompt": prompt,
+        "cache_key": cache_key,
+    }
 
-        RESPONDE DIRECTAMENTE CON TODOS LOS DETALLES DE ESTA PROPIEDAD:
-        """
-                print("🧠 Prompt ESPECÍFICO de seguimiento enviado a Gemini")
-            
-            else:
-                # Si no hay property_details pero hay contexto, usar prompt normal
-                prompt = build_prompt(user_text, results, filters, channel, style_hint + "\n" + contexto_dinamico + "\n" + contexto_historial, property_details)
-                print("🧠 Prompt normal enviado a Gemini")
 
-        # 👇 SI NO ES SEGUIMIENTO, USAR PROMPT NORMAL
-        else:
-            prompt = build_prompt(user_text, results, filters, channel, style_hint + "\n" + contexto_dinamico + "\n" + contexto_historial, property_details)
-            print("🧠 Prompt normal enviado a Gemini (no es seguimiento)")
-            
-        metrics.increment_gemini_calls()
-        answer = call_gemini_with_rotation(prompt)
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    """Endpoint principal para chat con el asistente inmobiliario"""
+    start_time = time.time()
+    metrics.increment_requests()
+    cronometro = Cronometro()
+    
+    try:
+        consulta = await asyncio.to_thread(preparar_consulta, request, cronometro)
+        results = consulta["results"]
+        contexto_anterior = consulta["contexto_anterior"]
+
+        with cronometro.etapa("response_cache"):
+            answer = await en_hilo_si_compartido(response_cache.get, consulta["cache_key"])
+        cache_hit = answer is not None
+        if answer is None:
+            metrics.increment_gemini_calls()
+            with cronometro.etapa("gemini"):
+                answer = await call_gemini_with_rotation(consulta["prompt"])
+            if answer != ALL_KEYS_FAILED:
+                await en_hilo_si_compartido(response_cache.set, consulta["cache_key"], answer)
         
         response_time = time.time() - start_time
-        log_conversation(user_text, answer, channel, response_time, search_performed, len(results) if results else 0)
+        with cronometro.etapa("logging"):
+            await log_conversation(consulta["user_text"], answer, consulta["channel"], response_time, consulta["search_performed"], len(results) if results else 0, consulta["session_id"])
         metrics.increment_success()
+        cronometro.registrar(histogramas, endpoint="chat", channel=canal_etiqueta(consulta["channel"]), cache="hit" if cache_hit else "miss")
         
         return ChatResponse(
             response=answer,
             results_count=len(results) if results else None,
-            search_performed=search_performed,
+            search_performed=consulta["search_performed"],
             # 👇 AGREGAR PROPIEDADES A LA RESPUESTA
             propiedades=results if results else (contexto_anterior.get('resultados') if contexto_anterior else None)
         )
@@ -1482,7 +1055,7 @@ async def chat(request: ChatRequest):
         metrics.increment_failures()
         # 🔥 MANEJO DE ERRORES MÁS LIMPIO
         error_type = type(e).__name__
-        print(f"❌ ERROR en endpoint /chat: {error_type}: {str(e)}")
+        log.error("❌ ERROR en endpoint /chat: %s: %s", error_type, str(e))
         
         # Respuesta amigable al usuario
         error_message = "⚠️ Ocurrió un error procesando tu consulta. Por favor, intentá nuevamente en unos momentos."
@@ -1492,29 +1065,165 @@ async def chat(request: ChatRequest):
             search_performed=False,
             propiedades=None
         )
-        
-        
+
+
+def _sse(event: str, data: Any) -> str:
+    """Formatea un evento Server-Sent Events con payload JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Variante streaming de /chat (SSE): primero las propiedades, después el texto de Gemini a medida que llega.
+
+    Eventos: `propiedades` → `token` (uno o más) → `done`, o `error` si algo falla.
+    """
+    start_time = time.time()
+    metrics.increment_requests()
+    error_message = "⚠️ Ocurrió un error procesando tu consulta. Por favor, intentá nuevamente en unos momentos."
+    cronometro = Cronometro()
+
+    try:
+        consulta = await asyncio.to_thread(preparar_consulta, request, cronometro)
+    except HTTPException:
+        metrics.increment_failures()
+        raise
+    except Exception as e:
+        metrics.increment_failures()
+        log.error("❌ ERROR en endpoint /chat/stream: %s: %s", type(e).__name__, str(e))
+        consulta = None
+
+    async def eventos():
+        if consulta is None:
+            yield _sse("error", {"response": error_message})
+            return
+
+        results = consulta["results"]
+        contexto_anterior = consulta["contexto_anterior"]
+        yield _sse("propiedades", {
+            "results_count": len(results) if results else None,
+            "search_performed": consulta["search_performed"],
+            "propiedades": results if results else (contexto_anterior.get('resultados') if contexto_anterior else None),
+        })
+
+        with cronometro.etapa("response_cache"):
+            answer = await en_hilo_si_compartido(response_cache.get, consulta["cache_key"])
+        cache_hit = answer is not None
+        if answer is not None:
+            yield _sse("token", {"text": answer})
+        else:
+            metrics.increment_gemini_calls()
+            chunks = []
+            inicio_gemini = time.perf_counter()
+            try:
+                async for chunk in stream_gemini_with_rotation(consulta["prompt"]):
+                    if not chunks:
+                        cronometro.sumar("gemini_first_token", time.perf_counter() - inicio_gemini)
+                    chunks.append(chunk)
+                    yield _sse("token", {"text": chunk})
+                cronometro.sumar("gemini", time.perf_counter() - inicio_gemini)
+            except Exception as e:
+                metrics.increment_failures()
+                log.error("❌ ERROR en streaming de Gemini: %s: %s", type(e).__name__, str(e))
+                yield _sse("error", {"response": error_message})
+                return
+            answer = "".join(chunks)
+            if answer != ALL_KEYS_FAILED:
+                await en_hilo_si_compartido(response_cache.set, consulta["cache_key"], answer)
+
+        response_time = time.time() - start_time
+        with cronometro.etapa("logging"):
+            await log_conversation(consulta["user_text"], answer, consulta["channel"], response_time, consulta["search_performed"], len(results) if results else 0, consulta["session_id"])
+        metrics.increment_success()
+        cronometro.registrar(histogramas, endpoint="chat_stream", channel=canal_etiqueta(consulta["channel"]), cache="hit" if cache_hit else "miss")
+        yield _sse("done", {"response_time": round(response_time, 3)})
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def metricas_prometheus() -> str:
+    """Contadores y histogramas en formato de texto de Prometheus (con varios workers, la suma de todos)"""
+    contadores = metrics.snapshot()
+    lineas = [
+        "# HELP dante_uptime_seconds Segundos desde el arranque",
+        "# TYPE dante_uptime_seconds gauge",
+        f"dante_uptime_seconds {metrics.get_uptime():.3f}",
+    ]
+    for nombre in Metrics.COUNTERS:
+        metrica = "dante_" + nombre.replace("_count", "") + "_total"
+        lineas += [f"# TYPE {metrica} counter", f"{metrica} {contadores[nombre]}"]
+    for cache_nombre, cache in (("query", query_cache), ("response", response_cache)):
+        stats = cache.stats()
+        for campo in ("hits", "misses"):
+            metrica = f"dante_{cache_nombre}_cache_{campo}_total"
+            lineas += [f"# TYPE {metrica} counter", f"{metrica} {stats.get(campo, 0)}"]
+    coalescing = single_flight.stats()
+    lineas += [
+        "# HELP dante_gemini_single_flight_calls_total Llamadas a Gemini hechas por el single-flight",
+        "# TYPE dante_gemini_single_flight_calls_total counter",
+        f"dante_gemini_single_flight_calls_total {coalescing['calls']}",
+        "# HELP dante_gemini_coalesced_total Pedidos que esperaron una llamada idéntica en curso (llamadas ahorradas)",
+        "# TYPE dante_gemini_coalesced_total counter",
+        f"dante_gemini_coalesced_total {coalescing['coalesced']}",
+    ]
+    lineas += ["# TYPE dante_prompt_truncated_total counter", f"dante_prompt_truncated_total {prompts.recortados()}"]
+    return "\n".join(lineas) + "\n" + histogramas.prometheus(ayudas=AYUDAS) + prompts.tamanos.prometheus(ayudas=AYUDAS)
+
 @app.get("/metrics")
-def get_metrics():
-    """Endpoint para obtener métricas del servicio"""
+def get_metrics(format: Optional[str] = None, accept: Optional[str] = Header(default=None)):
+    """Endpoint para obtener métricas del servicio (JSON; texto de Prometheus con ?format=prometheus o Accept: text/plain)"""
+    if format == "prometheus" or (format is None and accept and ("text/plain" in accept or "openmetrics" in accept)):
+        return PlainTextResponse(metricas_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+    contadores = metrics.snapshot()
+    uptime = metrics.get_uptime()
     return {
-        "uptime_seconds": metrics.get_uptime(),
-        "requests_per_second": metrics.requests_count / max(metrics.get_uptime(), 1),
-        "success_rate": metrics.successful_requests / max(metrics.requests_count, 1),
-        "total_requests": metrics.requests_count,
-        "successful_requests": metrics.successful_requests,
-        "failed_requests": metrics.failed_requests,
-        "gemini_calls": metrics.gemini_calls,
-        "search_queries": metrics.search_queries,
-        "cache_size": len(query_cache)
+        "uptime_seconds": uptime,
+        "requests_per_second": contadores["requests_count"] / max(uptime, 1),
+        "success_rate": contadores["successful_requests"] / max(contadores["requests_count"], 1),
+        "total_requests": contadores["requests_count"],
+        "successful_requests": contadores["successful_requests"],
+        "failed_requests": contadores["failed_requests"],
+        "gemini_calls": contadores["gemini_calls"],
+        "search_queries": contadores["search_queries"],
+        "workers": WEB_CONCURRENCY,
+        "shared_state": shared_state.enabled,
+        "cache_size": len(query_cache),
+        "query_cache": query_cache.stats(),
+        "gemini_keys": key_scheduler.stats(),
+        "gemini_hedging": hedge_policy.stats(),
+        "gemini_coalescing": single_flight.stats(),
+        "response_cache": response_cache.stats(),
+        "catalog": catalog.stats(),
+        "log_writer": log_writer.stats(),
+        "property_engine": property_engine.stats(),
+        "latencias": histogramas.resumen("chat_stage_seconds"),
+        "gemini_latencias": histogramas.resumen("gemini_call_seconds"),
+        "historial": historial.stats(),
+        "prompts": prompts.stats(),
+        "retencion": retencion.stats(),
+        "logger": logger.stats(),
+        "health": sondeo.stats()
     }
 
+@app.post("/catalog/reload")
+def reload_catalog():
+    """Fuerza la recarga de properties.json (catálogo en memoria + tabla properties)"""
+    changed = catalog.refresh(force=True)
+    return {"reloaded": changed, **catalog.stats()}
+
 @app.delete("/cache")
 def clear_cache():
     """Limpia el cache de consultas"""
     query_cache.clear()
-    query_properties_cached.cache_clear()
-    return {"message": "Cache limpiado correctamente"}
+    response_cache.clear()
+    return {
+        "message": "Cache limpiado correctamente",
+        "query_cache": query_cache.stats(),
+        "response_cache": response_cache.stats()
+    }
 
 # ✅ DOCUMENTACIÓN PERSONALIZADA
 def custom_openapi():
@@ -1546,6 +1255,8 @@ if __name__ == "__main__":
     
     port = int(os.environ.get("PORT", 8000))
     print(f"🎯 Servidor iniciando en puerto: {port}")
+    # Los workers heredan el entorno: todos ven el mismo arranque (ver shared_state.token_de_arranque)
+    os.environ.setdefault("SHARED_STATE_BOOT_ID", f"{os.getpid()}-{time.time_ns()}")
     
     # En producción, reload=False
     uvicorn.run(
@@ -1553,5 +1264,6 @@ if __name__ == "__main__":
         host="0.0.0.0", 
         port=port, 
         reload=False,  # ⚠️ IMPORTANTE: False en producción
+        workers=WEB_CONCURRENCY,  # >1: estado compartido en SHARED_STATE_PATH
         access_log=True
     )
\ No newline at end of file
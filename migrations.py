@@ -0,0 +1,124 @@
+"""Migraciones de esquema versionadas con PRAGMA user_version (idempotentes: cada una corre una sola vez)."""
+from typing import List
+
+from db import SQLitePool
+from fts import FTS_SCHEMA
+from logger import get_logger
+
+log = get_logger(__name__)
+
+# Cada elemento es una versión; las sentencias de una versión se aplican en una sola transacción.
+PROPERTIES_MIGRATIONS: List[List[str]] = [
+    # v1: esquema actual. La tabla properties es derivada de properties.json, así que la de
+    # versiones anteriores (o la que deja db_init.py) se descarta y se vuelve a cargar.
+    [
+        "DROP TABLE IF EXISTS properties_fts",
+        "DROP TABLE IF EXISTS properties",
+        '''
+        CREATE TABLE properties (
+            id TEXT PRIMARY KEY,
+            title TEXT,
+            neighborhood TEXT,
+            price REAL,
+            rooms INTEGER,
+            sqm REAL,
+            description TEXT,
+            operacion TEXT,
+            tipo TEXT,
+            direccion TEXT,
+            antiguedad INTEGER,
+            estado TEXT,
+            orientacion TEXT,
+            piso TEXT,
+            expensas REAL,
+            amenities TEXT,
+            cochera TEXT,
+            balcon TEXT,
+            pileta TEXT,
+            acepta_mascotas TEXT,
+            aire_acondicionado TEXT,
+            info_multimedia TEXT,
+            neighborhood_norm TEXT,
+            operacion_norm TEXT,
+            tipo_norm TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Índices para los filtros de query_properties (columnas *_norm: minúsculas y sin acentos)
+        "CREATE INDEX idx_properties_busqueda ON properties (operacion_norm, tipo_norm, neighborhood_norm, price)",
+        "CREATE INDEX idx_properties_barrio ON properties (neighborhood_norm, price)",
+        "CREATE INDEX idx_properties_rooms ON properties (rooms)",
+        "CREATE INDEX idx_properties_sqm ON properties (sqm)",
+        "CREATE INDEX idx_properties_price ON properties (price)",
+        *FTS_SCHEMA,
+        # Hash del properties.json cargado: si no cambió, el arranque no recarga la tabla
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    ],
+    # v2: el loader anterior leía titulo/barrio/precio y dejaba esas columnas vacías: forzar recarga
+    [
+        "DELETE FROM meta WHERE key = 'catalog_hash'",
+    ],
+    # v3: huella por propiedad para la sincronización incremental (la próxima carga la completa)
+    [
+        "ALTER TABLE properties ADD COLUMN row_hash TEXT",
+        "DELETE FROM meta WHERE key = 'catalog_hash'",
+    ],
+]
+
+LOGS_MIGRATIONS: List[List[str]] = [
+    # v1: la tabla de siempre (las bases existentes ya la tienen)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            channel TEXT,
+            user_message TEXT,
+            bot_response TEXT,
+            response_time REAL,
+            search_performed BOOLEAN DEFAULT 0,
+            results_count INTEGER DEFAULT 0
+        )
+        ''',
+    ],
+    # v2: historial por sesión (antes se compartía por canal); los logs viejos quedan sin sesión
+    [
+        "ALTER TABLE logs ADD COLUMN session_id TEXT",
+        "CREATE INDEX idx_logs_session ON logs (session_id, id)",
+    ],
+    # v3: retención (retencion.py): resúmenes por hora/día y canal, y la marca de hasta dónde se resumió
+    [
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+        "CREATE INDEX idx_logs_timestamp ON logs (timestamp)",
+        '''
+        CREATE TABLE logs_rollup (
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            turns INTEGER NOT NULL,
+            searches INTEGER NOT NULL,
+            zero_results INTEGER NOT NULL,
+            results_total INTEGER NOT NULL,
+            avg_ms REAL,
+            p50_ms REAL,
+            p95_ms REAL,
+            p99_ms REAL,
+            latency_hist TEXT NOT NULL,
+            PRIMARY KEY (period, bucket, channel)
+        )
+        ''',
+    ],
+]
+
+
+def migrar(pool: SQLitePool, migraciones: List[List[str]]) -> int:
+    """Aplica las versiones pendientes y devuelve la versión final del esquema."""
+    conn = pool.connection()
+    actual = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, sentencias in enumerate(migraciones[actual:], start=actual + 1):
+        with pool.transaction() as tx:
+            for sentencia in sentencias:
+                tx.execute(sentencia)
+            tx.execute(f"PRAGMA user_version = {version}")
+        log.info("✅ %s: esquema migrado a v%s", pool.path, version)
+    return max(actual, len(migraciones))
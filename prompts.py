@@ -0,0 +1,245 @@
+"""Armado de prompts con presupuesto de tokens por canal y propiedades serializadas en forma compacta.
+
+Cada prompt es: encabezado fijo de la plantilla (cacheado) + datos de las propiedades + vocabulario del
+catálogo que viene al caso + historial reciente + filtros + consulta. Lo obligatorio (encabezado,
+consulta, al menos una propiedad) va siempre; lo demás se agrega mientras entre en el presupuesto.
+"""
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import PROMPT_TOKEN_BUDGET, PROMPT_TOKEN_BUDGET_WHATSAPP
+from latencias import Histogramas, canal_etiqueta
+from shared_state import shared_state
+from texto import normalizar
+
+# Límites superiores (tokens estimados) de los buckets del histograma de tamaño de prompt
+TOKEN_BUCKETS = (64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192)
+
+TONOS = {
+    "whatsapp": "Respondé de forma breve, directa y cálida como si fuera un mensaje de WhatsApp.",
+    "web": "Respondé de forma explicativa, profesional y cálida como si fuera una consulta web.",
+}
+
+INSTRUCCIONES = {
+    "resultados": "Resumí estos resultados para el usuario, ofrecé ayuda personalizada y sugerí seguir la conversación por WhatsApp. Cerrá con un agradecimiento.",
+    "sin_resultados": "No hay propiedades para esa búsqueda. Sugerí alternativas cercanas del catálogo, pedí más detalles y ofrecé seguir por WhatsApp. Cerrá con un agradecimiento.",
+    "general": "Respondé la consulta de forma cálida, profesional y breve. Si es posible, ofrecé seguir por WhatsApp y agradecé el contacto.",
+    "detalle_propiedad": "El usuario pide más detalles de esta propiedad: presentalos de forma clara y atractiva, ofrecé ayuda personalizada y sugerí seguir por WhatsApp. Cerrá con un agradecimiento.",
+    "seguimiento_detalle": "El usuario pregunta por ESTA propiedad: respondé sólo sobre ella con todos los datos listados, sin mencionar otras ni hacer preguntas. Si falta un dato, decí \"No disponible\".",
+}
+
+# (campo, etiqueta) de los datos extra que se agregan al pedir el detalle de una propiedad
+CAMPOS_DETALLE = (
+    ("direccion", "dirección"), ("antiguedad", "antigüedad"), ("estado", "estado"), ("expensas", "expensas"),
+    ("piso", "piso"), ("orientacion", "orientación"), ("amenities", "amenities"), ("cochera", "cochera"),
+    ("balcon", "balcón"), ("pileta", "pileta"), ("acepta_mascotas", "mascotas"),
+    ("aire_acondicionado", "aire acondicionado"), ("description", "descripción"),
+)
+
+ETIQUETAS_FILTRO = {
+    "operacion": "operación=", "tipo": "tipo=", "neighborhood": "barrio=", "min_price": "precio≥",
+    "max_price": "precio≤", "min_rooms": "ambientes≥", "min_sqm": "m²≥", "max_sqm": "m²≤", "q": "texto=",
+}
+
+# Palabras de la consulta que hacen útil mandar cada vocabulario en la plantilla "general"
+PISTAS_VOCABULARIO = {
+    "barrios": ("barrio", "zona", "donde", "ubicacion", "cerca"),
+    "tipos": ("tipo", "tienen", "ofrecen", "que hay", "opciones", "propiedades"),
+    "operaciones": ("alquil", "venta", "vend", "compr", "operacion"),
+}
+
+VACIOS = (None, "", "N/A", "n/a")
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimación barata (~4 caracteres por token); alcanza para comparar contra el presupuesto."""
+    return (len(texto) + 3) // 4
+
+
+def presupuesto(channel: str) -> int:
+    return PROMPT_TOKEN_BUDGET_WHATSAPP if channel == "whatsapp" else PROMPT_TOKEN_BUDGET
+
+
+@lru_cache(maxsize=64)
+def prefijo(template: str, channel: str) -> str:
+    """Encabezado fijo de cada plantilla y canal: se arma una sola vez por proceso."""
+    lineas = [
+        "Sos el asistente inmobiliario de Dante Propiedades.",
+        TONOS["whatsapp" if channel == "whatsapp" else "web"],
+        INSTRUCCIONES[template],
+    ]
+    if channel == "whatsapp":
+        lineas.append("Usá emojis.")
+    return "\n".join(lineas)
+
+
+def _precio(valor: Any) -> str:
+    try:
+        return f"${float(valor):,.0f}"
+    except (TypeError, ValueError):
+        return "precio a consultar"
+
+
+def propiedad_compacta(p: Dict[str, Any]) -> str:
+    """Una línea: título | barrio | precio | ambientes | m² | operación y tipo (sin los campos vacíos)."""
+    partes = [p.get("title"), p.get("neighborhood"), _precio(p.get("price"))]
+    if p.get("rooms") not in VACIOS:
+        partes.append(f"{p['rooms']} amb")
+    if p.get("sqm") not in VACIOS:
+        partes.append(f"{p['sqm']:g} m²" if isinstance(p["sqm"], (int, float)) else f"{p['sqm']} m²")
+    partes.append(" ".join(str(p[c]) for c in ("operacion", "tipo") if p.get(c) not in VACIOS))
+    return " | ".join(str(x) for x in partes if x not in VACIOS)
+
+
+def detalle_compacto(p: Dict[str, Any]) -> str:
+    """La línea compacta más los datos extra que tenga la propiedad, como `etiqueta: valor`."""
+    extras = [f"{etiqueta}: {p[campo]}" for campo, etiqueta in CAMPOS_DETALLE if p.get(campo) not in VACIOS]
+    return propiedad_compacta(p) + ("\n" + "; ".join(extras) if extras else "")
+
+
+def filtros_compactos(filters: Optional[Dict[str, Any]]) -> str:
+    partes = []
+    for clave, valor in (filters or {}).items():
+        if valor in VACIOS:
+            continue
+        if isinstance(valor, float) and valor.is_integer():
+            valor = int(valor)
+        partes.append(f"{ETIQUETAS_FILTRO.get(clave, clave + '=')}{valor}")
+    return ", ".join(partes)
+
+
+def vocabulario_relevante(template: str, user_text: str, filters: Optional[Dict[str, Any]], snapshot) -> List[Tuple[str, Sequence[str]]]:
+    """Qué listas del catálogo sirven para esta consulta (en vez de mandar siempre todas).
+
+    - Con resultados o una propiedad puntual: ninguna.
+    - Sin resultados: las de las dimensiones que se filtraron, para sugerir alternativas.
+    - General: las que la consulta menciona (zona, tipo de propiedad, alquiler/venta).
+    """
+    if snapshot is None or template not in ("sin_resultados", "general"):
+        return []
+    listas = {"barrios": ("Barrios", snapshot.barrios), "tipos": ("Tipos", snapshot.tipos),
+              "operaciones": ("Operaciones", snapshot.operaciones)}
+    if template == "sin_resultados":
+        filtros = filters or {}
+        elegidas = [n for n, f in (("barrios", "neighborhood"), ("tipos", "tipo"), ("operaciones", "operacion")) if filtros.get(f)]
+        return [listas[n] for n in elegidas or ("barrios", "tipos")]
+    texto = normalizar(user_text)
+    return [listas[n] for n, pistas in PISTAS_VOCABULARIO.items() if any(p in texto for p in pistas)]
+
+
+class _Armado:
+    """Acumula secciones contando tokens contra el presupuesto."""
+
+    def __init__(self, presupuesto: int):
+        self.restante = presupuesto
+        self.secciones: List[str] = []
+        self.recortado = False
+
+    def obligatoria(self, texto: str):
+        self.secciones.append(texto)
+        self.restante -= estimar_tokens(texto) + 1
+
+    def opcional(self, titulo: str, items: Iterable[str], separador: str = "\n") -> int:
+        """Agrega `titulo` + tantos items como entren; devuelve cuántos entraron."""
+        elegidos = []
+        costo = estimar_tokens(titulo) + 1
+        for item in items:
+            extra = estimar_tokens(item) + 1
+            if costo + extra > self.restante:
+                self.recortado = True
+                break
+            elegidos.append(item)
+            costo += extra
+        if elegidos:
+            self.secciones.append(titulo + separador.join(elegidos))
+            self.restante -= costo
+        return len(elegidos)
+
+    def texto(self) -> str:
+        return "\n\n".join(self.secciones)
+
+
+class Prompts:
+    """Arma los prompts y lleva la cuenta de sus tamaños (histograma por plantilla y canal)."""
+
+    def __init__(self, store=None):
+        self.store = store
+        self.tamanos = Histogramas(TOKEN_BUCKETS, store, espacio="tok")
+        self._lock = threading.Lock()
+        self._recortados = 0
+
+    def armar(self, template: str, channel: str, user_text: str, filters=None, results=None,
+              property_details=None, historial: Sequence[str] = (), snapshot=None, max_resultados: int = 8) -> str:
+        armado = _Armado(presupuesto(channel))
+        armado.obligatoria(prefijo(template, channel))
+        consulta = f'Consulta: "{user_text}"'
+        filtros = filtros_compactos(filters)
+        if filtros:
+            consulta = f"Filtros: {filtros}\n{consulta}"
+        # La consulta va al final pero se descuenta primero: nunca se recorta
+        armado.restante -= estimar_tokens(consulta) + 1
+
+        if property_details:
+            detalle = detalle_compacto(property_details)
+            lugar = max(armado.restante, 0) * 4
+            if len(detalle) > lugar:
+                detalle, armado.recortado = detalle[:max(lugar, 200)] + "…", True
+            armado.obligatoria("Propiedad:\n" + detalle)
+        elif results:
+            lineas = [f"- {propiedad_compacta(r)}" for r in results[:max_resultados]]
+            armado.obligatoria("Resultados:\n" + lineas[0])
+            if armado.opcional("", lineas[1:]):
+                # opcional() las dejó en una sección aparte: se unen a la de resultados
+                agregadas = armado.secciones.pop()
+                armado.secciones[-1] += "\n" + agregadas
+
+        for titulo, valores in vocabulario_relevante(template, user_text, filters, snapshot):
+            armado.opcional(f"{titulo} disponibles: ", valores, ", ")
+
+        if historial:
+            # Del más nuevo al más viejo, así lo que no entra es lo más antiguo
+            recientes = [f"- {m}" for m in reversed(historial)]
+            n = armado.opcional("Historial reciente:\n", recientes)
+            if n:
+                armado.secciones[-1] = "Historial reciente:\n" + "\n".join(reversed(recientes[:n]))
+
+        armado.secciones.append(consulta)
+        texto = armado.texto()
+        self.registrar(texto, template, channel, armado.recortado)
+        return texto
+
+    def registrar(self, texto: str, template: str, channel: str, recortado: bool = False):
+        self.tamanos.observe("prompt_tokens", estimar_tokens(texto), template=template, channel=canal_etiqueta(channel))
+        if recortado:
+            if self.store is not None:
+                self.store.incr("prompt_truncated")
+            else:
+                with self._lock:
+                    self._recortados += 1
+
+    def recortados(self) -> int:
+        if self.store is not None:
+            return int(self.store.counters().get("prompt_truncated", 0))
+        with self._lock:
+            return self._recortados
+
+    def stats(self) -> Dict[str, Any]:
+        series = {}
+        for (nombre, etiquetas), serie in sorted(self.tamanos.series().items()):
+            cantidad = int(sum(serie[:-1]))
+            series[",".join(f"{k}={v}" for k, v in etiquetas)] = {
+                "count": cantidad,
+                "avg_tokens": round(serie[-1] / cantidad, 1) if cantidad else 0.0,
+                "p50_tokens": round(self.tamanos.percentil(serie, 50)),
+                "p95_tokens": round(self.tamanos.percentil(serie, 95)),
+            }
+        return {
+            "budget_tokens": {"web": PROMPT_TOKEN_BUDGET, "whatsapp": PROMPT_TOKEN_BUDGET_WHATSAPP},
+            "truncated": self.recortados(),
+            "prefix_cache": prefijo.cache_info()._asdict(),
+            "sizes": series,
+        }
+
+
+prompts = Prompts(shared_state if shared_state.enabled else None)
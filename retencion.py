@@ -0,0 +1,292 @@
+"""Retención de conversaciones.db: resúmenes por hora y por día, archivo comprimido de los turnos viejos y VACUUM incremental.
+
+Corre en segundo plano cada LOG_RETENTION_INTERVAL segundos (o a mano: python retencion.py):
+
+1. Resúmenes: los turnos de horas ya cerradas se suman a logs_rollup (period "hour" y "day", por canal):
+   volumen, búsquedas, búsquedas sin resultados, resultados y un histograma de latencia del que salen
+   p50/p95/p99. Una marca (meta.rollup_last_id) indica hasta qué id ya se sumó; un turno que llega
+   tarde a una hora ya resumida se suma igual (los histogramas se combinan sin perder nada).
+2. Archivo: los turnos ya resumidos de más de LOG_RETENTION_DAYS días se escriben en
+   LOG_ARCHIVE_DIR/AAAA/MM/logs-AAAA-MM-DD.jsonl.gz y se borran de logs en la misma transacción.
+   Si el proceso cae después de escribir y antes del COMMIT, la próxima pasada vuelve a archivar
+   esos turnos: el archivo puede repetir un id, nunca pierde uno.
+3. PRAGMA incremental_vacuum devuelve al disco hasta LOG_VACUUM_PAGES páginas libres. Una base creada
+   antes de esta versión primero necesita un VACUUM completo, que bloquea la base mientras dura: el
+   servidor no lo hace (avisa en el log); se corre una vez con `python retencion.py --convertir`.
+
+Cada lote es una transacción BEGIN IMMEDIATE: con varios workers no se suma ni se archiva dos veces.
+"""
+import os
+import gzip
+import json
+import time
+import asyncio
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import LOG_RETENTION_DAYS, LOG_ARCHIVE_DIR, LOG_RETENTION_INTERVAL, LOG_RETENTION_BATCH, LOG_VACUUM_PAGES
+from db import logs_db
+from latencias import BUCKETS, Histogramas, canal_etiqueta
+from logger import get_logger
+
+log = get_logger(__name__)
+
+COLUMNAS_ARCHIVO = (
+    "id", "timestamp", "channel", "session_id", "user_message", "bot_response",
+    "response_time", "search_performed", "results_count",
+)
+
+# Sólo para el cálculo de percentiles sobre las series guardadas
+_percentiles = Histogramas(BUCKETS)
+
+
+def _serie_vacia() -> List[float]:
+    return [0.0] * (len(BUCKETS) + 2)
+
+
+def _periodos(timestamp: str) -> Tuple[Tuple[str, str], Tuple[str, str]]:
+    """("hour", "AAAA-MM-DDTHH:00") y ("day", "AAAA-MM-DD") de un timestamp ISO."""
+    return ("hour", timestamp[:13] + ":00"), ("day", timestamp[:10])
+
+
+class Retencion:
+    def __init__(self, dias: int, directorio: str, interval: float, lote: int, paginas_vacuum: int):
+        self.dias = dias
+        self.directorio = directorio
+        self.interval = interval
+        self.lote = lote
+        self.paginas_vacuum = paginas_vacuum
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.rolled_up = 0
+        self.archived = 0
+        self.vacuumed_pages = 0
+        self.errors = 0
+        self.last_run_ms = 0.0
+        self.last_error: Optional[str] = None
+        self._avisado = False
+
+    # --- 1. Resúmenes ---
+
+    def _marca(self, conn) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'rollup_last_id'").fetchone()
+        return int(row[0]) if row else 0
+
+    def resumir(self, hasta: Optional[datetime] = None) -> int:
+        """Suma a logs_rollup los turnos anteriores a la hora en curso (o a `hasta`); devuelve cuántos."""
+        limite = (hasta or datetime.now()).replace(minute=0, second=0, microsecond=0).isoformat()
+        total = 0
+        while True:
+            with logs_db.transaction() as conn:
+                marca = self._marca(conn)
+                # Los ids crecen con el tiempo: se resume hasta el primer turno de la hora en curso
+                corte = conn.execute(
+                    "SELECT MIN(id) FROM logs WHERE id > ? AND timestamp >= ?", (marca, limite)
+                ).fetchone()[0]
+                rows = conn.execute(
+                    "SELECT id, timestamp, channel, response_time, search_performed, results_count "
+                    "FROM logs WHERE id > ? AND id < ? ORDER BY id LIMIT ?",
+                    (marca, corte if corte is not None else 2 ** 63 - 1, self.lote),
+                ).fetchall()
+                if not rows:
+                    return total
+
+                grupos: Dict[Tuple[str, str, str], List[Any]] = {}
+                for row in rows:
+                    canal = canal_etiqueta(row["channel"])
+                    segundos = row["response_time"] or 0.0
+                    for periodo, inicio in _periodos(row["timestamp"] or ""):
+                        grupo = grupos.setdefault((periodo, inicio, canal), [0, 0, 0, 0, _serie_vacia()])
+                        grupo[0] += 1
+                        if row["search_performed"]:
+                            grupo[1] += 1
+                            grupo[2] += 0 if row["results_count"] else 1
+                        grupo[3] += row["results_count"] or 0
+                        grupo[4][bisect_left(BUCKETS, segundos)] += 1
+                        grupo[4][-1] += segundos
+                self._combinar(conn, grupos)
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('rollup_last_id', ?)", (str(rows[-1]["id"]),)
+                )
+            total += len(rows)
+            self.rolled_up += len(rows)
+
+    @staticmethod
+    def _combinar(conn, grupos: Dict[Tuple[str, str, str], List[Any]]):
+        for (periodo, inicio, canal), (turnos, busquedas, sin_resultados, resultados, serie) in grupos.items():
+            previo = conn.execute(
+                "SELECT turns, searches, zero_results, results_total, latency_hist FROM logs_rollup "
+                "WHERE period = ? AND bucket = ? AND channel = ?",
+                (periodo, inicio, canal),
+            ).fetchone()
+            if previo is not None:
+                turnos += previo["turns"]
+                busquedas += previo["searches"]
+                sin_resultados += previo["zero_results"]
+                resultados += previo["results_total"]
+                serie = [a + b for a, b in zip(serie, json.loads(previo["latency_hist"]))]
+            conn.execute(
+                '''INSERT OR REPLACE INTO logs_rollup
+                   (period, bucket, channel, turns, searches, zero_results, results_total,
+                    avg_ms, p50_ms, p95_ms, p99_ms, latency_hist)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (
+                    periodo, inicio, canal, turnos, busquedas, sin_resultados, resultados,
+                    round(serie[-1] / turnos * 1000, 2) if turnos else 0.0,
+                    round(_percentiles.percentil(serie, 50) * 1000, 2),
+                    round(_percentiles.percentil(serie, 95) * 1000, 2),
+                    round(_percentiles.percentil(serie, 99) * 1000, 2),
+                    json.dumps(serie),
+                ),
+            )
+
+    # --- 2. Archivo ---
+
+    def _ruta(self, dia: str) -> str:
+        return os.path.join(self.directorio, dia[:4], dia[5:7], f"logs-{dia}.jsonl.gz")
+
+    def _escribir(self, dia: str, filas: List[Dict[str, Any]]):
+        """Agrega un miembro gzip al archivo del día (gzip admite varios miembros concatenados)."""
+        ruta = self._ruta(dia)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, "ab") as f:
+            with gzip.GzipFile(fileobj=f, mode="wb") as gz:
+                for fila in filas:
+                    gz.write(json.dumps(fila, ensure_ascii=False).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def archivar(self, ahora: Optional[datetime] = None) -> int:
+        """Archiva y borra los turnos ya resumidos anteriores a LOG_RETENTION_DAYS días; devuelve cuántos."""
+        if self.dias <= 0:
+            return 0
+        corte = ((ahora or datetime.now()) - timedelta(days=self.dias)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        ).isoformat()
+        total = 0
+        while True:
+            with logs_db.transaction() as conn:
+                rows = conn.execute(
+                    f"SELECT {', '.join(COLUMNAS_ARCHIVO)} FROM logs WHERE id <= ? AND timestamp < ? ORDER BY id LIMIT ?",
+                    (self._marca(conn), corte, self.lote),
+                ).fetchall()
+                if not rows:
+                    return total
+                por_dia: Dict[str, List[Dict[str, Any]]] = {}
+                for row in rows:
+                    por_dia.setdefault((row["timestamp"] or "0000-00-00")[:10], []).append(dict(row))
+                for dia, filas in sorted(por_dia.items()):
+                    self._escribir(dia, filas)
+                # Las filas del lote son exactamente las de id <= último id con el mismo filtro
+                conn.execute("DELETE FROM logs WHERE id <= ? AND timestamp < ?", (rows[-1]["id"], corte))
+            total += len(rows)
+            self.archived += len(rows)
+
+    # --- 3. VACUUM incremental ---
+
+    @staticmethod
+    def vacuum_incremental_activo() -> bool:
+        return logs_db.connection().execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    def convertir_vacuum_incremental(self):
+        """auto_vacuum=INCREMENTAL en una base existente: VACUUM completo, una vez y con el servicio detenido."""
+        if self.vacuum_incremental_activo():
+            return
+        conn = logs_db.connection()
+        inicio = time.perf_counter()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        log.info("✅ %s: auto_vacuum incremental activado (%s ms)", logs_db.path,
+                 format((time.perf_counter() - inicio) * 1000, ".0f"))
+
+    def vacuum(self) -> int:
+        if not self.vacuum_incremental_activo():
+            # Sin auto_vacuum incremental el PRAGMA no libera nada; el VACUUM completo no se hace en caliente
+            if not self._avisado:
+                self._avisado = True
+                log.warning("⚠️ %s no tiene auto_vacuum incremental: las páginas libres no se devuelven al disco. "
+                            "Correr una vez `python retencion.py --convertir` con el servicio detenido", logs_db.path)
+            return 0
+        conn = logs_db.connection()
+        libres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not libres:
+            return 0
+        paginas = min(libres, self.paginas_vacuum)
+        # Con execute() el módulo sqlite3 da un solo paso (libera una página); executescript corre hasta el final
+        conn.executescript(f"PRAGMA incremental_vacuum({paginas});")
+        self.vacuumed_pages += paginas
+        return paginas
+
+    # --- Ciclo ---
+
+    def ejecutar(self) -> Dict[str, int]:
+        inicio = time.perf_counter()
+        try:
+            resultado = {"rolled_up": self.resumir(), "archived": self.archivar(), "vacuumed_pages": self.vacuum()}
+            self.last_error = None
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            log.error("❌ Error en la retención de logs: %s", e, exc_info=True)
+            resultado = {}
+        self.runs += 1
+        self.last_run_ms = (time.perf_counter() - inicio) * 1000
+        if resultado.get("archived"):
+            log.info("✅ Retención: %s turnos archivados, %s páginas liberadas", resultado["archived"], resultado["vacuumed_pages"])
+        return resultado
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running or self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.to_thread(self.ejecutar)
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        conn = logs_db.connection()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "retention_days": self.dias,
+            "interval": self.interval,
+            "runs": self.runs,
+            "rolled_up": self.rolled_up,
+            "archived": self.archived,
+            "vacuumed_pages": self.vacuumed_pages,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_run_ms": round(self.last_run_ms, 2),
+            "db_bytes": conn.execute("PRAGMA page_count").fetchone()[0] * page_size,
+            "free_bytes": conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size,
+        }
+
+
+retencion = Retencion(LOG_RETENTION_DAYS, LOG_ARCHIVE_DIR, LOG_RETENTION_INTERVAL, LOG_RETENTION_BATCH, LOG_VACUUM_PAGES)
+
+
+if __name__ == "__main__":
+    import sys
+    from migrations import migrar, LOGS_MIGRATIONS
+
+    migrar(logs_db, LOGS_MIGRATIONS)
+    if "--convertir" in sys.argv:
+        retencion.convertir_vacuum_incremental()
+    print(retencion.ejecutar())
+    print(retencion.stats())
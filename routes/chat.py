@@ -1,5 +1,8 @@
 from fastapi import APIRouter, Request
 from gemini.client import call_gemini_with_rotation
+from logger import get_logger
+
+log = get_logger(__name__)
 
 router = APIRouter()
 
@@ -8,8 +11,8 @@ async def chat_endpoint(request: Request):
     data = await request.json()
     message = data.get("message")
     channel = data.get("channel", "web")
-    print(f"📩 Mensaje recibido: {message}")
-    respuesta = call_gemini_with_rotation(message)
+    log.debug("📩 Mensaje recibido: %s", message)
+    respuesta = await call_gemini_with_rotation(message)
 
     return {
         "mensaje_recibido": message,
@@ -0,0 +1,115 @@
+"""Chequeo de salud en segundo plano: /readyz responde con el último resultado sin hacer trabajo por pedido."""
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from config import HEALTH_PROBE_INTERVAL, HEALTH_PROBE_GEMINI
+from db import properties_db, logs_db
+from gemini.client import probe_key
+from gemini.keys import key_scheduler
+from logger import get_logger
+
+log = get_logger(__name__)
+
+
+class Sondeo:
+    """Cada `interval` segundos revisa las bases y las claves de Gemini y guarda el resultado.
+
+    - Bases: SELECT 1 en properties y logs.
+    - Gemini: claves sanas según el planificador y, con `probe_gemini`, un GET de los metadatos del
+      modelo por clave (sin generar texto). Una clave que recibe 401/403 se da de baja en el planificador.
+
+    Está listo si las dos bases responden y queda al menos una clave sana. Hasta que termina el
+    primer chequeo el estado es "starting" (no listo): el arranque no espera a Gemini.
+    """
+
+    def __init__(self, interval: float, probe_gemini: bool):
+        self.interval = interval
+        self.probe_gemini = probe_gemini
+        self._task: Optional[asyncio.Task] = None
+        self.resultado: Dict[str, Any] = {"ready": False, "status": "starting", "checks": {}, "checked_at": None}
+        self.probes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._probar()
+            await asyncio.sleep(self.interval)
+
+    async def _probar(self):
+        try:
+            await self.probe()
+        except Exception as e:
+            log.error("❌ Error en el chequeo de salud: %s", e)
+
+    @staticmethod
+    def _db(pool) -> str:
+        try:
+            pool.query_one("SELECT 1")
+            return "ok"
+        except Exception as e:
+            return f"error: {e}"
+
+    async def _claves(self) -> Dict[str, Any]:
+        estados = {}
+        if self.probe_gemini:
+            vivas = [s for s in key_scheduler.keys if not s.dead]
+            codigos = await asyncio.gather(*(probe_key(s.key) for s in vivas))
+            for state, codigo in zip(vivas, codigos):
+                estados[state.label] = codigo
+                if codigo in (401, 403):
+                    key_scheduler.discard(state, codigo)
+                    log.error("❌ Clave %s no autorizada (chequeo de salud), descartada", state.index + 1)
+        return {"healthy": key_scheduler.healthy_count(), "total": len(key_scheduler.keys), "probe": estados}
+
+    async def probe(self) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        checks: Dict[str, Any] = {
+            "properties_db": await asyncio.to_thread(self._db, properties_db),
+            "logs_db": await asyncio.to_thread(self._db, logs_db),
+            "gemini_keys": await self._claves(),
+        }
+        ready = checks["properties_db"] == "ok" and checks["logs_db"] == "ok" and checks["gemini_keys"]["healthy"] > 0
+        self.resultado = {
+            "ready": ready,
+            "status": "ok" if ready else "degraded",
+            "checks": checks,
+            "checked_at": time.time(),
+            "probe_ms": round((time.perf_counter() - inicio) * 1000, 2),
+        }
+        self.probes += 1
+        if not ready:
+            log.warning("⚠️ Servicio no listo: %s", checks)
+        return self.resultado
+
+    def estado(self) -> Dict[str, Any]:
+        """Último resultado, con su antigüedad."""
+        resultado = dict(self.resultado)
+        if resultado["checked_at"] is not None:
+            resultado["age_seconds"] = round(time.time() - resultado["checked_at"], 1)
+        return resultado
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"interval": self.interval, "probe_gemini": self.probe_gemini, "probes": self.probes,
+                "ready": self.resultado["ready"]}
+
+
+sondeo = Sondeo(HEALTH_PROBE_INTERVAL, HEALTH_PROBE_GEMINI)
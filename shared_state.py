@@ -0,0 +1,339 @@
+"""Estado compartido entre workers (uvicorn --workers N): contadores, claves Gemini y cache de respuestas.
+
+Con un solo proceso todo queda en memoria como siempre. Con varios, cada worker usa el mismo
+archivo SQLite (WAL), así las métricas suman las de todos, un 429 enfría la clave para todos
+y una respuesta cacheada por un worker la aprovechan los demás.
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock de arranque (el modo multi-worker es para Linux)
+    fcntl = None
+
+from config import SHARED_STATE_ENABLED, SHARED_STATE_PATH, SHARED_STATE_BOOT_ID, SHARED_COUNTERS_FLUSH_INTERVAL
+from db import SQLitePool
+from logger import get_logger
+
+log = get_logger(__name__)
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value REAL NOT NULL DEFAULT 0)",
+    '''
+    CREATE TABLE IF NOT EXISTS gemini_keys (
+        label TEXT PRIMARY KEY,
+        cooldown_until REAL NOT NULL DEFAULT 0,
+        dead INTEGER NOT NULL DEFAULT 0,
+        consecutive_429 INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires_at)",
+]
+
+UPSERT_COUNTER = '''
+    INSERT INTO counters (name, value) VALUES (?, ?)
+    ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+'''
+
+UPSERT_KEY = "INSERT OR REPLACE INTO gemini_keys (label, cooldown_until, dead, consecutive_429) VALUES (?, ?, ?, ?)"
+
+
+def token_de_arranque() -> str:
+    """Identifica el arranque actual: igual para todos los workers hijos del mismo padre.
+
+    SHARED_STATE_BOOT_ID si lo fijó el comando de inicio. Si no, el pid del padre junto con su hora
+    de inicio y el boot_id del kernel (/proc): un contenedor reiniciado suele repetir el pid, pero no
+    la hora de inicio del proceso.
+    """
+    if SHARED_STATE_BOOT_ID:
+        return SHARED_STATE_BOOT_ID
+    ppid = os.getppid()
+    partes = [str(ppid)]
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            partes.append(f.read().strip())
+        with open(f"/proc/{ppid}/stat") as f:
+            # starttime es el campo 22; se cuenta desde el ")" que cierra el nombre del proceso
+            partes.append(f.read().rsplit(")", 1)[1].split()[19])
+    except (OSError, IndexError):
+        pass  # sin /proc (macOS, Windows): sólo el pid del padre
+    return ":".join(partes)
+
+
+class SharedCache:
+    """Cache TTL sobre la tabla `cache` del store, con la misma interfaz que TTLCache.
+
+    Aciertos, fallos e invalidaciones se cuentan como contadores compartidos (suma de workers).
+    Los límites de entradas y de bytes se aplican en purge(), cada PURGE_EVERY escrituras o cada
+    décimo de max_bytes escrito: entre purgas el cache puede pasarse un poco.
+    Son llamadas a SQLite bloqueantes: desde el event loop van por asyncio.to_thread.
+    """
+
+    PURGE_EVERY = 100
+
+    def __init__(self, store: "SharedState", namespace: str, ttl: float, max_entries: int,
+                 max_bytes: Optional[int] = None):
+        self.store = store
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sets = 0
+        self._bytes_sin_purgar = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self.store.db.query_one(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (self._key(key), time.time())
+        )
+        if row is None:
+            self.store.incr(f"{self.namespace}_cache_misses")
+            return default
+        self.store.incr(f"{self.namespace}_cache_hits")
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self.store.db.transaction() as conn:
+            escrito = self._escribir(conn, key, value, ttl)
+        if escrito:
+            self._despues_de_escribir()
+
+    def update(self, key: str, funcion: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        """Lee, transforma y escribe la entrada en una sola transacción (BEGIN IMMEDIATE).
+
+        `funcion` recibe el valor vigente (None si no hay) y devuelve el nuevo, o None para dejarlo
+        como está. Ningún otro worker escribe la entrada en el medio: no se pierden actualizaciones.
+        Devuelve el valor que queda guardado.
+        """
+        with self.store.db.transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (self._key(key), time.time())
+            ).fetchone()
+            actual = json.loads(row[0]) if row is not None else None
+            nuevo = funcion(actual)
+            if nuevo is None:
+                return actual
+            escrito = self._escribir(conn, key, nuevo, ttl)
+        if escrito:
+            self._despues_de_escribir()
+        return nuevo
+
+    def _escribir(self, conn, key: str, value: Any, ttl: Optional[float]) -> bool:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        serializado = json.dumps(value, ensure_ascii=False, default=str)
+        size = len(serializado.encode("utf-8"))
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (self._key(key), serializado, expires_at),
+        )
+        self._bytes_sin_purgar += size
+        return True
+
+    def _despues_de_escribir(self):
+        self._sets += 1
+        if self._sets % self.PURGE_EVERY == 0 or (
+            self.max_bytes is not None and self._bytes_sin_purgar * 10 >= self.max_bytes
+        ):
+            self.purge()
+
+    def purge(self):
+        """Borra vencidas y, si sobran entradas o bytes, las que vencen antes."""
+        prefix = f"{self.namespace}:%"
+        self._bytes_sin_purgar = 0
+        with self.store.db.transaction() as conn:
+            conn.execute("DELETE FROM cache WHERE key LIKE ? AND expires_at <= ?", (prefix, time.time()))
+            conn.execute(
+                '''DELETE FROM cache WHERE key IN (
+                       SELECT key FROM cache WHERE key LIKE ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                   )''',
+                (prefix, self.max_entries),
+            )
+            if self.max_bytes is not None:
+                # Se conservan las que vencen más tarde mientras el acumulado no pase de max_bytes
+                conn.execute(
+                    '''DELETE FROM cache WHERE key IN (
+                           SELECT key FROM (
+                               SELECT key, SUM(length(CAST(value AS BLOB))) OVER (ORDER BY expires_at DESC, key) AS acumulado
+                               FROM cache WHERE key LIKE ?
+                           ) WHERE acumulado > ?
+                       )''',
+                    (prefix, self.max_bytes),
+                )
+
+    def clear(self):
+        self.store.db.execute("DELETE FROM cache WHERE key LIKE ?", (f"{self.namespace}:%",))
+        self.store.incr(f"{self.namespace}_cache_invalidations")
+
+    def __len__(self) -> int:
+        row = self.store.db.query_one("SELECT COUNT(*) FROM cache WHERE key LIKE ?", (f"{self.namespace}:%",))
+        return row[0]
+
+    def stats(self) -> Dict[str, Any]:
+        counters = self.store.counters()
+        hits = int(counters.get(f"{self.namespace}_cache_hits", 0))
+        misses = int(counters.get(f"{self.namespace}_cache_misses", 0))
+        entries, size = self.store.db.query_one(
+            "SELECT COUNT(*), COALESCE(SUM(length(CAST(value AS BLOB))), 0) FROM cache WHERE key LIKE ?",
+            (f"{self.namespace}:%",),
+        )
+        return {
+            "shared": True,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "invalidations": int(counters.get(f"{self.namespace}_cache_invalidations", 0)),
+        }
+
+
+class SharedState:
+    """Store SQLite compartido por los workers de un mismo arranque."""
+
+    def __init__(self, path: str, enabled: bool):
+        self.path = path
+        self.enabled = enabled
+        self.db = SQLitePool(path) if enabled else None
+        self.started_at = time.time()
+        self._pending: Dict[str, float] = {}
+        self._pending_keys: Dict[str, tuple] = {}
+        self._keys: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @contextmanager
+    def arranque(self):
+        """Serializa el arranque de los workers; devuelve True sólo al primero de cada arranque.
+
+        Los workers de un mismo `uvicorn --workers N` comparten el proceso padre: el primero que
+        toma el lock ve un token de arranque (token_de_arranque) distinto al guardado y reinicia
+        el store; los siguientes sólo se conectan. Mientras se tiene el lock se corren las
+        migraciones de esquema.
+        """
+        if not self.enabled:
+            yield True
+            return
+        with open(self.path + ".lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                for sentencia in SCHEMA:
+                    self.db.execute(sentencia)
+                boot = token_de_arranque()
+                row = self.db.query_one("SELECT value FROM meta WHERE key = 'boot'")
+                primero = row is None or row[0] != boot
+                if primero:
+                    with self.db.transaction() as conn:
+                        for tabla in ("meta", "counters", "gemini_keys", "cache"):
+                            conn.execute(f"DELETE FROM {tabla}")
+                        conn.executemany(
+                            "INSERT INTO meta (key, value) VALUES (?, ?)",
+                            [("boot", boot), ("started_at", str(time.time()))],
+                        )
+                row = self.db.query_one("SELECT value FROM meta WHERE key = 'started_at'")
+                self.started_at = float(row[0])
+                self.refresh_keys()
+                yield primero
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # --- Contadores: se acumulan en memoria y se vuelcan cada SHARED_COUNTERS_FLUSH_INTERVAL ---
+
+    def incr(self, name: str, amount: float = 1):
+        with self._lock:
+            self._pending[name] = self._pending.get(name, 0) + amount
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            keys, self._pending_keys = self._pending_keys, {}
+            self._keys.update(keys)
+        if pending or keys:
+            with self.db.transaction() as conn:
+                conn.executemany(UPSERT_COUNTER, list(pending.items()))
+                conn.executemany(UPSERT_KEY, [(label, c, int(d), n) for label, (c, d, n) in keys.items()])
+
+    def counters(self) -> Dict[str, float]:
+        """Totales de todos los workers (incluye lo que este todavía no volcó)."""
+        totals = {row[0]: row[1] for row in self.db.query("SELECT name, value FROM counters")}
+        with self._lock:
+            for name, amount in self._pending.items():
+                totals[name] = totals.get(name, 0) + amount
+        return totals
+
+    def sync(self):
+        """Vuelca lo pendiente y trae el estado de claves que publicaron los demás workers."""
+        self.flush()
+        self.refresh_keys()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(SHARED_COUNTERS_FLUSH_INTERVAL)
+            try:
+                await asyncio.to_thread(self.sync)
+            except Exception as e:
+                log.warning("⚠️ Error sincronizando el estado compartido: %s", e)
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.flush()
+
+    # --- Claves Gemini: enfriamientos y bajas visibles para todos los workers ---
+
+    def refresh_keys(self):
+        rows = self.db.query("SELECT label, cooldown_until, dead, consecutive_429 FROM gemini_keys")
+        keys = {row[0]: (row[1], bool(row[2]), row[3]) for row in rows}
+        with self._lock:
+            self._keys = keys
+
+    def load_keys(self) -> Dict[str, tuple]:
+        """Estado de las claves según la última sincronización, más lo que este worker todavía no volcó.
+
+        No toca SQLite: la tarea en segundo plano (sync) relee la tabla cada SHARED_COUNTERS_FLUSH_INTERVAL.
+        """
+        with self._lock:
+            keys = dict(self._keys)
+            keys.update(self._pending_keys)
+        return keys
+
+    def save_key(self, label: str, cooldown_until: float, dead: bool, consecutive_429: int):
+        """Se publica en el próximo flush, como los contadores: quien llama no espera a SQLite."""
+        with self._lock:
+            self._pending_keys[label] = (cooldown_until, dead, consecutive_429)
+
+    def cache(self, namespace: str, ttl: float, max_entries: int, max_bytes: Optional[int] = None) -> SharedCache:
+        return SharedCache(self, namespace, ttl, max_entries, max_bytes)
+
+
+shared_state = SharedState(SHARED_STATE_PATH, SHARED_STATE_ENABLED)
@@ -0,0 +1,18 @@
+"""Configuración común de los tests: bases y store en un directorio temporal, motor columnar activo.
+
+Las variables se fijan antes de importar config.py (que las lee al importarse).
+"""
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="dante-tests-")
+os.environ.setdefault("GEMINI_API_KEYS", "k1,k2,k3")
+os.environ.setdefault("PROPERTY_ENGINE", "numpy")
+os.environ.setdefault("SHARED_STATE", "0")
+os.environ.setdefault("PROPERTIES_DB_PATH", os.path.join(_TMP, "propiedades.db"))
+os.environ.setdefault("LOGS_DB_PATH", os.path.join(_TMP, "conversaciones.db"))
+os.environ.setdefault("SHARED_STATE_PATH", os.path.join(_TMP, "estado.db"))
+os.environ.setdefault("CATALOG_PATH", os.path.join(_TMP, "properties.json"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
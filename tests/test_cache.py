@@ -0,0 +1,63 @@
+"""TTLCache (TTL + LRU + límite en bytes) y claves del cache de respuestas."""
+import time
+
+from cache import TTLCache, estimate_size, response_cache_key
+
+
+def test_lru_desaloja_la_usada_hace_mas_tiempo():
+    cache = TTLCache(ttl=60, max_bytes=10_000, max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_limite_en_bytes():
+    cache = TTLCache(ttl=60, max_bytes=100, max_entries=100)
+    for i in range(5):
+        cache.set(f"k{i}", "x" * 30)
+    assert cache.stats()["bytes"] <= 100
+    assert len(cache) == 3
+    assert cache.get("k0") is None and cache.get("k4") is not None
+    # Un valor más grande que todo el cache no se guarda (ni desaloja a los demás)
+    cache.set("grande", "y" * 101)
+    assert cache.get("grande") is None
+    assert len(cache) == 3
+
+
+def test_reemplazar_una_clave_descuenta_su_tamano():
+    cache = TTLCache(ttl=60, max_bytes=1000)
+    cache.set("a", "x" * 100)
+    cache.set("a", "x" * 10)
+    assert cache.stats()["bytes"] == estimate_size("x" * 10)
+
+
+def test_entrada_vencida_cuenta_como_fallo(monkeypatch):
+    cache = TTLCache(ttl=10, max_bytes=1000)
+    cache.set("a", "1")
+    cache.set("b", "2", ttl=100)
+    ahora = time.time()
+    monkeypatch.setattr(time, "time", lambda: ahora + 20)
+    assert cache.get("a", "default") == "default"
+    assert cache.get("b") == "2"
+    stats = cache.stats()
+    assert (stats["expirations"], stats["misses"], stats["hits"]) == (1, 1, 1)
+    assert stats["bytes"] == estimate_size("2")
+
+
+def test_clear_vacia_y_cambia_la_generacion():
+    cache = TTLCache(ttl=60, max_bytes=1000)
+    cache.set("a", "1")
+    cache.clear()
+    assert len(cache) == 0 and cache.stats()["bytes"] == 0
+    assert cache.generation == 1
+
+
+def test_clave_de_respuesta_por_intencion_normalizada():
+    base = response_cache_key("resultados", "web", {"neighborhood": "Palermo", "max_price": 280000.0}, [3, 1])
+    assert base == response_cache_key("resultados", "web", {"max_price": 280000, "neighborhood": " palermo "}, ["3", "1"])
+    assert base != response_cache_key("resultados", "whatsapp", {"neighborhood": "palermo", "max_price": 280000}, [3, 1])
+    assert base != response_cache_key("resultados", "web", {"neighborhood": "palermo", "max_price": 280000}, [3, 1], version=2)
@@ -0,0 +1,98 @@
+"""SingleFlight: pedidos simultáneos con el mismo prompt comparten una sola llamada a Gemini."""
+import asyncio
+
+import pytest
+
+from gemini.coalesce import SingleFlight
+
+
+def test_call_agrupa_pedidos_simultaneos():
+    async def escenario():
+        flight, llamadas = SingleFlight(True), []
+
+        async def llamar(prompt):
+            llamadas.append(prompt)
+            await asyncio.sleep(0.01)
+            return "respuesta"
+
+        respuestas = await asyncio.gather(*(flight.call("p", llamar) for _ in range(20)))
+        return flight, llamadas, respuestas
+
+    flight, llamadas, respuestas = asyncio.run(escenario())
+    assert llamadas == ["p"]
+    assert respuestas == ["respuesta"] * 20
+    assert flight.stats()["coalesced"] == 19
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_stream_entrega_todos_los_fragmentos_a_cada_pedido():
+    async def escenario():
+        flight, llamadas = SingleFlight(True), []
+
+        async def llamar(prompt):
+            llamadas.append(prompt)
+            for parte in ("ho", "la"):
+                await asyncio.sleep(0.01)
+                yield parte
+
+        async def consumir():
+            return [parte async for parte in flight.stream("p", llamar)]
+
+        return llamadas, await asyncio.gather(*(consumir() for _ in range(5)))
+
+    llamadas, resultados = asyncio.run(escenario())
+    assert llamadas == ["p"]
+    assert resultados == [["ho", "la"]] * 5
+
+
+def test_error_llega_a_todos_y_el_siguiente_vuelve_a_llamar():
+    async def escenario():
+        flight, llamadas = SingleFlight(True), []
+
+        async def llamar(prompt):
+            llamadas.append(prompt)
+            await asyncio.sleep(0.01)
+            if len(llamadas) == 1:
+                raise ValueError("falla")
+            return "ok"
+
+        errores = await asyncio.gather(*(flight.call("p", llamar) for _ in range(3)), return_exceptions=True)
+        return llamadas, errores, await flight.call("p", llamar)
+
+    llamadas, errores, despues = asyncio.run(escenario())
+    assert all(isinstance(e, ValueError) for e in errores)
+    assert despues == "ok"
+    assert len(llamadas) == 2
+
+
+def test_cancelar_un_pedido_no_corta_a_los_demas():
+    async def escenario():
+        flight = SingleFlight(True)
+
+        async def llamar(prompt):
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        primero = asyncio.ensure_future(flight.call("p", llamar))
+        segundo = asyncio.ensure_future(flight.call("p", llamar))
+        await asyncio.sleep(0.01)
+        primero.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await primero
+        return await segundo
+
+    assert asyncio.run(escenario()) == "ok"
+
+
+def test_deshabilitado_llama_cada_vez():
+    async def escenario():
+        flight, llamadas = SingleFlight(False), []
+
+        async def llamar(prompt):
+            llamadas.append(prompt)
+            return "ok"
+
+        await asyncio.gather(*(flight.call("p", llamar) for _ in range(4)))
+        return llamadas
+
+    assert len(asyncio.run(escenario())) == 4
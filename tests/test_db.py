@@ -0,0 +1,37 @@
+"""SQLitePool: transacciones por hilo que nunca quedan abiertas."""
+import sqlite3
+
+import pytest
+
+from db import SQLitePool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SQLitePool(str(tmp_path / "test.db"))
+    pool.execute("CREATE TABLE t (x INTEGER)")
+    yield pool
+    pool.close_all()
+
+
+def test_excepcion_en_el_cuerpo_hace_rollback(pool):
+    with pytest.raises(RuntimeError):
+        with pool.transaction() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            raise RuntimeError("falla")
+    assert pool.query_one("SELECT COUNT(*) FROM t")[0] == 0
+    assert not pool.connection().in_transaction
+
+
+def test_commit_fallido_no_deja_la_transaccion_abierta(pool):
+    # Con la FK diferida, la violación recién se detecta en el COMMIT
+    pool.execute("PRAGMA foreign_keys = ON")
+    pool.execute("CREATE TABLE padre (id INTEGER PRIMARY KEY)")
+    pool.execute("CREATE TABLE hijo (padre_id INTEGER REFERENCES padre (id) DEFERRABLE INITIALLY DEFERRED)")
+    with pytest.raises(sqlite3.IntegrityError):
+        with pool.transaction() as conn:
+            conn.execute("INSERT INTO hijo VALUES (99)")
+    assert not pool.connection().in_transaction
+    with pool.transaction() as conn:
+        conn.execute("INSERT INTO t VALUES (1)")
+    assert pool.query_one("SELECT COUNT(*) FROM t")[0] == 1
@@ -0,0 +1,27 @@
+"""Filtros de precio del extractor: cada tramo del mensaje cuenta para un solo extremo."""
+import pytest
+
+from extractor import FilterExtractor
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return FilterExtractor.desde_catalogo([], [], [])
+
+
+def test_desde_pesos_es_solo_minimo(extractor):
+    assert extractor.extraer("desde 100000 pesos").as_dict() == {"min_price": 100000}
+
+
+def test_precio_desde_es_solo_minimo(extractor):
+    assert extractor.extraer("precio desde 100000").as_dict() == {"min_price": 100000}
+
+
+@pytest.mark.parametrize("mensaje, esperado", [
+    ("hasta $280.000", {"max_price": 280000}),
+    ("280000 pesos", {"max_price": 280000}),
+    ("desde 100000 hasta 200000", {"min_price": 100000, "max_price": 200000}),
+    ("casa de 3 ambientes de 150000", {"tipo": "casa", "max_price": 150000, "min_rooms": 3}),
+])
+def test_rangos_de_precio(extractor, mensaje, esperado):
+    assert extractor.extraer(mensaje).as_dict() == esperado
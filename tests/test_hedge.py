@@ -0,0 +1,38 @@
+"""HedgePolicy: plazo según el percentil de latencias y tope de hedges por presupuesto."""
+from gemini.hedge import HedgePolicy
+
+
+def politica(**kwargs):
+    opciones = {"enabled": True, "percentile": 95, "min_delay": 0.5, "budget_percent": 10}
+    opciones.update(kwargs)
+    return HedgePolicy(**opciones)
+
+
+def test_presupuesto_acota_los_hedges():
+    policy = politica(budget_percent=10)
+    for _ in range(100):
+        policy.record_primary()
+    enviados = sum(policy.try_spend() for _ in range(50))
+    assert enviados == 10
+    assert policy.budget_denied == 40
+    assert policy.hedges_sent * 100 <= policy.primary_calls * policy.budget_percent
+
+
+def test_sin_llamadas_primarias_no_hay_hedge():
+    policy = politica()
+    assert not policy.try_spend()
+    assert policy.hedges_sent == 0
+
+
+def test_plazo_minimo_hasta_juntar_muestras():
+    policy = politica(min_delay=0.5)
+    for _ in range(HedgePolicy.MIN_SAMPLES - 1):
+        policy.observe(3.0)
+    assert policy.deadline() == 0.5
+
+
+def test_plazo_sigue_el_percentil():
+    policy = politica(percentile=90, min_delay=0.01)
+    for i in range(1, 101):
+        policy.observe(i / 100)
+    assert policy.deadline() == 0.91
@@ -0,0 +1,52 @@
+"""Historial por sesión: ring buffer en memoria y, con varios workers, en el store compartido."""
+import threading
+
+import pytest
+
+from db import logs_db
+from historial import HistorialSesiones
+from migrations import migrar, LOGS_MIGRATIONS
+from shared_state import SharedState
+
+
+@pytest.fixture(scope="module", autouse=True)
+def logs():
+    migrar(logs_db, LOGS_MIGRATIONS)
+
+
+def test_ring_buffer_se_queda_con_los_ultimos_turnos():
+    historial = HistorialSesiones(max_turnos=3, max_sesiones=10)
+    historial.turnos("s")
+    for i in range(5):
+        historial.agregar("s", f"m{i}", f"r{i}")
+    assert historial.mensajes("s", 10) == ["m2", "m3", "m4"]
+    assert historial.ultima_respuesta("s") == "r4"
+    assert historial.turnos(None) == []
+
+
+def test_descarta_la_sesion_usada_hace_mas_tiempo():
+    historial = HistorialSesiones(max_turnos=3, max_sesiones=2)
+    for sesion in ("a", "b", "c"):
+        historial.turnos(sesion)
+    assert historial.stats()["sessions"] == 2
+    assert historial.stats()["evictions"] == 1
+
+
+def test_compartido_no_pierde_turnos_concurrentes(tmp_path):
+    path = str(tmp_path / "estado.db")
+    with SharedState(path, True).arranque():
+        pass
+    # Un historial por "worker", cada uno con su propio store sobre el mismo archivo
+    workers = [HistorialSesiones(200, 10, SharedState(path, True)) for _ in range(4)]
+    workers[0].turnos("s")
+
+    def conversar(historial, n):
+        for i in range(25):
+            historial.agregar("s", f"{n}-{i}", "r")
+
+    hilos = [threading.Thread(target=conversar, args=(h, n)) for n, h in enumerate(workers)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert len(workers[1].turnos("s")) == 100
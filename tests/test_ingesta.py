@@ -0,0 +1,74 @@
+"""Sincronización incremental del catálogo: sólo se escribe lo que cambió, por huella de cada fila."""
+import pytest
+
+import ingesta
+from db import SQLitePool
+from ingesta import ingestar, version_catalogo
+from migrations import migrar, PROPERTIES_MIGRATIONS
+
+
+@pytest.fixture(autouse=True)
+def properties(tmp_path, monkeypatch):
+    pool = SQLitePool(str(tmp_path / "propiedades.db"))
+    migrar(pool, PROPERTIES_MIGRATIONS)
+    monkeypatch.setattr(ingesta, "properties_db", pool)
+    yield pool
+    pool.close_all()
+
+
+def catalogo(precio_2=200000):
+    return [
+        {"id": 1, "title": "Depto Palermo", "neighborhood": "Palermo", "price": 100000},
+        {"id": 2, "title": "Casa Belgrano", "neighborhood": "Belgrano", "price": precio_2},
+        {"title": "PH sin id", "neighborhood": "Almagro", "price": 90000},
+    ]
+
+
+def test_primera_carga_inserta_todo(properties):
+    resultado = ingestar(catalogo(), content_hash="h1")
+    assert (resultado.insertadas, resultado.actualizadas, resultado.borradas) == (3, 0, 0)
+    assert version_catalogo() == 1
+    assert properties.query_one("SELECT COUNT(*) FROM properties WHERE id LIKE 'prop_%'")[0] == 1
+    assert ingesta.hash_cargado() == "h1"
+
+
+def test_sin_cambios_no_escribe_ni_sube_la_version():
+    ingestar(catalogo())
+    resultado = ingestar(catalogo())
+    assert resultado.sin_cambios == 3
+    assert resultado.cambios == 0
+    assert version_catalogo() == 1
+
+
+def test_solo_actualiza_la_fila_modificada(properties):
+    ingestar(catalogo())
+    resultado = ingestar(catalogo(precio_2=250000))
+    assert (resultado.actualizadas, resultado.sin_cambios) == (1, 2)
+    assert properties.query_one("SELECT price FROM properties WHERE id = '2'")[0] == 250000
+    assert version_catalogo() == 2
+
+
+def test_borra_las_que_ya_no_vienen(properties):
+    ingestar(catalogo())
+    resultado = ingestar(catalogo()[:1])
+    assert resultado.borradas == 2
+    assert [row[0] for row in properties.query("SELECT id FROM properties")] == ["1"]
+
+
+def test_filas_invalidas_se_informan_sin_frenar_la_carga():
+    resultado = ingestar(catalogo() + [{"id": 9, "price": 1}, "no es un objeto"])
+    assert resultado.insertadas == 3
+    assert resultado.errores == 2
+
+
+def test_error_de_lectura_deshace_toda_la_sincronizacion(properties):
+    ingestar(catalogo())
+
+    def cortado():
+        yield from catalogo(precio_2=1)
+        raise ValueError("archivo cortado")
+
+    resultado = ingestar(cortado())
+    assert resultado.fatal is not None
+    assert properties.query_one("SELECT price FROM properties WHERE id = '2'")[0] == 200000
+    assert version_catalogo() == 1
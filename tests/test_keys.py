@@ -0,0 +1,80 @@
+"""KeyScheduler: reparto entre claves sanas, enfriamiento por 429 y baja por 401/403."""
+import time
+
+from config import GEMINI_COOLDOWN_SECONDS
+from gemini.keys import KeyScheduler
+from shared_state import SharedState
+
+
+def test_reparte_por_carga_y_round_robin():
+    scheduler = KeyScheduler(["a", "b", "c"])
+    elegidas = [scheduler.acquire() for _ in range(3)]
+    assert [s.key for s in elegidas] == ["a", "b", "c"]
+    for state in elegidas:
+        scheduler.release_success(state, 0.1)
+    assert scheduler.acquire().key == "a"
+
+
+def test_429_enfria_la_clave_con_backoff_exponencial():
+    scheduler = KeyScheduler(["a", "b"])
+    state = scheduler.acquire()
+    scheduler.release_failure(state, 429)
+    assert not state.available(time.time())
+    assert scheduler.healthy_count() == 1
+    assert scheduler.acquire().key == "b"
+
+    primero = state.cooldown_until
+    state.cooldown_until = 0
+    scheduler.release_failure(scheduler.acquire(exclude=[scheduler.keys[1]]), 429)
+    assert state.cooldown_until - time.time() > GEMINI_COOLDOWN_SECONDS * 1.5
+    assert state.cooldown_until > primero
+
+
+def test_retry_after_manda_sobre_el_backoff():
+    scheduler = KeyScheduler(["a"])
+    state = scheduler.acquire()
+    scheduler.release_failure(state, 429, retry_after=2)
+    assert 0 < state.cooldown_until - time.time() <= 2
+
+
+def test_exito_despues_de_429_resetea_el_backoff():
+    scheduler = KeyScheduler(["a"])
+    state = scheduler.acquire()
+    scheduler.release_failure(state, 429)
+    state.cooldown_until = 0
+    scheduler.release_success(scheduler.acquire(), 0.1)
+    assert state.consecutive_429 == 0
+
+
+def test_401_y_403_dan_de_baja_la_clave():
+    scheduler = KeyScheduler(["a", "b"])
+    scheduler.release_failure(scheduler.acquire(), 401)
+    scheduler.discard(scheduler.keys[1], 403)
+    assert scheduler.healthy_count() == 0
+    assert scheduler.acquire() is None
+    assert scheduler.stats()["key_1"]["state"] == "dead"
+
+
+def test_sin_candidatas_fuera_de_exclude():
+    scheduler = KeyScheduler(["a", "b"])
+    primera = scheduler.acquire()
+    segunda = scheduler.acquire(exclude=[primera])
+    assert segunda.key == "b"
+    assert scheduler.acquire(exclude=[primera, segunda]) is None
+
+
+def test_compartido_se_ve_en_otro_worker_despues_de_sincronizar(tmp_path):
+    path = str(tmp_path / "estado.db")
+    store_a, store_b = SharedState(path, True), SharedState(path, True)
+    with store_a.arranque():
+        pass
+    with store_b.arranque():
+        pass
+    worker_a, worker_b = KeyScheduler(["a", "b"], store_a), KeyScheduler(["a", "b"], store_b)
+
+    worker_a.release_failure(worker_a.acquire(), 429)
+    assert worker_a.healthy_count() == 1
+    assert worker_b.healthy_count() == 2  # todavía no se volcó ni se releyó
+    store_a.sync()
+    store_b.sync()
+    assert worker_b.healthy_count() == 1
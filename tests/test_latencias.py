@@ -0,0 +1,64 @@
+"""Histogramas por etapa: buckets, percentiles, export de Prometheus y suma entre workers."""
+import pytest
+
+from latencias import Cronometro, Histogramas, canal_etiqueta
+from shared_state import SharedState
+
+BUCKETS = (0.1, 0.5, 1.0)
+
+
+def test_observe_cuenta_por_bucket_y_suma():
+    hist = Histogramas(BUCKETS)
+    for segundos in (0.05, 0.1, 0.3, 2.0):
+        hist.observe("x", segundos, stage="db")
+    (clave, serie), = hist.series().items()
+    assert clave == ("x", (("stage", "db"),))
+    # el límite es inclusivo (le): 0.1 cae en el primer bucket; 2.0 en +Inf
+    assert serie == [2, 1, 0, 1, pytest.approx(2.45)]
+
+
+def test_percentil_interpola_dentro_del_bucket():
+    hist = Histogramas(BUCKETS)
+    for _ in range(10):
+        hist.observe("x", 0.2)
+    serie = hist.series()[("x", ())]
+    assert hist.percentil(serie, 50) == pytest.approx(0.3)
+    assert hist.percentil([0, 0, 0, 0, 0], 99) == 0.0
+
+
+def test_prometheus_buckets_acumulados():
+    hist = Histogramas(BUCKETS)
+    hist.observe("chat_stage_seconds", 0.05, stage="db")
+    hist.observe("chat_stage_seconds", 0.7, stage="db")
+    texto = hist.prometheus(ayudas={"chat_stage_seconds": "Etapas"})
+    assert "# HELP dante_chat_stage_seconds Etapas" in texto
+    assert "# TYPE dante_chat_stage_seconds histogram" in texto
+    assert 'dante_chat_stage_seconds_bucket{stage="db",le="0.1"} 1' in texto
+    assert 'dante_chat_stage_seconds_bucket{stage="db",le="1"} 2' in texto
+    assert 'dante_chat_stage_seconds_bucket{stage="db",le="+Inf"} 2' in texto
+    assert 'dante_chat_stage_seconds_count{stage="db"} 2' in texto
+
+
+def test_cronometro_registra_cada_etapa_y_el_total():
+    hist = Histogramas(BUCKETS)
+    cronometro = Cronometro()
+    with cronometro.etapa("db_query"):
+        pass
+    cronometro.sumar("gemini", 0.7)
+    cronometro.registrar(hist, endpoint="chat", channel=canal_etiqueta("Telegram"))
+    etapas = {dict(etiquetas)["stage"] for _, etiquetas in hist.series()}
+    assert etapas == {"db_query", "gemini", "total"}
+    assert canal_etiqueta("sms") == "otro"
+
+
+def test_con_store_suma_los_workers(tmp_path):
+    path = str(tmp_path / "estado.db")
+    stores = [SharedState(path, True), SharedState(path, True)]
+    for store in stores:
+        with store.arranque():
+            pass
+        Histogramas(BUCKETS, store).observe("x", 0.2, stage="db")
+        store.flush()
+    serie = Histogramas(BUCKETS, stores[0]).series()[("x", (("stage", "db"),))]
+    assert serie[:-1] == [0, 2, 0, 0]
+    assert serie[-1] == pytest.approx(0.4)
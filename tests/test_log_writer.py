@@ -0,0 +1,73 @@
+"""LogWriter: lotes en segundo plano y reintento cuando la base de logs está bloqueada."""
+import asyncio
+import sqlite3
+
+import pytest
+
+import log_writer as modulo
+from db import logs_db
+from log_writer import LogWriter
+from migrations import migrar, LOGS_MIGRATIONS
+
+REGISTRO = ("2026-01-01T00:00:00", "web", "hola", "respuesta", 0.1, False, 0, "s1")
+
+
+@pytest.fixture(autouse=True)
+def logs(monkeypatch):
+    migrar(logs_db, LOGS_MIGRATIONS)
+    logs_db.execute("DELETE FROM logs")
+    monkeypatch.setattr(modulo.time, "sleep", lambda segundos: None)
+
+
+def contar() -> int:
+    return logs_db.query_one("SELECT COUNT(*) FROM logs")[0]
+
+
+def bloquear(monkeypatch, veces: int, mensaje: str = "database is locked"):
+    """Las primeras `veces` transacciones fallan como si otro proceso tuviera el lock."""
+    original, fallas = logs_db.transaction, [veces]
+
+    def transaction():
+        if fallas[0] > 0:
+            fallas[0] -= 1
+            raise sqlite3.OperationalError(mensaje)
+        return original()
+
+    monkeypatch.setattr(logs_db, "transaction", transaction)
+
+
+def test_reintenta_el_lote_si_la_base_esta_bloqueada(monkeypatch):
+    bloquear(monkeypatch, 2)
+    writer = LogWriter(100, 10, 0.01, "drop", retries=5, backoff=0.1)
+    writer._write([REGISTRO] * 3)
+    assert contar() == 3
+    assert (writer.written, writer.retried, writer.lost) == (3, 2, 0)
+
+
+def test_agotados_los_reintentos_el_lote_se_pierde(monkeypatch):
+    bloquear(monkeypatch, 10, "database is busy")
+    writer = LogWriter(100, 10, 0.01, "drop", retries=2, backoff=0.1)
+    writer._write([REGISTRO] * 3)
+    assert contar() == 0
+    assert (writer.retried, writer.errors, writer.lost) == (2, 1, 3)
+
+
+def test_otros_errores_no_se_reintentan(monkeypatch):
+    bloquear(monkeypatch, 1, "no such table: logs")
+    writer = LogWriter(100, 10, 0.01, "drop", retries=5, backoff=0.1)
+    writer._write([REGISTRO])
+    assert (writer.retried, writer.lost) == (0, 1)
+
+
+def test_cola_en_segundo_plano_y_politica_drop():
+    async def escenario():
+        writer = LogWriter(max_queue=2, batch_size=10, flush_interval=0.01, policy="drop")
+        await writer.start()
+        aceptados = [await writer.submit(REGISTRO) for _ in range(3)]
+        await writer.stop()
+        return writer, aceptados
+
+    writer, aceptados = asyncio.run(escenario())
+    assert aceptados == [True, True, False]
+    assert (writer.written, writer.dropped) == (2, 1)
+    assert contar() == 2
@@ -0,0 +1,66 @@
+"""Migraciones con PRAGMA user_version: cada versión corre una vez y en una sola transacción."""
+import sqlite3
+
+import pytest
+
+from db import SQLitePool
+from migrations import migrar, LOGS_MIGRATIONS, PROPERTIES_MIGRATIONS
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SQLitePool(str(tmp_path / "test.db"))
+    yield pool
+    pool.close_all()
+
+
+def version(pool) -> int:
+    return pool.query_one("PRAGMA user_version")[0]
+
+
+def columnas(pool, tabla: str):
+    return {row["name"] for row in pool.query(f"PRAGMA table_info({tabla})")}
+
+
+def test_logs_de_una_base_vieja_conservan_las_filas(pool):
+    # Base de antes de las migraciones: la tabla logs sin session_id y user_version 0
+    pool.execute(LOGS_MIGRATIONS[0][0])
+    pool.execute("INSERT INTO logs (timestamp, channel, user_message) VALUES ('2025-01-01', 'web', 'hola')")
+
+    assert migrar(pool, LOGS_MIGRATIONS) == len(LOGS_MIGRATIONS)
+    assert version(pool) == len(LOGS_MIGRATIONS)
+    assert "session_id" in columnas(pool, "logs")
+    assert tuple(pool.query_one("SELECT user_message, session_id FROM logs")) == ("hola", None)
+
+
+def test_properties_desde_v2_agrega_row_hash_y_fuerza_recarga(pool):
+    for sentencias in PROPERTIES_MIGRATIONS[:2]:
+        for sentencia in sentencias:
+            pool.execute(sentencia)
+    pool.execute("PRAGMA user_version = 2")
+    pool.execute("INSERT INTO meta (key, value) VALUES ('catalog_hash', 'abc')")
+    pool.execute("INSERT INTO properties (id, title) VALUES ('1', 'Depto')")
+
+    migrar(pool, PROPERTIES_MIGRATIONS)
+    assert "row_hash" in columnas(pool, "properties")
+    assert pool.query_one("SELECT value FROM meta WHERE key = 'catalog_hash'") is None
+    assert pool.query_one("SELECT title FROM properties WHERE id = '1'")[0] == "Depto"
+
+
+def test_migrar_dos_veces_no_hace_nada(pool):
+    migrar(pool, LOGS_MIGRATIONS)
+    pool.execute("INSERT INTO logs (user_message) VALUES ('hola')")
+    assert migrar(pool, LOGS_MIGRATIONS) == len(LOGS_MIGRATIONS)
+    assert pool.query_one("SELECT COUNT(*) FROM logs")[0] == 1
+
+
+def test_una_version_que_falla_se_deshace_entera(pool):
+    migraciones = [
+        ["CREATE TABLE a (x INTEGER)"],
+        ["CREATE TABLE b (x INTEGER)", "ALTER TABLE no_existe ADD COLUMN y TEXT"],
+    ]
+    with pytest.raises(sqlite3.OperationalError):
+        migrar(pool, migraciones)
+    assert version(pool) == 1
+    assert pool.query_one("SELECT name FROM sqlite_master WHERE name = 'b'") is None
+    assert not pool.connection().in_transaction
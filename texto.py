@@ -0,0 +1,11 @@
+"""Normalización de texto compartida por el catálogo, la base de datos y la detección de filtros."""
+import unicodedata
+
+
+def normalizar(texto) -> str:
+    """Minúsculas, sin acentos y con espacios colapsados: 'Núñez  ' -> 'nunez'."""
+    if texto is None:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", str(texto))
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_acentos.lower().split())